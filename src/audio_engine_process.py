@@ -0,0 +1,438 @@
+import multiprocessing
+import threading
+import time
+from typing import Callable, Dict, Any, FrozenSet, Optional, Tuple
+
+import numpy as np
+
+from shared_ring_buffer import SharedAudioRingBuffer
+
+
+def reinitialize_portaudio(sd_module) -> bool:
+    """重新初始化PortAudio以刷新设备列表，调用时当前进程中不能有打开的流
+
+    PortAudio只在初始化时枚举设备，sounddevice没有公开的重新枚举接口，只能重新初始化模块级的
+    PortAudio会话。所有调用都集中在这里；接口不存在时返回False，调用方保持现有设备列表。
+    """
+    terminate = getattr(sd_module, '_terminate', None)
+    initialize = getattr(sd_module, '_initialize', None)
+    if terminate is None or initialize is None:
+        return False
+    terminate()
+    initialize()
+    return True
+
+
+def device_set_from(devices, hostapis) -> FrozenSet[Tuple[str, str, str]]:
+    """由query_devices/query_hostapis的结果得到设备集合：(方向, 设备名称, host API名称)"""
+    hostapi_names = [hostapi['name'] for hostapi in hostapis]
+    device_set = set()
+    for device in devices:
+        hostapi_name = hostapi_names[device['hostapi']]
+        if device['max_input_channels'] > 0:
+            device_set.add(('input', device['name'], hostapi_name))
+        if device['max_output_channels'] > 0:
+            device_set.add(('output', device['name'], hostapi_name))
+    return frozenset(device_set)
+
+
+def _device_probe_main(conn):
+    """设备探测子进程入口：新初始化的PortAudio枚举当前的设备集合后退出"""
+    try:
+        import sounddevice as sd
+        conn.send(('ok', device_set_from(sd.query_devices(), sd.query_hostapis())))
+    except Exception as e:
+        conn.send(('error', str(e)))
+    finally:
+        conn.close()
+
+
+def probe_device_set(timeout: float) -> FrozenSet[Tuple[str, str, str]]:
+    """在短生命周期的子进程中枚举设备（会阻塞，应在事件循环之外调用）
+
+    本进程有流打开时不能重新初始化PortAudio，子进程中的PortAudio是全新初始化的，
+    能看到热插拔后的设备集合，本进程的流不受影响。
+    """
+    context = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = context.Pipe()
+    process = context.Process(target=_device_probe_main, args=(child_conn,), name="audio-device-probe", daemon=True)
+    process.start()
+    child_conn.close()
+    try:
+        if not parent_conn.poll(timeout):
+            raise TimeoutError("Audio device probe did not answer")
+        status, reply = parent_conn.recv()
+        if status == 'error':
+            raise RuntimeError(reply)
+        return reply
+    finally:
+        parent_conn.close()
+        process.join(timeout=1.0)
+        if process.is_alive():
+            process.terminate()
+
+
+def _engine_process_main(conn, capture_ring_name: str, playback_ring_name: str, capacity: int):
+    """音频引擎子进程入口
+
+    子进程只打开PortAudio设备：采集回调把样本写入共享采集缓冲区，播放回调从共享播放缓冲区读取。
+    回调中不做任何其他工作，也不与主进程的UI和网络代码争用GIL。控制命令通过Pipe收发。
+    """
+    import sounddevice as sd
+
+    capture_ring = SharedAudioRingBuffer.attach(capture_ring_name, capacity)
+    playback_ring = SharedAudioRingBuffer.attach(playback_ring_name, capacity)
+    streams: Dict[str, Any] = {}
+
+    def capture_callback(indata, frames, time_info, status):
+        if status:
+            capture_ring.mark_producer_xrun()
+        capture_ring.write(indata[:, 0])
+
+    def playback_callback(outdata, frames, time_info, status):
+        if status:
+            playback_ring.mark_consumer_xrun()
+        count = playback_ring.read_into(outdata[:, 0])
+        if count < frames:
+            outdata[count:].fill(0)
+
+    def close_stream(kind: str):
+        stream = streams.pop(kind, None)
+        if stream is not None:
+            try:
+                stream.stop()
+            finally:
+                stream.close()
+
+    while True:
+        try:
+            command, kwargs = conn.recv()
+        except (EOFError, OSError):
+            break  # 主进程已退出
+
+        try:
+            if command == 'open':
+                kind = kwargs.pop('kind')
+                close_stream(kind)
+                if kind == 'input':
+                    stream = sd.InputStream(callback=capture_callback, **kwargs)
+                else:
+                    stream = sd.OutputStream(callback=playback_callback, **kwargs)
+                try:
+                    stream.start()
+                except Exception:
+                    stream.close()
+                    raise
+                streams[kind] = stream
+                reply = {'latency': float(stream.latency)}
+            elif command == 'close':
+                close_stream(kwargs['kind'])
+                reply = {}
+            elif command == 'rescan':
+                # 主进程重新枚举了设备，子进程也要刷新，两边的设备索引才一致
+                reply = {'rescanned': not streams and reinitialize_portaudio(sd)}
+            elif command == 'shutdown':
+                for kind in list(streams):
+                    close_stream(kind)
+                conn.send(('ok', {}))
+                break
+            else:  # ping
+                reply = {'active': {kind: bool(stream.active) for kind, stream in streams.items()}}
+            conn.send(('ok', reply))
+        except Exception as e:
+            conn.send(('error', str(e)))
+
+    for kind in list(streams):
+        try:
+            close_stream(kind)
+        except Exception:
+            pass
+    capture_ring.close()
+    playback_ring.close()
+
+
+class RemoteAudioStream:
+    """子进程中的音频流在主进程的代理
+
+    提供与 sounddevice 流相同的 start/stop/close/active/latency 接口，AudioManager 的流状态机、
+    健康检查和故障转移无需区分两种模式。主进程中的泵线程以固定块大小调用原来的回调：
+    采集时从共享缓冲区取出整块交给回调，播放时让回调生成输出块并把共享缓冲区保持在目标水位。
+    子进程报告的设备状态异常和欠载会作为回调的status传入，健康检查照常统计xrun。
+    """
+
+    def __init__(self, engine: "AudioEngineProcess", kind: str, callback: Callable, stream_kwargs: Dict[str, Any]):
+        self._engine = engine
+        self._kind = kind
+        self._callback = callback
+        self._stream_kwargs = stream_kwargs
+        samplerate = stream_kwargs.get('samplerate') or engine.samplerate
+        self.samplerate = samplerate
+        self.blocksize = stream_kwargs.get('blocksize') or int(samplerate * 0.02)
+        self.latency = 0.0
+        self._last_playback_xruns = 0
+        self._stop_event = threading.Event()
+        self._pump_thread: Optional[threading.Thread] = None
+
+    @property
+    def active(self) -> bool:
+        return (self._pump_thread is not None and self._pump_thread.is_alive()
+                and self._engine.is_alive)
+
+    def start(self):
+        self._stop_event.clear()
+        ring = self._engine.capture_ring if self._kind == 'input' else self._engine.playback_ring
+        # 子进程中这一路的流尚未打开，可以安全地从任一端清空
+        ring.clear()
+        if self._kind == 'input':
+            pump = self._capture_pump
+        else:
+            pump = self._playback_pump
+            self._last_playback_xruns = ring.consumer_xruns + ring.underruns
+            self._fill_playback(ring, None)  # 先填到目标水位，避免刚打开时欠载
+        reply = self._engine.request('open', kind=self._kind, **self._stream_kwargs)
+        buffered = self._engine.PLAYBACK_TARGET_BLOCKS if self._kind == 'output' else 1
+        self.latency = reply['latency'] + buffered * self.blocksize / self.samplerate
+        self._pump_thread = threading.Thread(target=pump, name=f"audio-engine-{self._kind}-pump", daemon=True)
+        self._pump_thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._pump_thread:
+            self._pump_thread.join()
+            self._pump_thread = None
+        if self._engine.is_alive:
+            self._engine.request('close', kind=self._kind)
+
+    def close(self):
+        pass
+
+    def _poll_interval(self) -> float:
+        return self.blocksize / self.samplerate / 4
+
+    def _capture_pump(self):
+        ring = self._engine.capture_ring
+        indata = np.zeros((self.blocksize, 1), dtype=np.float32)
+        last_xruns = ring.producer_xruns
+        while not self._stop_event.is_set():
+            while ring.available() >= self.blocksize:
+                ring.read_into(indata[:, 0])
+                xruns = ring.producer_xruns
+                status = "input overflow (audio engine process)" if xruns != last_xruns else None
+                last_xruns = xruns
+                try:
+                    self._callback(indata, self.blocksize, None, status)
+                except Exception as e:
+                    print(f"Audio engine capture pump error: {e}")
+            self._stop_event.wait(self._poll_interval())
+
+    def _fill_playback(self, ring: SharedAudioRingBuffer, outdata: Optional[np.ndarray]) -> np.ndarray:
+        if outdata is None:
+            outdata = np.zeros((self.blocksize, 1), dtype=np.float32)
+        target = self.blocksize * self._engine.PLAYBACK_TARGET_BLOCKS
+        while ring.available() + self.blocksize <= target:
+            xruns = ring.consumer_xruns + ring.underruns
+            status = "output underflow (audio engine process)" if xruns != self._last_playback_xruns else None
+            self._last_playback_xruns = xruns
+            try:
+                self._callback(outdata, self.blocksize, None, status)
+            except Exception as e:
+                print(f"Audio engine playback pump error: {e}")
+                outdata.fill(0)
+            ring.write(outdata[:, 0])
+        return outdata
+
+    def _playback_pump(self):
+        ring = self._engine.playback_ring
+        outdata = None
+        while not self._stop_event.is_set():
+            outdata = self._fill_playback(ring, outdata)
+            self._stop_event.wait(self._poll_interval())
+
+
+class AudioEngineProcess:
+    """在子进程中运行PortAudio设备回调的音频引擎
+
+    主进程中的Flet界面重建和Socket.IO处理会占用GIL，进程内的PortAudio回调因此可能错过截止时间。
+    启用后设备回调运行在独立进程中，音频通过 multiprocessing.shared_memory 环形缓冲区交换，
+    控制命令通过Pipe发送；主进程只在泵线程中以缓冲区水位为节奏处理音频，
+    偶尔的GIL争用只消耗缓冲余量，不会直接造成设备xrun。
+    子进程意外退出时，下一次打开流会自动重新启动子进程（由健康检查的故障转移触发）。
+    """
+
+    RING_SECONDS = 1.0
+    PLAYBACK_TARGET_BLOCKS = 3     # 播放共享缓冲区的目标水位（块数），即额外引入的播放延迟
+    REQUEST_TIMEOUT_SECONDS = 5.0
+
+    def __init__(self, samplerate: int):
+        self.samplerate = samplerate
+        self.capacity = int(samplerate * self.RING_SECONDS)
+        self.capture_ring: Optional[SharedAudioRingBuffer] = None
+        self.playback_ring: Optional[SharedAudioRingBuffer] = None
+        self._process = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self.restarts = 0
+
+    @property
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._process.pid if self._process is not None else None
+
+    def start(self):
+        """创建共享缓冲区并启动子进程（会阻塞，应在事件循环之外调用）"""
+        with self._lock:
+            self._spawn()
+
+    def _spawn(self):
+        if self.capture_ring is None:
+            self.capture_ring = SharedAudioRingBuffer.create(self.capacity)
+            self.playback_ring = SharedAudioRingBuffer.create(self.capacity)
+        context = multiprocessing.get_context('spawn')
+        parent_conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_engine_process_main,
+            args=(child_conn, self.capture_ring.name, self.playback_ring.name, self.capacity),
+            name="audio-engine-process",
+            daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+        self._exchange('ping', {})
+        print(f"Audio engine process started (pid {self._process.pid})")
+
+    def request(self, command: str, **kwargs) -> Dict[str, Any]:
+        """发送控制命令并等待回复（会阻塞，应在音频引擎线程中调用）"""
+        with self._lock:
+            if not self.is_alive and command != 'shutdown' and self._conn is not None:
+                print("Audio engine process is not running, restarting")
+                self.restarts += 1
+                self._conn.close()
+                self._conn = None
+                self._spawn()
+            return self._exchange(command, kwargs)
+
+    def _exchange(self, command: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        self._conn.send((command, kwargs))
+        if not self._conn.poll(self.REQUEST_TIMEOUT_SECONDS):
+            raise TimeoutError(f"Audio engine process did not answer '{command}'")
+        status, reply = self._conn.recv()
+        if status == 'error':
+            raise RuntimeError(reply)
+        return reply
+
+    # 与 sounddevice 相同的构造方式，AudioManager 按模式选择 sd 或本对象
+    def InputStream(self, callback: Callable, **kwargs) -> RemoteAudioStream:
+        return RemoteAudioStream(self, 'input', callback, kwargs)
+
+    def OutputStream(self, callback: Callable, **kwargs) -> RemoteAudioStream:
+        return RemoteAudioStream(self, 'output', callback, kwargs)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """子进程回调报告的xrun、欠载和共享缓冲区丢弃的样本数"""
+        if self.capture_ring is None:
+            return {}
+        return {
+            'pid': self.pid,
+            'alive': self.is_alive,
+            'restarts': self.restarts,
+            'capture_xruns': self.capture_ring.producer_xruns,
+            'capture_dropped_samples': self.capture_ring.dropped_samples,
+            'playback_xruns': self.playback_ring.consumer_xruns,
+            'playback_underruns': self.playback_ring.underruns,
+        }
+
+    def shutdown(self):
+        """关闭子进程并释放共享内存（会阻塞，应在事件循环之外调用）"""
+        if self._process is not None:
+            if self.is_alive:
+                try:
+                    self.request('shutdown')
+                except Exception as e:
+                    print(f"Audio engine process shutdown error: {e}")
+            self._process.join(timeout=2.0)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        for ring in (self.capture_ring, self.playback_ring):
+            if ring is not None:
+                ring.close()
+        self.capture_ring = None
+        self.playback_ring = None
+
+
+def run_ui_load_benchmark(seconds: float = 10.0, samplerate: int = 48000,
+                          controls_per_render: int = 50000) -> Dict[str, Dict[str, Any]]:
+    """在合成的UI负载下对比进程内回调与子进程回调的播放故障次数，返回 模式 -> 统计
+
+    负载线程模拟界面重建：反复构造和序列化大量控件字典，长时间持有GIL。
+    xruns是回调收到的异常状态次数，即听得到的断音次数：进程内为设备报告的xrun；子进程模式下
+    每次子进程设备回调报告xrun或共享缓冲区欠载（主进程泵线程没能及时补充）都会在下一次回调中体现。
+    子进程模式另外给出子进程设备回调自身的xrun（playback_xruns）和欠载读取次数（playback_underruns）。
+    用法：python src/audio_engine_process.py [秒数]
+    """
+    import json
+    import sounddevice as sd
+
+    blocksize = int(samplerate * 0.02)
+    phase = [0]
+
+    def render(outdata, frames, time_info, status):
+        # 与播放回调相当的少量Python和NumPy工作：生成一段低音量正弦波
+        t = (np.arange(frames) + phase[0]) / samplerate
+        outdata[:, 0] = 0.05 * np.sin(2 * np.pi * 440 * t)
+        phase[0] += frames
+
+    def ui_load(stop_event: threading.Event):
+        while not stop_event.is_set():
+            controls = [{'type': 'Text', 'value': f"message {i}", 'style': {'size': 14, 'color': '#333'}} for i in range(controls_per_render)]
+            json.dumps(controls)
+
+    def run(mode: str) -> Dict[str, int]:
+        counters = {'callbacks': 0, 'xruns': 0}
+
+        def callback(outdata, frames, time_info, status):
+            counters['callbacks'] += 1
+            if status:
+                counters['xruns'] += 1
+            render(outdata, frames, time_info, status)
+
+        engine = None
+        if mode == 'process':
+            engine = AudioEngineProcess(samplerate)
+            engine.start()
+            stream = engine.OutputStream(callback=callback, samplerate=samplerate, channels=1,
+                                         dtype='float32', blocksize=blocksize)
+        else:
+            stream = sd.OutputStream(callback=callback, samplerate=samplerate, channels=1,
+                                     dtype='float32', blocksize=blocksize)
+
+        stop_event = threading.Event()
+        load_threads = [threading.Thread(target=ui_load, args=(stop_event,), daemon=True) for _ in range(2)]
+        stream.start()
+        for thread in load_threads:
+            thread.start()
+        time.sleep(seconds)
+        stop_event.set()
+        for thread in load_threads:
+            thread.join()
+        stream.stop()
+        stream.close()
+        if engine is not None:
+            counters.update(engine.get_stats())
+            engine.shutdown()
+        return counters
+
+    return {mode: run(mode) for mode in ('in-process', 'process')}
+
+
+if __name__ == "__main__":
+    import sys
+    for benchmark_mode, benchmark_stats in run_ui_load_benchmark(float(sys.argv[1]) if len(sys.argv) > 1 else 10.0).items():
+        print(f"{benchmark_mode}: {benchmark_stats}")
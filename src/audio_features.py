@@ -0,0 +1,79 @@
+import math
+import numpy as np
+from typing import Optional, Dict, Any
+
+
+class AudioFeatureExtractor:
+    """采集块特征提取器
+
+    每个采集块只遍历一次样本，计算RMS、峰值和过零次数，
+    结果通过序列锁（seqlock）发布：写入方是音频回调线程，VAD、麦克风测试音量条、
+    本地说话卡片和诊断面板等读取方无需加锁，读到写入中途的数据时会自动重试。
+    """
+
+    _RMS = 0
+    _PEAK = 1
+    _ZERO_CROSSINGS = 2
+    _FRAMES = 3
+
+    SNAPSHOT_RETRIES = 4
+
+    def __init__(self, blocksize: int):
+        self._values = np.zeros(4, dtype=np.float64)
+        self._sequence = 0  # 奇数表示正在写入
+        self._allocate_scratch(blocksize)
+
+    def _allocate_scratch(self, blocksize: int):
+        """按块大小预分配中间缓冲区"""
+        self._blocksize = blocksize
+        self._sign_scratch = np.zeros(blocksize, dtype=bool)
+        self._crossing_scratch = np.zeros(max(blocksize - 1, 0), dtype=bool)
+
+    def process(self, indata: np.ndarray) -> float:
+        """处理一个采集块并发布特征，返回RMS供调用方直接使用"""
+        samples = indata[:, 0] if indata.ndim == 2 else indata  # 只分析第一个声道
+        frames = len(samples)
+        if frames == 0:
+            return 0.0
+        if frames != self._blocksize:
+            self._allocate_scratch(frames)  # 块大小变化（极少发生）时才重新分配
+
+        rms = math.sqrt(float(np.dot(samples, samples)) / frames)
+        peak = max(float(samples.max()), -float(samples.min()))
+
+        np.signbit(samples, out=self._sign_scratch)
+        np.not_equal(self._sign_scratch[1:], self._sign_scratch[:-1], out=self._crossing_scratch)
+        zero_crossings = int(np.count_nonzero(self._crossing_scratch))
+
+        self._sequence += 1
+        values = self._values
+        values[self._RMS] = rms
+        values[self._PEAK] = peak
+        values[self._ZERO_CROSSINGS] = zero_crossings
+        values[self._FRAMES] = frames
+        self._sequence += 1
+        return rms
+
+    def reset(self):
+        """清零已发布的特征（流停止时调用）"""
+        self._sequence += 1
+        self._values.fill(0)
+        self._sequence += 1
+
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """读取最近一个块的特征，连续读到写入中途的数据时返回None"""
+        for _ in range(self.SNAPSHOT_RETRIES):
+            sequence = self._sequence
+            if sequence & 1:
+                continue
+            rms, peak, zero_crossings, frames = self._values.tolist()
+            if self._sequence == sequence:
+                return {
+                    'rms': rms,
+                    'peak': peak,
+                    'zero_crossings': int(zero_crossings),
+                    'frames': int(frames),
+                    'sequence': sequence // 2,
+                }
+        return None
+
@@ -1,8 +1,21 @@
-import threading
 import asyncio
+import math
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from typing import Optional, List, Dict, Callable
+from typing import Optional, List, Dict, Callable, Any
 import flet as ft
+from audio_ring_buffer import AudioRingBuffer
+from audio_features import AudioFeatureExtractor
+from metrics_recorder import MetricsRecorder
+from voice_echo_test import EchoTestSession
+from speaker_selector import ActiveSpeakerSelector
+from voice_recorder import VoiceRecorder
+from clip_cache import ClipCache, ClipPlayback
+from voice_notes import VoiceNoteRecorder
+from voice_decode_pool import VoiceDecodePool
+from audio_engine_process import AudioEngineProcess, probe_device_set, reinitialize_portaudio
 
 try:
     import sounddevice as sd
@@ -31,32 +44,181 @@ class AudioManager:
     # Voice Activity Detection
     AUDIO_RMS_THRESHOLD = 0.02   # VAD阈值
     
+    # 热路径预分配缓冲区配置
+    SEND_BLOCK_POOL_SIZE = 32        # 发送块轮换池大小（32 * 20ms = 640ms，覆盖按键说话预录音补发和语音发送队列）
+    PLAYBACK_BUFFER_SECONDS = 1.0    # 播放环形缓冲区容量
+    RECEIVE_SCRATCH_SAMPLES = 4800   # 接收解码缓冲区初始大小（100ms）
+    CLIP_CACHE_DIR = "storage/cache/clips"  # 音板片段解码后的PCM缓存目录
+    MAX_NOTIFICATION_VOICES = 4      # 同时混音的通知声音上限，超出时丢弃最旧的
+    # 没有提供音效文件时使用的内置提示音（依次播放的频率）
+    DEFAULT_NOTIFICATION_CHIMES = {
+        'user_join': (660.0, 880.0),
+        'user_leave': (880.0, 660.0),
+        'message': (1046.5,),
+    }
+    SENDER_BUFFER_SECONDS = 0.2      # 每个发送者的播放缓冲区容量，超出即丢弃，限制播放延迟
+    MIX_SCRATCH_SAMPLES = 4800       # 混音缓冲区初始大小
+    
+    # 语音输入模式
+    VOICE_MODE_ACTIVATION = "voice_activation"  # 语音激活（VAD）
+    VOICE_MODE_PUSH_TO_TALK = "push_to_talk"    # 按键说话
+    PTT_RELEASE_TAIL_SECONDS = 0.3   # 松开按键后继续发送的时长，避免吞掉尾音
+    PTT_PRE_ROLL_SECONDS = 0.2       # 按下按键时补发的预录音时长，避免丢失第一个音节
+    
+    # 音频引擎流名称与状态
+    STREAM_CAPTURE = "capture"
+    STREAM_PLAYBACK = "playback"
+    STREAM_MIC_TEST = "mic_test"
+    STREAM_STATE_STOPPED = "stopped"
+    STREAM_STATE_STARTING = "starting"
+    STREAM_STATE_RUNNING = "running"
+    STREAM_STATE_SWITCHING = "switching"
+    STREAM_STATE_STOPPING = "stopping"
+    STREAM_STATE_RECOVERING = "recovering"
+    STREAM_STATE_FAILED = "failed"
+    ACTIVE_STREAM_STATES = (STREAM_STATE_STARTING, STREAM_STATE_RUNNING, STREAM_STATE_SWITCHING, STREAM_STATE_RECOVERING)
+    
+    # 流健康检查与故障转移
+    HEALTH_CHECK_INTERVAL_SECONDS = 0.5  # 检查间隔（20ms块时约25次回调）
+    XRUN_STORM_THRESHOLD = 10            # 一个检查间隔内的xrun次数超过该值视为xrun风暴
+    FAILOVER_DEADLINE_SECONDS = 3.0      # 一次故障转移尝试所有候选设备的总时限
+    RECOVERY_RETRY_INTERVAL_SECONDS = 2.0  # 所有候选设备都失败后的重试间隔
+    
+    DEVICE_WATCH_INTERVAL_SECONDS = 3.0  # 热插拔设备扫描间隔
+    DEVICE_PROBE_INTERVAL_SECONDS = 10.0  # 有流打开时在子进程中探测设备集合的间隔（每次都要启动一个进程）
+    DEVICE_PROBE_TIMEOUT_SECONDS = 10.0
+    ENGINE_SHUTDOWN_TIMEOUT_SECONDS = 3.0  # 关闭时等待引擎线程完成在途操作（关闭设备等）的时限
+    
+    # 延迟校准：从宽松到激进依次探测 (块时长ms, PortAudio latency)
+    CALIBRATION_CANDIDATES = (
+        (20, 'high'),
+        (20, 'low'),
+        (10, 'low'),
+        (5, 'low'),
+        (2.5, 'low'),
+    )
+    CALIBRATION_PROBE_SECONDS = 1.5
+    CALIBRATION_MAX_JITTER_RATIO = 0.5  # 回调间隔p99偏差超过块时长的该比例即视为不稳定
+    
+    # 端到端回声测试
+    ECHO_TEST_SECONDS = 5.0
+    ECHO_TEST_REPLY_GRACE_SECONDS = 1.0  # 停止发送后等待在途回包的时间
+    
     def __init__(self):
         # 设备管理
         self.selected_input_device_id: Optional[int] = None
         self.selected_output_device_id: Optional[int] = None
         
+        # 音频引擎：设备的打开/关闭/切换都在单线程执行器中串行执行，事件循环只等待结果
+        self._engine_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio-engine")
+        # 可选：采集和播放设备回调运行在子进程中（见 enable_engine_process）
+        self.engine_process: Optional[AudioEngineProcess] = None
+        self.stream_states: Dict[str, str] = {
+            self.STREAM_CAPTURE: self.STREAM_STATE_STOPPED,
+            self.STREAM_PLAYBACK: self.STREAM_STATE_STOPPED,
+            self.STREAM_MIC_TEST: self.STREAM_STATE_STOPPED,
+        }
+        
+        # 流健康监控与故障转移
+        self.metrics = MetricsRecorder()
+        self.fallback_input_device_names: List[str] = []   # 按优先级排列的备用输入设备名称
+        self.fallback_output_device_names: List[str] = []  # 按优先级排列的备用输出设备名称
+        self._capture_callback_count = 0
+        self._capture_xrun_count = 0
+        self._playback_callback_count = 0
+        self._playback_xrun_count = 0
+        self._health_baseline: Dict[str, tuple] = {}
+        self._stream_device_names: Dict[str, Optional[str]] = {}
+        self._recovery_pending: Dict[str, float] = {}  # 流名称 -> 上次恢复失败的时间
+        self._health_monitor_task: Optional[asyncio.Task] = None
+        
+        # 延迟校准结果："输入设备名|输出设备名" -> 配置，由调用方从配置文件载入并负责保存
+        self.latency_profiles: Dict[str, Dict[str, Any]] = {}
+        self.is_calibrating: bool = False
+        
+        # 端到端回声测试：采集帧经Socket.IO发往回声端点，回包直接播放
+        self.echo_test: Optional[EchoTestSession] = None
+        self._echo_test_draining: Optional[EchoTestSession] = None
+        
+        # 设备列表缓存与热插拔监视
+        self._device_cache: Optional[Dict] = None
+        self._device_watcher_task: Optional[asyncio.Task] = None
+        self._last_device_probe: float = 0.0
+        
+        # 语音路由：设备保持打开（预热），切换频道只改变帧的逻辑去向
+        self.keep_streams_warm: bool = True
+        self.is_voice_routing_active: bool = False
+        self._playback_flush_requested: bool = False
+        
         # 麦克风测试相关
-        self.is_mic_testing = False
-        self.current_mic_test_volume: float = 0.0
-        self.mic_test_volume_lock = threading.Lock()
-        self.mic_test_thread: Optional[threading.Thread] = None
-        self.mic_test_stop_event = threading.Event()
+        self.mic_test_stream: Optional[sd.Stream] = None
         self.mic_test_ui_update_task: Optional[asyncio.Task] = None
         
         # 音频流发送相关
-        self.is_sending_audio = False
-        self.audio_stream_thread: Optional[threading.Thread] = None
-        self.audio_stream_stop_event = threading.Event()
+        self.audio_input_stream: Optional[sd.InputStream] = None
         self.last_sent_speaking_status: bool = False
         self.is_logically_muted: bool = False
         self.is_mic_muted = False
         self.DEFAULT_UNMUTE_VOLUME = 0.8
         
+        # 按键说话相关
+        self.voice_input_mode: str = self.VOICE_MODE_ACTIVATION
+        self.is_push_to_talk_pressed: bool = False
+        self.ptt_release_tail_seconds: float = self.PTT_RELEASE_TAIL_SECONDS
+        self._ptt_tail_blocks_remaining = 0
+        self._ptt_transmitting = False
+        self._ptt_pre_roll = AudioRingBuffer(int(self.STANDARD_SAMPLERATE * self.PTT_PRE_ROLL_SECONDS))
+        
         # 音频播放相关
         self.audio_output_stream: Optional[sd.OutputStream] = None
-        self.audio_output_buffer = asyncio.Queue()
-        self.is_audio_playback_active: bool = False
+        self.audio_output_buffer = AudioRingBuffer(int(self.STANDARD_SAMPLERATE * self.PLAYBACK_BUFFER_SECONDS))
+        
+        # 每个远端发送者一个环形缓冲区，在播放回调中混音。
+        # 播放回调只读取 _playback_sources 元组，事件循环增删发送者时整体替换（写时复制），无需加锁
+        self._sender_buffers: Dict[str, AudioRingBuffer] = {}
+        self._playback_sources: tuple = ()
+        self._mix_scratch = np.zeros(self.MIX_SCRATCH_SAMPLES, dtype=self.STANDARD_DTYPE)
+        self.speaker_selector = ActiveSpeakerSelector()
+        
+        # 本地的按用户静音和音量（只影响自己听到的声音）
+        self.locally_muted_senders: set = set()
+        self.sender_volumes: Dict[str, float] = {}
+        
+        # 音板：片段解码一次后以内存映射缓存，采集回调按实时节奏逐块混入发送路径
+        self.clip_cache = ClipCache(self.CLIP_CACHE_DIR, self.STANDARD_SAMPLERATE, self.resample_audio)
+        self.active_clip: Optional[ClipPlayback] = None
+        self.soundboard_volume: float = 1.0
+        
+        # 通知声音：预加载并预重采样到内存，触发时只是O(1)入队，由播放回调混入语音输出
+        self.notification_sounds: Dict[str, np.ndarray] = {}
+        self.notification_volume: float = 0.5
+        self.notification_sounds_enabled: bool = True
+        self._notification_queue: deque = deque()  # 事件循环append，播放回调popleft，deque两端操作线程安全
+        self._active_notifications: List[ClipPlayback] = []  # 只由播放回调访问
+        
+        # 文字频道语音消息：复用采集流，回调只写入录制器的环形缓冲区
+        self.voice_note_recorder: Optional[VoiceNoteRecorder] = None
+        
+        # 录音：回调只向录音器的环形缓冲区复制数据，写盘在录音器的后台线程中进行
+        self.voice_recorder: Optional[VoiceRecorder] = None
+        
+        # 热路径预分配缓冲区（避免每个音频块分配数组引发GC停顿）
+        self._send_block_pool = np.zeros(
+            (self.SEND_BLOCK_POOL_SIZE, self.STANDARD_BLOCKSIZE, self.STANDARD_CHANNELS),
+            dtype=self.STANDARD_DTYPE
+        )
+        self._send_block_pool_index = 0
+        # 发送块在网络层发出（或丢弃）之前保持占用，回调不会覆盖尚未发送的块；占用时丢弃新块
+        self._send_block_in_flight = np.zeros(self.SEND_BLOCK_POOL_SIZE, dtype=bool)
+        self.send_blocks_dropped = 0
+        self._receive_scratch = np.zeros(self.RECEIVE_SCRATCH_SAMPLES, dtype=self.STANDARD_DTYPE)
+        
+        # 接收语音帧的解码在线程池中进行，事件循环只负责分发
+        self.voice_decode_pool = VoiceDecodePool(self.decode_voice_chunk, self.decode_voice_batch, self.STANDARD_SAMPLERATE)
+        
+        # 每个采集流一个特征提取器，每块只计算一次，供VAD、音量条、说话卡片和诊断面板共享
+        self.capture_features = AudioFeatureExtractor(self.STANDARD_BLOCKSIZE)
+        self.mic_test_features = AudioFeatureExtractor(self.STANDARD_BLOCKSIZE)
         
         # 回调函数
         self.callbacks: Dict[str, Callable] = {}
@@ -72,11 +234,53 @@ class AudioManager:
         """获取回调函数"""
         return self.callbacks.get(name)
     
+    @property
+    def is_sending_audio(self) -> bool:
+        """采集流是否处于活动状态（启动中/运行中/切换中）"""
+        return self.stream_states[self.STREAM_CAPTURE] in self.ACTIVE_STREAM_STATES
+    
+    @property
+    def is_audio_playback_active(self) -> bool:
+        """播放流是否处于活动状态"""
+        return self.stream_states[self.STREAM_PLAYBACK] in self.ACTIVE_STREAM_STATES
+    
+    @property
+    def is_mic_testing(self) -> bool:
+        """麦克风测试是否处于活动状态"""
+        return self.stream_states[self.STREAM_MIC_TEST] in self.ACTIVE_STREAM_STATES
+    
     def set_page_loop(self, loop):
         """设置页面事件循环"""
         self.page_loop = loop
         print(f"Page loop set: {loop}")
     
+    def set_voice_input_mode(self, mode: str, release_tail_seconds: Optional[float] = None, pre_roll_seconds: Optional[float] = None):
+        """设置语音输入模式（语音激活或按键说话），以及按键说话的尾音和预录音时长"""
+        if mode not in (self.VOICE_MODE_ACTIVATION, self.VOICE_MODE_PUSH_TO_TALK):
+            print(f"Unknown voice input mode: {mode}, falling back to voice activation")
+            mode = self.VOICE_MODE_ACTIVATION
+        
+        if release_tail_seconds is not None:
+            self.ptt_release_tail_seconds = max(0.0, float(release_tail_seconds))
+        if pre_roll_seconds is not None:
+            self._ptt_pre_roll = AudioRingBuffer(int(self.STANDARD_SAMPLERATE * max(0.0, float(pre_roll_seconds))))
+        
+        self.is_push_to_talk_pressed = False
+        self._ptt_tail_blocks_remaining = 0
+        self._ptt_transmitting = False
+        self._ptt_pre_roll.clear()
+        self.voice_input_mode = mode
+        print(f"Voice input mode set: {mode}")
+    
+    def set_push_to_talk_pressed(self, pressed: bool):
+        """更新按键说话的按键状态（可在任意线程调用）"""
+        if pressed == self.is_push_to_talk_pressed:
+            return
+        if not pressed:
+            # 先设置尾音块数再松开，保证回调看到松开时尾音计数已就绪
+            self._ptt_tail_blocks_remaining = math.ceil(self.ptt_release_tail_seconds * self.STANDARD_SAMPLERATE / self.STANDARD_BLOCKSIZE)
+        self.is_push_to_talk_pressed = pressed
+    
     @staticmethod
     def resample_audio(audio_data, original_rate, target_rate):
         """重采样音频数据到目标采样率"""
@@ -95,352 +299,1452 @@ class AudioManager:
             return np.interp(indices, np.arange(len(audio_data)), audio_data).astype(np.float32)
     
     @staticmethod
-    def normalize_audio_chunk(audio_chunk, volume_factor=1.0):
-        """规范化音频块，应用音量并防止削波"""
+    def normalize_audio_chunk(audio_chunk, volume_factor=1.0, out=None):
+        """规范化音频块，应用音量并防止削波
+
+        传入out时结果原地写入out（可以与audio_chunk是同一数组），不分配新数组。
+        """
+        if out is None:
+            out = np.empty(audio_chunk.shape, dtype=np.float32)
+        
         if volume_factor <= 0:
-            return np.zeros_like(audio_chunk, dtype=np.float32)
+            out.fill(0)
+            return out
         
         # 应用音量
-        normalized = audio_chunk * volume_factor
+        np.multiply(audio_chunk, volume_factor, out=out)
         
-        # 防止削波
-        max_val = np.max(np.abs(normalized))
-        if max_val > 1.0:
-            normalized = normalized / max_val
+        # 防止削波（max/min直接归约，不生成np.abs临时数组）
+        if out.size:
+            max_val = max(float(out.max()), -float(out.min()))
+            if max_val > 1.0:
+                np.multiply(out, 1.0 / max_val, out=out)
         
-        return normalized.astype(np.float32)
+        return out
     
     def get_audio_devices_sync(self):
         """同步获取音频设备列表"""
+        input_devices, output_devices, _ = self._query_audio_devices_sync()
+        return input_devices, output_devices
+    
+    def _query_audio_devices_sync(self):
+        """查询设备列表并计算设备集合指纹，返回(输入设备, 输出设备, 指纹)
+
+        每个设备带有key：(设备名称, host API名称)。重新扫描后PortAudio的设备索引可能整体移动，
+        同一个设备要按key而不是id对应。
+        """
         if not SOUNDDEVICE_AVAILABLE or sd is None:
-            return [], []  # Return empty lists if sounddevice is not available
+            return [], [], None  # Return empty lists if sounddevice is not available
         
         try:
             devices = sd.query_devices()
+            hostapi_names = [hostapi['name'] for hostapi in sd.query_hostapis()]  # 一次查询全部host API
             input_devices = []
             output_devices = []
             default_input_idx = sd.default.device[0] if isinstance(sd.default.device, (list, tuple)) else sd.default.device
             default_output_idx = sd.default.device[1] if isinstance(sd.default.device, (list, tuple)) else sd.default.device
 
             for i, device in enumerate(devices):
-                device_name = f"{device['name']} ({sd.query_hostapis(device['hostapi'])['name']})"
+                device_name = f"{device['name']} ({hostapi_names[device['hostapi']]})"
+                device_key = (device['name'], hostapi_names[device['hostapi']])
                 if i == default_input_idx and device['max_input_channels'] > 0:
                     # Prepend '(Default)' to the default input device name
-                    input_devices.insert(0, {'id': i, 'name': f"(Default) {device_name}"})
+                    input_devices.insert(0, {'id': i, 'name': f"(Default) {device_name}", 'key': device_key})
                 elif device['max_input_channels'] > 0:
-                    input_devices.append({'id': i, 'name': device_name})
+                    input_devices.append({'id': i, 'name': device_name, 'key': device_key})
                 
                 if i == default_output_idx and device['max_output_channels'] > 0:
                      # Prepend '(Default)' to the default output device name
-                    output_devices.insert(0, {'id': i, 'name': f"(Default) {device_name}"})
+                    output_devices.insert(0, {'id': i, 'name': f"(Default) {device_name}", 'key': device_key})
                 elif device['max_output_channels'] > 0:
-                    output_devices.append({'id': i, 'name': device_name})
+                    output_devices.append({'id': i, 'name': device_name, 'key': device_key})
             
             # Ensure the default marked item is truly at the top if it wasn't added first due to iteration order
             input_devices.sort(key=lambda x: not x['name'].startswith('(Default)'))
             output_devices.sort(key=lambda x: not x['name'].startswith('(Default)'))
 
-            return input_devices, output_devices
+            fingerprint = hash((
+                tuple((d['id'], d['name']) for d in input_devices),
+                tuple((d['id'], d['name']) for d in output_devices),
+            ))
+            return input_devices, output_devices, fingerprint
         except Exception as e:
             print(f"Error querying audio devices: {e}")
-            return [], []  # Return empty on error
+            return [], [], None  # Return empty on error
+    
+    def _rescan_portaudio_if_idle(self) -> bool:
+        """没有任何流打开时重新初始化PortAudio以刷新设备列表（引擎线程中调用）
+
+        子进程模式下子进程也要重新初始化，两个进程的设备索引才一致。
+        """
+        if self.audio_input_stream is not None or self.audio_output_stream is not None or self.mic_test_stream is not None:
+            return False
+        if not reinitialize_portaudio(sd):
+            return False
+        if self.engine_process is not None and self.engine_process.is_alive:
+            self.engine_process.request('rescan')
+        return True
+    
+    def _cached_device_set(self) -> frozenset:
+        """设备缓存中的设备集合，与 device_set_from 的格式相同"""
+        if self._device_cache is None:
+            return frozenset()
+        return frozenset(
+            (kind,) + device['key'] for kind in ('input', 'output') for device in self._device_cache[kind]
+        )
+    
+    async def _rescan_devices(self) -> bool:
+        """重新扫描PortAudio设备，返回是否重新初始化了PortAudio
+
+        没有流打开时直接重新初始化。有流打开时（预热默认开启，这是常态）先在子进程中探测设备集合，
+        确有设备插拔时才关闭流、重新初始化，再按设备名称在新的索引上重新打开；原设备已拔出时
+        按故障转移的候选顺序回退。麦克风测试或流正在启动/切换/恢复时跳过这一轮。
+        """
+        if self.stream_states[self.STREAM_MIC_TEST] != self.STREAM_STATE_STOPPED:
+            return False
+        open_streams = [name for name in (self.STREAM_CAPTURE, self.STREAM_PLAYBACK)
+                        if self.stream_states[name] != self.STREAM_STATE_STOPPED]
+        if not open_streams:
+            return await self._run_in_engine(self._rescan_portaudio_if_idle)
+        if self._device_cache is None or any(self.stream_states[name] != self.STREAM_STATE_RUNNING for name in open_streams):
+            return False
+        if time.monotonic() - self._last_device_probe < self.DEVICE_PROBE_INTERVAL_SECONDS:
+            return False
+        
+        self._last_device_probe = time.monotonic()
+        # 启动探测进程较慢，放在默认执行器中，不占用音频引擎线程
+        loop = asyncio.get_running_loop()
+        device_set = await loop.run_in_executor(None, probe_device_set, self.DEVICE_PROBE_TIMEOUT_SECONDS)
+        if device_set == self._cached_device_set():
+            return False
+        if any(self.stream_states[name] != self.STREAM_STATE_RUNNING for name in open_streams):
+            return False  # 探测期间流状态发生了变化
+        
+        print(f"Audio device set changed while streams are open, reopening {open_streams}")
+        for stream_name in open_streams:
+            self._set_stream_state(stream_name, self.STREAM_STATE_RECOVERING)
+        results = await self._run_in_engine(self._recover_streams_sync, open_streams)
+        for stream_name, (success, device_id) in results.items():
+            if self.stream_states[stream_name] != self.STREAM_STATE_RECOVERING:
+                continue  # 期间已被请求停止
+            if success:
+                if stream_name == self.STREAM_CAPTURE:
+                    self.selected_input_device_id = device_id
+                else:
+                    self.selected_output_device_id = device_id
+                self._set_stream_state(stream_name, self.STREAM_STATE_RUNNING)
+            else:
+                self._set_stream_state(stream_name, self.STREAM_STATE_FAILED)
+                self._recovery_pending[stream_name] = time.monotonic()
+        return True
+    
+    @staticmethod
+    def diff_device_lists(old_devices: List[Dict], new_devices: List[Dict]) -> Dict[str, List[Dict]]:
+        """比较两个设备列表，以(设备名称, host API)作为标识
+
+        返回新增、移除的设备，以及仍然存在但索引或显示名称（默认设备标记）变化的设备，
+        后者带有原来的索引old_id，调用方据此把选中的设备映射到新索引。
+        """
+        old_by_key = {d['key']: d for d in old_devices}
+        new_keys = {d['key'] for d in new_devices}
+        return {
+            'added': [d for d in new_devices if d['key'] not in old_by_key],
+            'removed': [d for d in old_devices if d['key'] not in new_keys],
+            'updated': [
+                dict(d, old_id=old_by_key[d['key']]['id']) for d in new_devices
+                if d['key'] in old_by_key and (d['id'], d['name']) != (old_by_key[d['key']]['id'], old_by_key[d['key']]['name'])
+            ],
+        }
+    
+    async def get_audio_devices(self, force_refresh: bool = False):
+        """异步获取音频设备列表（在音频引擎线程中枚举，结果按设备集合指纹缓存）"""
+        if self._device_cache is None or force_refresh:
+            await self.refresh_audio_devices()
+        return self._device_cache['input'], self._device_cache['output']
+    
+    async def refresh_audio_devices(self, rescan: bool = False) -> Optional[Dict]:
+        """重新枚举设备，设备集合变化时更新缓存并返回差异，否则返回None
+
+        rescan=True时先重新扫描PortAudio以发现热插拔的设备（见 _rescan_devices）。
+        """
+        if rescan and SOUNDDEVICE_AVAILABLE and sd is not None:
+            await self._rescan_devices()
+        input_devices, output_devices, fingerprint = await self._run_in_engine(self._query_audio_devices_sync)
+        previous_cache = self._device_cache
+        if previous_cache is not None and previous_cache['fingerprint'] == fingerprint:
+            return None
+        
+        self._device_cache = {'fingerprint': fingerprint, 'input': input_devices, 'output': output_devices}
+        if previous_cache is None:
+            return None
+        return {
+            'input': self.diff_device_lists(previous_cache['input'], input_devices),
+            'output': self.diff_device_lists(previous_cache['output'], output_devices),
+        }
+    
+    def start_device_watcher(self):
+        """启动后台设备监视任务，仅在设备集合变化时通知UI"""
+        if self._device_watcher_task is None or self._device_watcher_task.done():
+            self._device_watcher_task = asyncio.create_task(self._device_watcher_loop())
+    
+    def stop_device_watcher(self):
+        """停止设备监视任务"""
+        if self._device_watcher_task:
+            self._device_watcher_task.cancel()
+            self._device_watcher_task = None
+    
+    async def _device_watcher_loop(self):
+        """定期重新扫描设备，设备集合变化时通知UI"""
+        while True:
+            await asyncio.sleep(self.DEVICE_WATCH_INTERVAL_SECONDS)
+            try:
+                diff = await self.refresh_audio_devices(rescan=True)
+            except Exception as e:
+                print(f"Device watcher error: {e}")
+                continue
+            if diff:
+                await self._notify_device_diff(diff)
+    
+    async def _notify_device_diff(self, diff: Dict):
+        """通知UI设备集合发生变化"""
+        print(f"Audio device set changed: {diff}")
+        callback = self.get_callback('on_audio_devices_changed')
+        if callback:
+            await callback(diff)
     
     def mic_test_audio_callback(self, indata, outdata, frames, time, status):
         """麦克风测试音频回调"""
         if status:
             print(f"Mic Test Callback Status: {status}")
-        outdata[:] = indata  # Loopback
-        volume_norm = np.linalg.norm(indata) * 10  # Arbitrary scaling for better visibility
-        with self.mic_test_volume_lock:
-            self.current_mic_test_volume = min(1.0, volume_norm)  # Cap at 1.0 for progress bar
-    
-    def run_mic_test_loop(self, page_instance: ft.Page, input_dev_id: int, output_dev_id: int, stop_event: threading.Event):
-        """运行麦克风测试循环"""
-        stream = None
-        try:
-            # 查询输入设备的默认采样率
-            input_device_info = sd.query_devices(input_dev_id, 'input')
-            original_samplerate = int(input_device_info['default_samplerate'])
-            
-            # 使用标准采样率，如果设备支持的话
-            target_samplerate = self.STANDARD_SAMPLERATE if self.STANDARD_SAMPLERATE in [22050, 44100, 48000] else original_samplerate
-            
-            print(f"Mic test: Original device samplerate: {original_samplerate}, Using: {target_samplerate}")
-            
-            stream = sd.Stream(
-                device=(input_dev_id, output_dev_id),
-                samplerate=target_samplerate,
-                channels=self.STANDARD_CHANNELS,
-                callback=self.mic_test_audio_callback,
-                dtype=self.STANDARD_DTYPE,
-                blocksize=int(target_samplerate * 0.02)  # 20ms blocks
-            )
-            
-            with stream:
-                print(f"Mic test started with devices: input={input_dev_id}, output={output_dev_id}")
-                stop_event.wait()  # Block until stop_event is set
-                print("Mic test stopped by user or error.")
-        except Exception as e:
-            print(f"Mic test error: {e}")
-            async def show_error_async():
-                callback = self.get_callback('show_error')
-                if callback:
-                    await callback(page_instance, f"麦克风测试错误: {e}")
-            
-            # Use page.run_task for thread-safe async call
-            if hasattr(page_instance, 'run_task'):
-                page_instance.run_task(show_error_async)
-        finally:
-            if stream:
-                stream.close()
+        np.copyto(outdata, indata)  # Loopback
+        self.mic_test_features.process(indata)  # 音量条从发布的特征读取
     
     def audio_stream_callback(self, indata, frames, time, status):
         """音频流回调函数"""
+        self._capture_callback_count += 1
         if status:
+            self._capture_xrun_count += 1
             print(f"Audio Stream Callback Status: {status}")
         
-        # 计算音频RMS用于VAD
-        rms = np.sqrt(np.mean(indata ** 2))
+        if self.echo_test is not None:
+            self._send_echo_test_block(indata, frames)
+            return
+        
+        voice_note = self.voice_note_recorder
+        if voice_note is not None:
+            voice_note.write(indata[:, 0])
+        
+        if not self.is_voice_routing_active:
+            # 设备处于预热状态但未加入语音频道，不做任何处理
+            return
+        
+        clip = self.active_clip
+        if self.voice_input_mode == self.VOICE_MODE_PUSH_TO_TALK:
+            sent = self._process_push_to_talk_block(indata, frames, clip)
+        else:
+            sent = self._process_voice_activation_block(indata, frames, clip)
+        
+        recorder = self.voice_recorder
+        if recorder is not None and recorder.include_mic:
+            # 只录制真正发送出去的麦克风音频（按键未按下、VAD判定未说话或静音时不录），
+            # 未发送的块写入等长静音，麦克风声道与远端混音保持对齐
+            if sent:
+                recorder.write_capture(indata[:, 0])
+            else:
+                recorder.write_capture_silence(frames)
+        
+        if clip is not None:
+            # 麦克风这一块没有发送时，单独发送片段
+            if not sent:
+                slot = self._next_send_block(frames)
+                if slot >= 0:
+                    block = self._send_block_pool[slot]
+                    block.fill(0)
+                    clip.mix_into(block[:, 0])
+                    samples = block[:, 0]
+                    self._dispatch_send_block(block, slot, math.sqrt(float(np.dot(samples, samples)) / frames))
+            if clip.finished and self.active_clip is clip:
+                self.active_clip = None
+    
+    def _process_voice_activation_block(self, indata, frames, clip: Optional[ClipPlayback]) -> bool:
+        """语音激活模式下处理一个采集块，返回是否已发送"""
+        # 每块只提取一次特征，VAD直接使用返回的RMS
+        rms = self.capture_features.process(indata)
         is_speaking = rms > self.AUDIO_RMS_THRESHOLD and not self.is_logically_muted
         
         # 如果speaking状态改变，触发回调
-        if is_speaking != self.last_sent_speaking_status:
-            self.last_sent_speaking_status = is_speaking
-            speaking_callback = self.get_callback('on_speaking_status_change')
-            if speaking_callback and self.page_loop:
-                try:
-                    # 使用页面循环创建异步任务
-                    asyncio.run_coroutine_threadsafe(
-                        speaking_callback(is_speaking),
-                        self.page_loop
-                    )
-                except Exception as e:
-                    print(f"Error running speaking status callback: {e}")
+        self._update_speaking_status(is_speaking)
         
         if self.is_logically_muted:
             # 如果被静音，不发送任何数据
-            return
+            return False
         
         # 只有当用户在说话时才发送音频数据
         if not is_speaking:
             # 如果用户没有说话，不发送任何数据
-            return
+            return False
         
-        # 准备音频数据
-        if indata.shape[0] > 0:
-            original_samplerate = len(indata) / (frames / 48000)  # 估算原始采样率
-            if abs(original_samplerate - self.STANDARD_SAMPLERATE) > 100:  # 如果差异显著
-                resampled = self.resample_audio(indata.flatten(), int(original_samplerate), self.STANDARD_SAMPLERATE)
-                data_to_send = resampled.reshape(-1, 1)
-            else:
-                data_to_send = indata
+        self._send_capture_block(indata, frames, rms, clip)
+        return True
+    
+    def _process_push_to_talk_block(self, indata, frames, clip: Optional[ClipPlayback]) -> bool:
+        """按键说话模式下处理一个采集块：按键未按下时只保存预录音，不做任何分析，返回是否已发送"""
+        if self.is_push_to_talk_pressed:
+            transmitting = True
+        elif self._ptt_tail_blocks_remaining > 0:
+            self._ptt_tail_blocks_remaining -= 1
+            transmitting = True
         else:
-            # 如果没有数据，不发送
-            return
+            transmitting = False
         
-        # 发送音频数据
-        send_callback = self.get_callback('send_audio_data')
-        if send_callback and self.page_loop:
+        if not transmitting or self.is_logically_muted:
+            if self._ptt_transmitting:
+                self._ptt_transmitting = False
+                self._update_speaking_status(False)
+            # 空闲路径只做一次内存复制：把当前块滚动写入预录音缓冲区（丢弃最旧的样本）
+            pre_roll = self._ptt_pre_roll
+            if pre_roll.capacity >= frames:
+                overflow = frames - pre_roll.free_space()
+                if overflow > 0:
+                    pre_roll.discard(overflow)
+                pre_roll.write(indata[:, 0])
+            return False
+        
+        if not self._ptt_transmitting:
+            self._ptt_transmitting = True
+            self._update_speaking_status(True)
+            self._flush_push_to_talk_pre_roll(frames)
+        
+        rms = self.capture_features.process(indata)
+        self._send_capture_block(indata, frames, rms, clip)
+        return True
+    
+    def _flush_push_to_talk_pre_roll(self, frames: int):
+        """按下按键时先补发预录音"""
+        while self._ptt_pre_roll.available() >= frames:
+            slot = self._next_send_block(frames)
+            if slot < 0:
+                break
+            block = self._send_block_pool[slot]
+            self._ptt_pre_roll.read_into(block[:, 0])
+            samples = block[:, 0]
+            self._dispatch_send_block(block, slot, math.sqrt(float(np.dot(samples, samples)) / frames))
+        self._ptt_pre_roll.clear()
+    
+    def _update_speaking_status(self, is_speaking: bool):
+        """说话状态变化时通知事件循环"""
+        if is_speaking == self.last_sent_speaking_status:
+            return
+        self.last_sent_speaking_status = is_speaking
+        speaking_callback = self.get_callback('on_speaking_status_change')
+        if speaking_callback and self.page_loop:
             try:
                 # 使用页面循环创建异步任务
                 asyncio.run_coroutine_threadsafe(
-                    send_callback(data_to_send),
+                    speaking_callback(is_speaking),
                     self.page_loop
                 )
             except Exception as e:
-                print(f"Error sending audio data: {e}")
+                print(f"Error running speaking status callback: {e}")
     
-    def run_audio_stream_loop(self, input_dev_id: int, stop_event: threading.Event, page_instance_ref: ft.Page):
-        """运行音频流循环"""
-        stream = None
+    def _send_capture_block(self, indata, frames, rms: float, clip: Optional[ClipPlayback] = None):
+        """复制采集块（混入正在播放的片段）并交给事件循环发送，附带块RMS供接收端选择活跃说话人"""
+        if frames <= 0:
+            # 如果没有数据，不发送
+            return
+        
+        # 输入流始终以STANDARD_SAMPLERATE打开，无需重采样。
+        # indata指向PortAudio会复用的内存，这里复制到轮换池中的预分配块再交给事件循环
+        slot = self._next_send_block(frames)
+        if slot < 0:
+            return
+        data_to_send = self._send_block_pool[slot]
+        np.copyto(data_to_send, indata)
+        if clip is not None:
+            clip.mix_into(data_to_send[:, 0])
+        self._dispatch_send_block(data_to_send, slot, rms)
+    
+    def _dispatch_send_block(self, data_to_send: np.ndarray, slot: int, rms: float):
+        """发送音频数据；接收方发出或丢弃该块后必须调用 release_send_block"""
+        send_callback = self.get_callback('send_audio_data')
+        if not send_callback or not self.page_loop:
+            self._send_block_in_flight[slot] = False
+            return
         try:
-            # 查询输入设备信息
-            input_device_info = sd.query_devices(input_dev_id, 'input')
-            original_samplerate = int(input_device_info['default_samplerate'])
-            
-            # 使用标准采样率
-            target_samplerate = self.STANDARD_SAMPLERATE if self.STANDARD_SAMPLERATE in [22050, 44100, 48000] else original_samplerate
-            
-            print(f"Audio stream: Original device samplerate: {original_samplerate}, Using: {target_samplerate}")
-            
-            stream = sd.InputStream(
-                device=input_dev_id,
-                samplerate=target_samplerate,
-                channels=self.STANDARD_CHANNELS,
-                callback=self.audio_stream_callback,
-                dtype=self.STANDARD_DTYPE,
-                blocksize=int(target_samplerate * 0.02)  # 20ms blocks
+            # 使用页面循环创建异步任务
+            asyncio.run_coroutine_threadsafe(
+                send_callback(data_to_send, rms, slot),
+                self.page_loop
             )
-            
-            with stream:
-                print(f"Audio streaming started with input device: {input_dev_id}")
-                stop_event.wait()
-                print("Audio streaming stopped.")
         except Exception as e:
-            print(f"Audio stream error: {e}")
-            async def show_error_async():
-                callback = self.get_callback('show_error')
-                if callback:
-                    await callback(page_instance_ref, f"音频流错误: {e}")
-            
-            if hasattr(page_instance_ref, 'run_task'):
-                page_instance_ref.run_task(show_error_async)
-        finally:
-            if stream:
-                stream.close()
+            self._send_block_in_flight[slot] = False
+            print(f"Error sending audio data: {e}")
+    
+    def _send_echo_test_block(self, indata, frames):
+        """回声测试：每个块都发送（不经过VAD），附带序号和发送时间"""
+        session = self.echo_test
+        send_callback = self.get_callback('send_echo_audio_data')
+        if session is None or not send_callback or not self.page_loop:
+            return
+        slot = self._next_send_block(frames)
+        if slot < 0:
+            return
+        block = self._send_block_pool[slot]
+        np.copyto(block, indata)
+        sequence, send_time = session.stamp_send()
+        try:
+            asyncio.run_coroutine_threadsafe(send_callback(block, slot, sequence, send_time), self.page_loop)
+        except Exception as e:
+            self._send_block_in_flight[slot] = False
+            print(f"Error sending echo test frame: {e}")
+    
+    def _next_send_block(self, frames: int) -> int:
+        """从发送块轮换池中占用下一个预分配块，返回其序号；该块尚未发出时返回-1（本块丢弃）"""
+        if self._send_block_pool.shape[1] != frames:
+            # 块大小变化（极少发生）时才重新分配
+            self._send_block_pool = np.zeros(
+                (self.SEND_BLOCK_POOL_SIZE, frames, self.STANDARD_CHANNELS),
+                dtype=self.STANDARD_DTYPE
+            )
+            self._send_block_in_flight = np.zeros(self.SEND_BLOCK_POOL_SIZE, dtype=bool)
+        slot = self._send_block_pool_index
+        if self._send_block_in_flight[slot]:
+            # 事件循环或网络层停顿太久，池中的块都还没发出：丢弃新块而不是覆盖待发送的数据
+            self.send_blocks_dropped += 1
+            return -1
+        self._send_block_in_flight[slot] = True
+        self._send_block_pool_index = (slot + 1) % self.SEND_BLOCK_POOL_SIZE
+        return slot
+    
+    def release_send_block(self, block: np.ndarray, slot: int):
+        """发送块已序列化（或被丢弃）后归还给轮换池（任意线程可调用）"""
+        if block.base is self._send_block_pool:
+            self._send_block_in_flight[slot] = False
     
     def audio_playback_callback(self, outdata, frames, time, status):
         """音频播放回调函数"""
+        self._playback_callback_count += 1
         if status:
+            self._playback_xrun_count += 1
             print(f"Audio Playback Callback Status: {status}")
         
         try:
-            # 从缓冲区获取音频数据
-            if not self.audio_output_buffer.empty():
-                audio_chunk = self.audio_output_buffer.get_nowait()
-                
-                # 确保数据长度匹配
-                if len(audio_chunk) == frames:
-                    outdata[:] = audio_chunk.reshape(-1, 1)
-                else:
-                    # 如果长度不匹配，进行调整
-                    if len(audio_chunk) > frames:
-                        outdata[:] = audio_chunk[:frames].reshape(-1, 1)
-                    else:
-                        outdata[:len(audio_chunk)] = audio_chunk.reshape(-1, 1)
-                        outdata[len(audio_chunk):] = 0  # 填充静音
-            else:
-                # 缓冲区为空，输出静音
-                outdata.fill(0)
+            sources = self._playback_sources
+            if self._playback_flush_requested:
+                # 离开频道时由事件循环请求，在消费者线程中清空以保持单生产者/单消费者约定
+                self.audio_output_buffer.clear()
+                for sender_buffer in sources:
+                    sender_buffer.clear()
+                self._playback_flush_requested = False
+            
+            # 从环形缓冲区直接读入输出缓冲区，不足部分填充静音
+            out = outdata[:, 0]
+            read_count = self.audio_output_buffer.read_into(out)
+            if read_count < frames:
+                outdata[read_count:].fill(0)
+            
+            if sources:
+                # 把各发送者的音频叠加进输出
+                if len(self._mix_scratch) < frames:
+                    self._mix_scratch = np.zeros(frames, dtype=self.STANDARD_DTYPE)
+                mix = self._mix_scratch[:frames]
+                for sender_buffer in sources:
+                    count = sender_buffer.read_into(mix)
+                    if count:
+                        np.add(out[:count], mix[:count], out=out[:count])
+                np.clip(out, -1.0, 1.0, out=out)
+            
+            if self._notification_queue or self._active_notifications:
+                self._mix_notifications(out)
+            
+            recorder = self.voice_recorder
+            if recorder is not None:
+                recorder.write_playback(out)
         except Exception as e:
             print(f"Audio playback callback error: {e}")
             outdata.fill(0)  # 出错时输出静音
     
-    async def start_audio_playback_stream(self, page_ref: ft.Page, output_device_idx: Optional[int] = None):
-        """启动音频播放流"""
-        if self.is_audio_playback_active:
-            print("Audio playback stream already active.")
+    def _mix_notifications(self, out: np.ndarray):
+        """把排队的通知声音混入播放输出（播放回调中调用）"""
+        active = self._active_notifications
+        queue = self._notification_queue
+        while queue:
+            active.append(queue.popleft())
+            if len(active) > self.MAX_NOTIFICATION_VOICES:
+                del active[0]
+        for playback in active:
+            playback.mix_into(out)
+        if any(playback.finished for playback in active):
+            active[:] = [playback for playback in active if not playback.finished]
+    
+    # --- 音频引擎：流生命周期状态机 ---
+    def _set_stream_state(self, stream_name: str, state: str):
+        """切换流状态并通知监听者"""
+        previous_state = self.stream_states[stream_name]
+        if previous_state == state:
             return
+        self.stream_states[stream_name] = state
+        if state == self.STREAM_STATE_RUNNING:
+            # 重新计算健康检查基线，并确保监控任务在运行
+            self._health_baseline[stream_name] = self._get_stream_counters(stream_name)
+            self._recovery_pending.pop(stream_name, None)
+            self._ensure_health_monitor()
+        elif state == self.STREAM_STATE_STOPPED:
+            self._recovery_pending.pop(stream_name, None)
+        print(f"Audio engine: {stream_name} {previous_state} -> {state}")
+        callback = self.get_callback('on_audio_engine_state_change')
+        if callback:
+            callback(stream_name, state)
+    
+    async def _run_in_engine(self, func: Callable, *args):
+        """在音频引擎线程中执行阻塞的设备操作，事件循环只等待结果"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._engine_executor, func, *args)
+    
+    async def _report_engine_error(self, page_ref: ft.Page, message: str):
+        """通过回调向UI报告引擎错误"""
+        callback = self.get_callback('show_error')
+        if callback:
+            await callback(page_ref, message)
+    
+    def _resolve_stream_samplerate(self, device_id: Optional[int], kind: str) -> int:
+        """查询设备默认采样率并确定实际使用的采样率（引擎线程中调用）"""
+        if device_id is not None:
+            device_info = sd.query_devices(device_id, kind)
+            original_samplerate = int(device_info['default_samplerate'])
+        else:
+            original_samplerate = self.STANDARD_SAMPLERATE
         
+        # 使用标准采样率
+        target_samplerate = self.STANDARD_SAMPLERATE if self.STANDARD_SAMPLERATE in [22050, 44100, 48000] else original_samplerate
+        print(f"Audio {kind}: Original device samplerate: {original_samplerate}, Using: {target_samplerate}")
+        return target_samplerate
+    
+    @staticmethod
+    def _close_stream_sync(stream):
+        """停止并关闭流（引擎线程中调用）"""
+        if stream is None:
+            return
         try:
-            # 获取输出设备信息
-            if output_device_idx is not None:
-                output_device_info = sd.query_devices(output_device_idx, 'output')
-                original_samplerate = int(output_device_info['default_samplerate'])
-            else:
-                original_samplerate = self.STANDARD_SAMPLERATE
-            
-            # 使用标准采样率
-            target_samplerate = self.STANDARD_SAMPLERATE if self.STANDARD_SAMPLERATE in [22050, 44100, 48000] else original_samplerate
-            
-            print(f"Audio playback: Original device samplerate: {original_samplerate}, Using: {target_samplerate}")
-            
-            self.audio_output_stream = sd.OutputStream(
-                device=output_device_idx,
-                samplerate=target_samplerate,
-                channels=self.STANDARD_CHANNELS,
-                callback=self.audio_playback_callback,
-                dtype=self.STANDARD_DTYPE,
-                blocksize=int(target_samplerate * 0.02)  # 20ms blocks
-            )
-            
-            self.audio_output_stream.start()
-            self.is_audio_playback_active = True
-            print(f"Audio playback started with output device: {output_device_idx}")
-        except Exception as e:
-            print(f"Failed to start audio playback stream: {e}")
-            callback = self.get_callback('show_error')
-            if callback:
-                await callback(page_ref, f"启动音频播放失败: {e}")
+            stream.stop()
+        finally:
+            stream.close()
     
-    async def stop_audio_playback_stream_if_running(self):
-        """停止音频播放流"""
-        if self.audio_output_stream is not None and self.is_audio_playback_active:
+    def _open_capture_stream_sync(self, input_dev_id: int):
+        """打开并启动采集流（引擎线程中调用）"""
+        if not SOUNDDEVICE_AVAILABLE or sd is None:
+            raise RuntimeError("sounddevice不可用")
+        target_samplerate = self._resolve_stream_samplerate(input_dev_id, 'input')
+        profile = self._get_latency_profile(input_dev_id, self.selected_output_device_id)
+        stream_api = self.engine_process or sd
+        stream = stream_api.InputStream(
+            device=input_dev_id,
+            samplerate=target_samplerate,
+            channels=self.STANDARD_CHANNELS,
+            callback=self.audio_stream_callback,
+            dtype=self.STANDARD_DTYPE,
+            blocksize=int(target_samplerate * 0.02),  # 20ms blocks，与网络帧对齐，校准只调整latency
+            latency=profile['latency'] if profile else None
+        )
+        try:
+            stream.start()
+        except Exception:
+            stream.close()
+            raise
+        self.audio_input_stream = stream
+        self._stream_device_names[self.STREAM_CAPTURE] = self._get_device_name(input_dev_id)
+        print(f"Audio streaming started with input device: {input_dev_id}")
+    
+    def _close_capture_stream_sync(self):
+        """关闭采集流（引擎线程中调用）"""
+        stream, self.audio_input_stream = self.audio_input_stream, None
+        self._close_stream_sync(stream)
+        print("Audio streaming stopped.")
+    
+    def _switch_capture_stream_sync(self, input_dev_id: int):
+        """切换采集设备（引擎线程中调用）"""
+        self._close_capture_stream_sync()
+        self._open_capture_stream_sync(input_dev_id)
+    
+    def _open_playback_stream_sync(self, output_device_idx: Optional[int]):
+        """打开并启动播放流（引擎线程中调用）"""
+        if not SOUNDDEVICE_AVAILABLE or sd is None:
+            raise RuntimeError("sounddevice不可用")
+        target_samplerate = self._resolve_stream_samplerate(output_device_idx, 'output')
+        profile = self._get_latency_profile(self.selected_input_device_id, output_device_idx)
+        stream_api = self.engine_process or sd
+        stream = stream_api.OutputStream(
+            device=output_device_idx,
+            samplerate=target_samplerate,
+            channels=self.STANDARD_CHANNELS,
+            callback=self.audio_playback_callback,
+            dtype=self.STANDARD_DTYPE,
+            blocksize=self._calibrated_blocksize(target_samplerate, profile),
+            latency=profile['latency'] if profile else None
+        )
+        try:
+            stream.start()
+        except Exception:
+            stream.close()
+            raise
+        self.audio_output_stream = stream
+        self._stream_device_names[self.STREAM_PLAYBACK] = self._get_device_name(output_device_idx)
+        print(f"Audio playback started with output device: {output_device_idx}")
+    
+    def _close_playback_stream_sync(self):
+        """关闭播放流并清空缓冲区（引擎线程中调用）"""
+        stream, self.audio_output_stream = self.audio_output_stream, None
+        self._close_stream_sync(stream)
+        # 回调已停止，可以安全地移动读索引
+        self.audio_output_buffer.clear()
+        for sender_buffer in self._playback_sources:
+            sender_buffer.clear()
+        print("Audio playback stream stopped and closed.")
+    
+    def _switch_playback_stream_sync(self, output_device_idx: Optional[int]):
+        """切换播放设备（引擎线程中调用），缓冲区中待播放的数据保留"""
+        stream, self.audio_output_stream = self.audio_output_stream, None
+        self._close_stream_sync(stream)
+        self._open_playback_stream_sync(output_device_idx)
+    
+    def _open_mic_test_stream_sync(self, input_dev_id: int, output_dev_id: Optional[int]):
+        """打开并启动麦克风回环测试流（引擎线程中调用）"""
+        if not SOUNDDEVICE_AVAILABLE or sd is None:
+            raise RuntimeError("sounddevice不可用")
+        target_samplerate = self._resolve_stream_samplerate(input_dev_id, 'input')
+        profile = self._get_latency_profile(input_dev_id, output_dev_id)
+        stream = sd.Stream(
+            device=(input_dev_id, output_dev_id),
+            samplerate=target_samplerate,
+            channels=self.STANDARD_CHANNELS,
+            callback=self.mic_test_audio_callback,
+            dtype=self.STANDARD_DTYPE,
+            blocksize=self._calibrated_blocksize(target_samplerate, profile),
+            latency=profile['latency'] if profile else None
+        )
+        try:
+            stream.start()
+        except Exception:
+            stream.close()
+            raise
+        self.mic_test_stream = stream
+        print(f"Mic test started with devices: input={input_dev_id}, output={output_dev_id}")
+    
+    def _close_mic_test_stream_sync(self):
+        """关闭麦克风测试流（引擎线程中调用）"""
+        stream, self.mic_test_stream = self.mic_test_stream, None
+        self._close_stream_sync(stream)
+        print("Mic test stopped.")
+    
+    # --- 延迟校准 ---
+    @staticmethod
+    def _device_profile_name(device_id: Optional[int], kind: str) -> Optional[str]:
+        """设备在校准配置中使用的名称（设备索引在重新扫描后会变化，名称不会）"""
+        try:
+            if device_id is None:
+                return sd.query_devices(kind=kind)['name']
+            return sd.query_devices(device_id)['name']
+        except Exception:
+            return None
+    
+    def _latency_profile_key(self, input_dev_id: Optional[int], output_dev_id: Optional[int]) -> str:
+        input_name = self._device_profile_name(input_dev_id, 'input')
+        output_name = self._device_profile_name(output_dev_id, 'output')
+        return f"{input_name}|{output_name}"
+    
+    def _get_latency_profile(self, input_dev_id: Optional[int], output_dev_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        """查找设备组合的校准结果，没有校准过时返回None（使用20ms块和PortAudio默认延迟）"""
+        if not self.latency_profiles:
+            return None
+        return self.latency_profiles.get(self._latency_profile_key(input_dev_id, output_dev_id))
+    
+    @staticmethod
+    def _calibrated_blocksize(samplerate: int, profile: Optional[Dict[str, Any]]) -> int:
+        block_ms = profile['block_ms'] if profile else 20
+        return int(samplerate * block_ms / 1000)
+    
+    def _probe_stream_config_sync(self, input_dev_id: Optional[int], output_dev_id: Optional[int],
+                                  samplerate: int, block_ms: float, latency) -> Dict[str, Any]:
+        """用一组参数打开全双工流并测量回调抖动和xrun（引擎线程中调用）"""
+        blocksize = int(samplerate * block_ms / 1000)
+        period = blocksize / samplerate
+        max_callbacks = int(self.CALIBRATION_PROBE_SECONDS / period) + 16
+        timestamps = np.zeros(max_callbacks, dtype=np.float64)
+        counters = [0, 0]  # [回调次数, xrun次数]
+        
+        def probe_callback(indata, outdata, frames, time_info, status):
+            index = counters[0]
+            if index < max_callbacks:
+                timestamps[index] = time.perf_counter()
+            counters[0] = index + 1
+            if status:
+                counters[1] += 1
+            outdata.fill(0)
+        
+        stream = sd.Stream(
+            device=(input_dev_id, output_dev_id),
+            samplerate=samplerate,
+            channels=self.STANDARD_CHANNELS,
+            callback=probe_callback,
+            dtype=self.STANDARD_DTYPE,
+            blocksize=blocksize,
+            latency=latency
+        )
+        try:
+            stream.start()
+            time.sleep(self.CALIBRATION_PROBE_SECONDS)
+            stream_latency = stream.latency
+        finally:
+            self._close_stream_sync(stream)
+        
+        # 忽略启动阶段的前几个回调
+        count = min(counters[0], max_callbacks)
+        intervals = np.diff(timestamps[min(4, count):count])
+        if len(intervals) < 4:
+            return {'stable': False, 'callbacks': counters[0], 'xruns': counters[1]}
+        deviation = np.abs(intervals - period)
+        jitter_p99_ms = float(np.percentile(deviation, 99)) * 1000
+        if isinstance(stream_latency, (tuple, list)):
+            stream_latency = sum(stream_latency)
+        return {
+            'stable': counters[1] == 0 and jitter_p99_ms <= period * 1000 * self.CALIBRATION_MAX_JITTER_RATIO,
+            'callbacks': counters[0],
+            'xruns': counters[1],
+            'jitter_p99_ms': round(jitter_p99_ms, 3),
+            'total_latency_ms': round(float(stream_latency) * 1000 + block_ms, 2)
+        }
+    
+    def _calibrate_latency_sync(self, input_dev_id: Optional[int], output_dev_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        """依次探测候选参数，返回估算总延迟最低的稳定配置（引擎线程中调用）"""
+        samplerate = self._resolve_stream_samplerate(input_dev_id, 'input')
+        best = None
+        failed_block_ms = None
+        for block_ms, latency in self.CALIBRATION_CANDIDATES:
+            if failed_block_ms is not None and block_ms < failed_block_ms:
+                break  # 更小的块只会更不稳定
             try:
-                self.audio_output_stream.stop()
-                self.audio_output_stream.close()
-                self.is_audio_playback_active = False
-                print("Audio playback stream stopped and closed.")
+                result = self._probe_stream_config_sync(input_dev_id, output_dev_id, samplerate, block_ms, latency)
             except Exception as e:
-                print(f"Error stopping audio playback stream: {e}")
-            finally:
-                self.audio_output_stream = None
-                
-                # 清空缓冲区
-                while not self.audio_output_buffer.empty():
+                result = {'stable': False, 'error': str(e)}
+            print(f"Latency calibration: block={block_ms}ms latency={latency} -> {result}")
+            if not result['stable']:
+                failed_block_ms = block_ms
+                continue
+            if best is None or result['total_latency_ms'] < best['total_latency_ms']:
+                best = {'block_ms': block_ms, 'latency': latency, **result}
+        return best
+    
+    async def calibrate_latency(self, page_ref: ft.Page) -> Optional[Dict[str, Any]]:
+        """校准当前选中的输入/输出设备组合
+
+        校准需要独占设备：麦克风测试时拒绝执行；采集和播放流会先关闭，在语音频道中时
+        校准结束后按新配置重新打开并恢复路由。返回新的校准配置（已写入latency_profiles），失败返回None。
+        """
+        if self.is_calibrating or self.is_mic_testing or self.echo_test is not None:
+            print("Latency calibration skipped: audio devices are in use.")
+            return None
+        if not SOUNDDEVICE_AVAILABLE or sd is None:
+            await self._report_engine_error(page_ref, "延迟校准失败: sounddevice不可用")
+            return None
+        
+        self.is_calibrating = True
+        was_routing = self.is_voice_routing_active
+        try:
+            await self.release_streams()
+            input_dev_id, output_dev_id = self.selected_input_device_id, self.selected_output_device_id
+            profile = await self._run_in_engine(self._calibrate_latency_sync, input_dev_id, output_dev_id)
+            if profile is None:
+                await self._report_engine_error(page_ref, "延迟校准失败: 没有找到稳定的配置")
+                return None
+            key = await self._run_in_engine(self._latency_profile_key, input_dev_id, output_dev_id)
+            self.latency_profiles[key] = profile
+            print(f"Latency calibration for {key}: {profile}")
+            return profile
+        except Exception as e:
+            await self._report_engine_error(page_ref, f"延迟校准失败: {e}")
+            return None
+        finally:
+            self.is_calibrating = False
+            if was_routing:
+                await self.attach_voice_route(page_ref)
+    
+    # --- 端到端回声测试 ---
+    async def run_echo_test(self, page_ref: ft.Page, duration: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """经真实的Socket.IO语音链路做回声测试，返回延迟分位数、丢包、抖动和问题归属
+
+        在语音频道中运行时，测试期间采集的音频只发往回声端点，不发送到频道。
+        回包由 handle_echo_reply 登记并写入播放缓冲区。
+        """
+        if self.echo_test is not None or self.is_mic_testing or self.is_calibrating:
+            print("Echo test skipped: audio devices are in use.")
+            return None
+        
+        await self.start_audio_stream(page_ref, self.selected_input_device_id)
+        await self.start_audio_playback_stream(page_ref, self.selected_output_device_id)
+        if not self.is_sending_audio or not self.is_audio_playback_active:
+            return None
+        
+        self.metrics.reset_series('echo_rtt_ms')
+        xruns_before = self._capture_xrun_count + self._playback_xrun_count
+        self._playback_flush_requested = True
+        self.echo_test = EchoTestSession(self.metrics)
+        try:
+            await asyncio.sleep(duration if duration is not None else self.ECHO_TEST_SECONDS)
+            device_latency_ms = self._get_device_latency_ms()
+            playback_buffer_ms = self._get_playback_buffer_ms()
+            session, self.echo_test = self.echo_test, None
+            # 停止发送后继续接收在途回包
+            self._echo_test_draining = session
+            await asyncio.sleep(self.ECHO_TEST_REPLY_GRACE_SECONDS)
+        finally:
+            self.echo_test = None
+            self._echo_test_draining = None
+            self._playback_flush_requested = True
+            if not self.keep_streams_warm and not self.is_voice_routing_active:
+                await self.release_streams()
+        
+        report = session.build_report(
+            device_latency_ms=device_latency_ms,
+            playback_buffer_ms=playback_buffer_ms,
+            device_xruns=self._capture_xrun_count + self._playback_xrun_count - xruns_before
+        )
+        self.metrics.record_event('echo_test', **report)
+        print(f"Echo test report: {report}")
+        return report
+    
+    def handle_echo_reply(self, data: Dict[str, Any]):
+        """登记服务器回送的回声帧并播放（事件循环中调用）"""
+        session = self.echo_test or self._echo_test_draining
+        if session is None:
+            return
+        sequence = data.get('sequence')
+        if sequence is None or session.record_reply(sequence) is None:
+            return
+        audio_chunk_list = data.get('audio_data')
+        if audio_chunk_list and isinstance(audio_chunk_list, list):
+            samples = self.decode_voice_chunk(audio_chunk_list, data.get('samplerate', self.STANDARD_SAMPLERATE))
+            self.audio_output_buffer.write(samples.reshape(-1))
+    
+    def _get_device_latency_ms(self) -> float:
+        """采集流输入延迟 + 播放流输出延迟（PortAudio报告值）"""
+        total = 0.0
+        for stream in (self.audio_input_stream, self.audio_output_stream):
+            try:
+                latency = stream.latency if stream is not None else 0.0
+            except Exception:
+                latency = 0.0
+            total += sum(latency) if isinstance(latency, (tuple, list)) else float(latency)
+        return total * 1000
+    
+    def _get_playback_buffer_ms(self) -> float:
+        """回包在播放缓冲区中等待的时间，按当前播放流的块大小估算（延迟校准会改变块大小）"""
+        stream = self.audio_output_stream
+        blocksize = getattr(stream, 'blocksize', 0) or self.STANDARD_BLOCKSIZE  # 0表示由PortAudio决定
+        samplerate = getattr(stream, 'samplerate', 0) or self.STANDARD_SAMPLERATE
+        return blocksize / samplerate * 1000
+    
+    # --- 音板 ---
+    async def play_clip(self, path: Optional[str] = None, volume: Optional[float] = None) -> bool:
+        """把音频片段（path为None时播放测试音）混入发送路径，替换正在播放的片段"""
+        if not self.is_voice_routing_active:
+            print("Soundboard: not in a voice channel.")
+            return False
+        loop = asyncio.get_running_loop()
+        if path is None:
+            samples = await loop.run_in_executor(None, self.clip_cache.tone)
+        else:
+            # 首次播放时解码并写入缓存，之后只是重新映射
+            samples = await loop.run_in_executor(None, self.clip_cache.load, path)
+        self.active_clip = ClipPlayback(
+            samples,
+            volume=self.soundboard_volume if volume is None else volume,
+            name=path or "test tone",
+            blocksize=self.STANDARD_BLOCKSIZE
+        )
+        return True
+    
+    def stop_clip(self):
+        """停止正在播放的片段"""
+        self.active_clip = None
+    
+    # --- 通知声音 ---
+    async def preload_notification_sounds(self, sound_files: Optional[Dict[str, str]] = None):
+        """解码、重采样并载入通知声音；没有提供文件（或文件无法解码）的使用内置提示音"""
+        sound_files = sound_files or {}
+        loop = asyncio.get_running_loop()
+        
+        def load_all():
+            sounds = {}
+            for name, chime in self.DEFAULT_NOTIFICATION_CHIMES.items():
+                samples = None
+                path = sound_files.get(name)
+                if path:
                     try:
-                        self.audio_output_buffer.get_nowait()
-                    except:
-                        break
+                        samples = self.clip_cache.load(path)
+                    except Exception as e:
+                        print(f"Failed to load notification sound {name} from {path}: {e}")
+                if samples is None:
+                    samples = self.clip_cache.chime(chime)
+                # 复制进内存，触发时不会因为内存映射缺页而读盘
+                sounds[name] = np.array(samples, dtype=self.STANDARD_DTYPE)
+            return sounds
+        
+        self.notification_sounds = await loop.run_in_executor(None, load_all)
+        print(f"Notification sounds loaded: {list(self.notification_sounds)}")
     
-    async def start_audio_stream(self, page_ref: ft.Page, input_device_id: int):
-        """启动音频发送流"""
-        if self.is_sending_audio:
-            print("Audio stream already active.")
+    def play_notification_sound(self, name: str) -> bool:
+        """触发一个通知声音：只是入队，播放流没有运行时直接忽略（不会为此打开设备）"""
+        if not self.notification_sounds_enabled or not self.is_audio_playback_active:
+            return False
+        samples = self.notification_sounds.get(name)
+        if samples is None:
+            return False
+        self._notification_queue.append(
+            ClipPlayback(samples, volume=self.notification_volume, name=name, blocksize=self.STANDARD_BLOCKSIZE)
+        )
+        return True
+    
+    # --- 文字频道语音消息 ---
+    async def start_voice_note(self, page_ref: ft.Page, recorder: VoiceNoteRecorder) -> bool:
+        """开始录制语音消息（采集流未打开时先打开）"""
+        if self.voice_note_recorder is not None:
+            return False
+        await self.start_audio_stream(page_ref, self.selected_input_device_id)
+        if not self.is_sending_audio:
+            return False
+        recorder.start()
+        self.voice_note_recorder = recorder
+        return True
+    
+    async def stop_voice_note(self) -> Optional[VoiceNoteRecorder]:
+        """停止向语音消息写入采集音频，返回录制器（由调用方完成或取消上传）"""
+        recorder, self.voice_note_recorder = self.voice_note_recorder, None
+        if not self.is_voice_routing_active and not self.keep_streams_warm:
+            await self.stop_audio_stream_if_running()
+        return recorder
+    
+    async def write_streamed_playback(self, samples: np.ndarray, chunk_seconds: float = 0.05) -> bool:
+        """把流式解码的音频写入播放缓冲区，缓冲区满时等待播放回调消耗（事件循环中调用）
+
+        播放流没有运行时没有人消耗缓冲区，立即返回False，不写入。
+        """
+        offset = 0
+        while offset < len(samples):
+            if not self.is_audio_playback_active:
+                return False
+            free = self.audio_output_buffer.free_space()
+            if free == 0:
+                await asyncio.sleep(chunk_seconds)
+                continue
+            offset += self.audio_output_buffer.write(samples[offset:offset + free])
+        return True
+    
+    # --- 录音 ---
+    @property
+    def is_recording(self) -> bool:
+        return self.voice_recorder is not None
+    
+    async def start_recording(self, path: str, include_mic: bool = False, file_format: str = VoiceRecorder.FORMAT_WAV) -> bool:
+        """开始录制播放混音（可选包含本地麦克风）"""
+        if self.voice_recorder is not None:
+            return False
+        recorder = VoiceRecorder(path, self.STANDARD_SAMPLERATE, include_mic=include_mic, file_format=file_format)
+        # 打开文件在引擎线程中进行，不阻塞事件循环
+        await self._run_in_engine(recorder.start)
+        self.voice_recorder = recorder
+        return True
+    
+    async def stop_recording(self) -> Optional[Dict[str, Any]]:
+        """停止录音，返回写入吞吐量和缓冲区最高占用等统计信息"""
+        recorder, self.voice_recorder = self.voice_recorder, None
+        if recorder is None:
+            return None
+        stats = await self._run_in_engine(recorder.stop)
+        self.metrics.record_event('voice_recording', **stats)
+        return stats
+    
+    # --- 流健康监控与自动故障转移 ---
+    @staticmethod
+    def _get_device_name(device_id: Optional[int]) -> Optional[str]:
+        """获取设备名称（用于重新扫描后按名称找回设备）"""
+        if device_id is None:
+            return None
+        try:
+            return sd.query_devices(device_id)['name']
+        except Exception:
+            return None
+    
+    @staticmethod
+    def _find_device_index_by_name(name: Optional[str], kind: str) -> Optional[int]:
+        """按名称查找支持指定方向的设备索引"""
+        if not name:
+            return None
+        channel_key = 'max_input_channels' if kind == 'input' else 'max_output_channels'
+        try:
+            for index, device in enumerate(sd.query_devices()):
+                if device['name'] == name and device[channel_key] > 0:
+                    return index
+        except Exception as e:
+            print(f"Error looking up device {name}: {e}")
+        return None
+    
+    def _get_stream_counters(self, stream_name: str) -> tuple:
+        """返回(回调次数, xrun次数)"""
+        if stream_name == self.STREAM_CAPTURE:
+            return self._capture_callback_count, self._capture_xrun_count
+        return self._playback_callback_count, self._playback_xrun_count
+    
+    def _ensure_health_monitor(self):
+        """确保健康监控任务在页面事件循环中运行"""
+        if self._health_monitor_task is not None and not self._health_monitor_task.done():
             return
+        try:
+            self._health_monitor_task = asyncio.get_running_loop().create_task(self._stream_health_loop())
+        except RuntimeError:
+            pass  # 不在事件循环中（例如引擎线程），下一次状态变化时再启动
+    
+    def _check_stream_health(self, stream_name: str) -> Optional[str]:
+        """检查一个流的健康状况，返回需要恢复的原因，健康时返回None"""
+        state = self.stream_states[stream_name]
+        if state == self.STREAM_STATE_FAILED:
+            failed_at = self._recovery_pending.get(stream_name)
+            if failed_at is not None and time.monotonic() - failed_at >= self.RECOVERY_RETRY_INTERVAL_SECONDS:
+                return "retry after failed recovery"
+            return None
+        if state != self.STREAM_STATE_RUNNING:
+            return None
         
-        # 重置stop event
-        self.audio_stream_stop_event.clear()
+        stream = self.audio_input_stream if stream_name == self.STREAM_CAPTURE else self.audio_output_stream
+        callback_count, xrun_count = self._get_stream_counters(stream_name)
+        previous_callback_count, previous_xrun_count = self._health_baseline.get(stream_name, (callback_count, xrun_count))
+        self._health_baseline[stream_name] = (callback_count, xrun_count)
         
-        # 启动音频流线程
-        self.audio_stream_thread = threading.Thread(
-            target=self.run_audio_stream_loop,
-            args=(input_device_id, self.audio_stream_stop_event, page_ref),
-            daemon=True
+        if stream is None or not stream.active:
+            return "stream inactive"
+        if callback_count == previous_callback_count:
+            return "callback stalled"
+        if xrun_count - previous_xrun_count >= self.XRUN_STORM_THRESHOLD:
+            return f"xrun storm ({xrun_count - previous_xrun_count} in {self.HEALTH_CHECK_INTERVAL_SECONDS}s)"
+        return None
+    
+    async def _stream_health_loop(self):
+        """定期检查采集和播放流，出现错误、回调停滞或xrun风暴时自动故障转移"""
+        while any(self.stream_states[name] in self.ACTIVE_STREAM_STATES or name in self._recovery_pending
+                  for name in (self.STREAM_CAPTURE, self.STREAM_PLAYBACK)):
+            await asyncio.sleep(self.HEALTH_CHECK_INTERVAL_SECONDS)
+            unhealthy = {}
+            for stream_name in (self.STREAM_CAPTURE, self.STREAM_PLAYBACK):
+                reason = self._check_stream_health(stream_name)
+                if reason:
+                    unhealthy[stream_name] = reason
+            if unhealthy:
+                try:
+                    await self._recover_streams(unhealthy)
+                except Exception as e:
+                    print(f"Audio stream recovery error: {e}")
+    
+    def _failover_candidates(self, stream_name: str) -> List[Optional[int]]:
+        """按优先级生成候选设备：原设备（按名称找回）、配置的备用设备、系统默认设备(None)"""
+        if stream_name == self.STREAM_CAPTURE:
+            kind, fallback_names = 'input', self.fallback_input_device_names
+        else:
+            kind, fallback_names = 'output', self.fallback_output_device_names
+        
+        candidates: List[Optional[int]] = []
+        for name in [self._stream_device_names.get(stream_name)] + list(fallback_names):
+            device_id = self._find_device_index_by_name(name, kind)
+            if device_id is not None and device_id not in candidates:
+                candidates.append(device_id)
+        candidates.append(None)
+        return candidates
+    
+    def _recover_streams_sync(self, stream_names: List[str]) -> Dict[str, tuple]:
+        """关闭故障流、尽可能重新扫描设备，然后依次尝试候选设备（引擎线程中调用）
+
+        返回 流名称 -> (是否成功, 设备ID)。
+        """
+        deadline = time.monotonic() + self.FAILOVER_DEADLINE_SECONDS
+        for stream_name in stream_names:
+            try:
+                if stream_name == self.STREAM_CAPTURE:
+                    stream, self.audio_input_stream = self.audio_input_stream, None
+                else:
+                    stream, self.audio_output_stream = self.audio_output_stream, None
+                self._close_stream_sync(stream)
+            except Exception as e:
+                print(f"Error closing failed {stream_name} stream: {e}")
+        
+        try:
+            self._rescan_portaudio_if_idle()
+        except Exception as e:
+            print(f"PortAudio rescan failed during recovery: {e}")
+        
+        results = {}
+        for stream_name in stream_names:
+            open_func = self._open_capture_stream_sync if stream_name == self.STREAM_CAPTURE else self._open_playback_stream_sync
+            results[stream_name] = (False, None)
+            for device_id in self._failover_candidates(stream_name):
+                if time.monotonic() > deadline:
+                    print(f"Audio failover deadline exceeded for {stream_name}")
+                    break
+                try:
+                    open_func(device_id)
+                    results[stream_name] = (True, device_id)
+                    break
+                except Exception as e:
+                    print(f"Failover to device {device_id} for {stream_name} failed: {e}")
+        return results
+    
+    async def _recover_streams(self, unhealthy: Dict[str, str]):
+        """对故障流执行故障转移并记录指标"""
+        started_at = time.perf_counter()
+        for stream_name, reason in unhealthy.items():
+            print(f"Audio engine: {stream_name} unhealthy ({reason}), failing over")
+            self.metrics.increment('audio_failover_total')
+            self._set_stream_state(stream_name, self.STREAM_STATE_RECOVERING)
+        
+        results = await self._run_in_engine(self._recover_streams_sync, list(unhealthy))
+        recovery_ms = (time.perf_counter() - started_at) * 1000
+        
+        for stream_name, (success, device_id) in results.items():
+            self.metrics.record_event(
+                'audio_failover',
+                stream=stream_name,
+                reason=unhealthy[stream_name],
+                success=success,
+                device_id=device_id,
+                recovery_ms=recovery_ms
+            )
+            if self.stream_states[stream_name] != self.STREAM_STATE_RECOVERING:
+                continue  # 恢复期间已被请求停止
+            if success:
+                self.metrics.record('audio_recovery_ms', recovery_ms)
+                if stream_name == self.STREAM_CAPTURE:
+                    self.selected_input_device_id = device_id
+                else:
+                    self.selected_output_device_id = device_id
+                self._set_stream_state(stream_name, self.STREAM_STATE_RUNNING)
+                print(f"Audio engine: {stream_name} recovered on device {device_id} in {recovery_ms:.0f}ms")
+                callback = self.get_callback('on_audio_device_failover')
+                if callback:
+                    await callback(stream_name, device_id)
+            else:
+                self.metrics.increment('audio_failover_failed_total')
+                self._set_stream_state(stream_name, self.STREAM_STATE_FAILED)
+                self._recovery_pending[stream_name] = time.monotonic()
+        
+        # 故障往往意味着设备集合变化，刷新缓存并通知UI
+        diff = await self.refresh_audio_devices()
+        if diff:
+            await self._notify_device_diff(diff)
+    
+    async def _start_stream(self, stream_name: str, page_ref: ft.Page, open_func: Callable, args: tuple, error_prefix: str) -> bool:
+        """通用启动流程：STOPPED/FAILED -> STARTING -> RUNNING（失败则FAILED）"""
+        if self.stream_states[stream_name] in self.ACTIVE_STREAM_STATES:
+            print(f"Audio engine: {stream_name} already active.")
+            return False
+        
+        self._set_stream_state(stream_name, self.STREAM_STATE_STARTING)
+        try:
+            await self._run_in_engine(open_func, *args)
+        except Exception as e:
+            print(f"{error_prefix}: {e}")
+            self._set_stream_state(stream_name, self.STREAM_STATE_FAILED)
+            await self._report_engine_error(page_ref, f"{error_prefix}: {e}")
+            return False
+        
+        # 启动期间如果已请求停止，状态会是STOPPING，不能覆盖
+        if self.stream_states[stream_name] == self.STREAM_STATE_STARTING:
+            self._set_stream_state(stream_name, self.STREAM_STATE_RUNNING)
+        return True
+    
+    async def _stop_stream(self, stream_name: str, close_func: Callable) -> bool:
+        """通用停止流程：任意活动状态/FAILED -> STOPPING -> STOPPED"""
+        if self.stream_states[stream_name] in (self.STREAM_STATE_STOPPED, self.STREAM_STATE_STOPPING):
+            return False
+        
+        self._set_stream_state(stream_name, self.STREAM_STATE_STOPPING)
+        try:
+            await self._run_in_engine(close_func)
+        except Exception as e:
+            print(f"Error stopping {stream_name} stream: {e}")
+        self._set_stream_state(stream_name, self.STREAM_STATE_STOPPED)
+        return True
+    
+    async def _switch_stream(self, stream_name: str, page_ref: ft.Page, switch_func: Callable, device_id: Optional[int], error_prefix: str) -> bool:
+        """通用设备切换流程：RUNNING -> SWITCHING -> RUNNING（失败则FAILED），未运行时不做任何事"""
+        if self.stream_states[stream_name] != self.STREAM_STATE_RUNNING:
+            return False
+        
+        self._set_stream_state(stream_name, self.STREAM_STATE_SWITCHING)
+        try:
+            await self._run_in_engine(switch_func, device_id)
+        except Exception as e:
+            print(f"{error_prefix}: {e}")
+            self._set_stream_state(stream_name, self.STREAM_STATE_FAILED)
+            await self._report_engine_error(page_ref, f"{error_prefix}: {e}")
+            return False
+        
+        if self.stream_states[stream_name] == self.STREAM_STATE_SWITCHING:
+            self._set_stream_state(stream_name, self.STREAM_STATE_RUNNING)
+        return True
+    
+    async def enable_engine_process(self) -> bool:
+        """让采集和播放设备回调运行在子进程中（需在打开采集/播放流之前调用）
+
+        失败时保持进程内模式。麦克风测试、延迟校准等短时操作始终在进程内打开设备。
+        """
+        if self.engine_process is not None:
+            return True
+        if not SOUNDDEVICE_AVAILABLE:
+            return False
+        engine = AudioEngineProcess(self.STANDARD_SAMPLERATE)
+        try:
+            await self._run_in_engine(engine.start)
+        except Exception as e:
+            print(f"Failed to start audio engine process, using in-process audio: {e}")
+            await self._run_in_engine(engine.shutdown)
+            return False
+        self.engine_process = engine
+        return True
+    
+    def get_engine_process_stats(self) -> Dict[str, Any]:
+        """子进程模式下设备回调的xrun和欠载统计"""
+        return self.engine_process.get_stats() if self.engine_process else {}
+    
+    async def start_audio_playback_stream(self, page_ref: ft.Page, output_device_idx: Optional[int] = None):
+        """启动音频播放流"""
+        await self._start_stream(
+            self.STREAM_PLAYBACK, page_ref, self._open_playback_stream_sync, (output_device_idx,), "启动音频播放失败"
+        )
+    
+    async def stop_audio_playback_stream_if_running(self):
+        """停止音频播放流"""
+        await self._stop_stream(self.STREAM_PLAYBACK, self._close_playback_stream_sync)
+    
+    async def switch_output_device(self, page_ref: ft.Page, output_device_idx: Optional[int]):
+        """切换输出设备，播放流运行中时在引擎线程里重新打开"""
+        self.selected_output_device_id = output_device_idx
+        return await self._switch_stream(
+            self.STREAM_PLAYBACK, page_ref, self._switch_playback_stream_sync, output_device_idx, "切换输出设备失败"
+        )
+    
+    async def start_audio_stream(self, page_ref: ft.Page, input_device_id: int):
+        """启动音频发送流"""
+        await self._start_stream(
+            self.STREAM_CAPTURE, page_ref, self._open_capture_stream_sync, (input_device_id,), "音频流错误"
         )
-        self.audio_stream_thread.start()
-        self.is_sending_audio = True
-        print(f"Audio stream thread started with input device: {input_device_id}")
     
     async def stop_audio_stream_if_running(self):
         """停止音频发送流"""
-        if self.is_sending_audio and self.audio_stream_thread:
-            self.audio_stream_stop_event.set()  # Signal the thread to stop
-            self.audio_stream_thread.join(timeout=2.0)  # Wait up to 2 seconds for thread to finish
-            if self.audio_stream_thread.is_alive():
-                print("Warning: Audio stream thread did not terminate within timeout.")
-            else:
-                print("Audio stream thread terminated successfully.")
-            
-            self.audio_stream_thread = None
-            self.is_sending_audio = False
+        if await self._stop_stream(self.STREAM_CAPTURE, self._close_capture_stream_sync):
             self.last_sent_speaking_status = False
+            self._ptt_transmitting = False
+            self._ptt_pre_roll.clear()
+            self.capture_features.reset()
+    
+    async def switch_input_device(self, page_ref: ft.Page, input_device_id: Optional[int]):
+        """切换输入设备，采集流运行中时在引擎线程里重新打开"""
+        self.selected_input_device_id = input_device_id
+        if input_device_id is None:
+            await self.stop_audio_stream_if_running()
+            return False
+        return await self._switch_stream(
+            self.STREAM_CAPTURE, page_ref, self._switch_capture_stream_sync, input_device_id, "切换输入设备失败"
+        )
     
     async def start_mic_test(self, page_ref: ft.Page, input_device_id: int, output_device_id: Optional[int] = None):
         """启动麦克风测试"""
-        if self.is_mic_testing:
-            return
-        
-        self.mic_test_stop_event.clear()
-        self.current_mic_test_volume = 0.0
-        
-        # 启动麦克风测试线程
-        self.mic_test_thread = threading.Thread(
-            target=self.run_mic_test_loop,
-            args=(page_ref, input_device_id, output_device_id, self.mic_test_stop_event),
-            daemon=True
+        self.mic_test_features.reset()
+        await self._start_stream(
+            self.STREAM_MIC_TEST, page_ref, self._open_mic_test_stream_sync, (input_device_id, output_device_id), "麦克风测试错误"
         )
-        self.mic_test_thread.start()
-        self.is_mic_testing = True
     
     async def stop_mic_test(self):
         """停止麦克风测试"""
-        if self.is_mic_testing and self.mic_test_thread:
-            self.mic_test_stop_event.set()
-            self.mic_test_thread.join(timeout=2.0)
-            if self.mic_test_thread.is_alive():
-                print("Warning: Mic test thread did not terminate within timeout.")
-            else:
-                print("Mic test thread terminated successfully.")
-            
-            self.mic_test_thread = None
-            self.is_mic_testing = False
-            self.current_mic_test_volume = 0.0
+        if await self._stop_stream(self.STREAM_MIC_TEST, self._close_mic_test_stream_sync):
+            self.mic_test_features.reset()
+    
+    async def prewarm_streams(self, page_ref: ft.Page):
+        """预先打开采集和播放设备（不路由任何音频），使加入频道时无需等待设备打开"""
+        if self.selected_input_device_id is not None:
+            await self.start_audio_stream(page_ref, self.selected_input_device_id)
+        await self.start_audio_playback_stream(page_ref, self.selected_output_device_id)
+    
+    async def attach_voice_route(self, page_ref: ft.Page):
+        """加入语音频道：确保设备已打开（已预热时立即返回），然后开始路由音频"""
+        if self.selected_input_device_id is not None:
+            await self.start_audio_stream(page_ref, self.selected_input_device_id)
+        await self.start_audio_playback_stream(page_ref, self.selected_output_device_id)
+        self.is_voice_routing_active = True
+    
+    async def detach_voice_route(self):
+        """离开语音频道：保持预热时只停止路由，否则关闭设备"""
+        self.is_voice_routing_active = False
+        self.active_clip = None
+        self.clear_voice_senders()
+        if not self.keep_streams_warm:
+            await self.release_streams()
+            return
+        
+        # 采集回调已短路，这些状态之后不会再被修改
+        self.last_sent_speaking_status = False
+        self._ptt_transmitting = False
+        self._ptt_pre_roll.clear()
+        self.capture_features.reset()
+        self._playback_flush_requested = True
+    
+    async def release_streams(self):
+        """关闭采集和播放设备（登出或关闭应用时）"""
+        self.is_voice_routing_active = False
+        await self.stop_audio_stream_if_running()
+        await self.stop_audio_playback_stream_if_running()
+    
+    async def shutdown(self):
+        """停止所有流并关闭音频引擎线程"""
+        self.stop_device_watcher()
+        await self.stop_recording()
+        if self._health_monitor_task:
+            self._health_monitor_task.cancel()
+            self._health_monitor_task = None
+        await self.stop_mic_test()
+        await self.release_streams()
+        if self.engine_process is not None:
+            await self._run_in_engine(self.engine_process.shutdown)
+            self.engine_process = None
+        self.voice_decode_pool.shutdown()
+        # 引擎执行器是单线程、按顺序执行：排在最后的空操作完成时，之前在途的流关闭也已完成。
+        # 在事件循环中等待（带时限），不阻塞事件循环，也不让设备关闭与解释器退出赛跑
+        try:
+            await asyncio.wait_for(self._run_in_engine(lambda: None), self.ENGINE_SHUTDOWN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            print(f"音频引擎线程在{self.ENGINE_SHUTDOWN_TIMEOUT_SECONDS}秒内未完成在途操作，强制退出")
+        self._engine_executor.shutdown(wait=False)
     
     def get_mic_test_volume(self) -> float:
         """获取当前麦克风测试音量"""
-        with self.mic_test_volume_lock:
-            return self.current_mic_test_volume
+        features = self.mic_test_features.snapshot()
+        if not features:
+            return 0.0
+        # 与原先np.linalg.norm(indata) * 10的刻度保持一致
+        volume_norm = features['rms'] * math.sqrt(features['frames']) * 10
+        return min(1.0, volume_norm)  # Cap at 1.0 for progress bar
+    
+    def get_audio_features(self) -> Optional[Dict]:
+        """获取当前活动采集流最近一个块的特征（语音流优先，其次麦克风测试）"""
+        if self.is_sending_audio:
+            return self.capture_features.snapshot()
+        if self.is_mic_testing:
+            return self.mic_test_features.snapshot()
+        return None
+    
+    def decode_voice_chunk(self, audio_chunk_list: list, chunk_samplerate: int, volume_factor: float = 1.0,
+                           scratch: Optional[np.ndarray] = None) -> np.ndarray:
+        """将接收到的音频列表解码为float32样本
+
+        标准采样率下结果写入预分配的接收缓冲区并返回其视图，视图在下一次解码前有效。
+        解码线程池中调用时传入各线程自己的scratch（长度不小于样本数）。
+        """
+        sample_count = len(audio_chunk_list)
+        if scratch is None:
+            if sample_count > len(self._receive_scratch):
+                self._receive_scratch = np.zeros(sample_count, dtype=self.STANDARD_DTYPE)
+            scratch = self._receive_scratch
+        samples = scratch[:sample_count]
+        
+        # 发送端发出的是(N, 1)形状的嵌套列表，也兼容扁平列表
+        if sample_count and isinstance(audio_chunk_list[0], list):
+            samples[:, None] = audio_chunk_list
+        else:
+            samples[:] = audio_chunk_list
+        
+        # 如果采样率不同，进行重采样（非标准路径，会分配新数组）
+        if chunk_samplerate != self.STANDARD_SAMPLERATE:
+            print(f"重采样音频从 {chunk_samplerate}Hz 到 {self.STANDARD_SAMPLERATE}Hz")
+            samples = self.resample_audio(samples, chunk_samplerate, self.STANDARD_SAMPLERATE)
+        
+        # 原地规范化
+        return self.normalize_audio_chunk(samples, volume_factor=volume_factor, out=samples)
+    
+    def decode_voice_batch(self, frames: List[list], chunk_samplerate: int, volume_factor: float = 1.0) -> np.ndarray:
+        """把同一发送者积压的多帧作为一个批次解码，返回拼接后的一维样本
+
+        帧长相同时一次转换为 (帧数, 样本数) 的二维数组，重采样和音量/防削波也对整批只做一次。
+        """
+        frame_length = len(frames[0])
+        if all(len(frame) == frame_length for frame in frames):
+            samples = np.asarray(frames, dtype=self.STANDARD_DTYPE).reshape(len(frames), -1).reshape(-1)
+        else:
+            samples = np.concatenate([np.asarray(frame, dtype=self.STANDARD_DTYPE).reshape(-1) for frame in frames])
+        
+        if chunk_samplerate != self.STANDARD_SAMPLERATE:
+            samples = self.resample_audio(samples, chunk_samplerate, self.STANDARD_SAMPLERATE)
+        
+        return self.normalize_audio_chunk(samples, volume_factor=volume_factor, out=samples)
+    
+    def set_sender_local_mute(self, sender_id: str, muted: bool):
+        """本地静音/取消静音某个用户，静音时立即丢弃其已缓冲的音频"""
+        if muted:
+            self.locally_muted_senders.add(sender_id)
+            self.remove_voice_sender(sender_id)
+        else:
+            self.locally_muted_senders.discard(sender_id)
+    
+    def is_sender_locally_muted(self, sender_id: str) -> bool:
+        return sender_id in self.locally_muted_senders
+    
+    def set_sender_volume(self, sender_id: str, volume: float):
+        """设置某个用户的本地播放音量（1.0为原始音量）"""
+        if volume == 1.0:
+            self.sender_volumes.pop(sender_id, None)
+        else:
+            self.sender_volumes[sender_id] = max(0.0, float(volume))
+    
+    def get_sender_volume(self, sender_id: str) -> float:
+        return self.sender_volumes.get(sender_id, 1.0)
+    
+    def set_max_active_speakers(self, max_speakers: int):
+        """设置同时播放的最大说话人数"""
+        self.speaker_selector = ActiveSpeakerSelector(max_speakers)
+    
+    def accept_voice_frame(self, sender_id: str, data: Dict[str, Any]) -> bool:
+        """解码之前决定是否接收该发送者的帧（只保留最响的N个说话人）"""
+        energy = ActiveSpeakerSelector.estimate_frame_energy(data)
+        return self.speaker_selector.should_accept(sender_id, energy)
+    
+    def _get_sender_buffer(self, sender_id: str) -> AudioRingBuffer:
+        """获取（必要时创建）某个发送者的混音缓冲区（事件循环中调用）"""
+        sender_buffer = self._sender_buffers.get(sender_id)
+        if sender_buffer is None:
+            sender_buffer = AudioRingBuffer(int(self.STANDARD_SAMPLERATE * self.SENDER_BUFFER_SECONDS))
+            self._sender_buffers[sender_id] = sender_buffer
+            self._playback_sources = tuple(self._sender_buffers.values())
+        return sender_buffer
+    
+    def add_sender_audio_to_playback(self, sender_id: str, samples: np.ndarray):
+        """把某个发送者解码后的样本写入其混音缓冲区（事件循环中调用）"""
+        self._get_sender_buffer(sender_id).write(samples.reshape(-1))
+    
+    def submit_voice_frame(self, sender_id: str, audio_chunk_list: list, chunk_samplerate: int):
+        """把某个发送者的一帧交给解码线程池，解码结果按到达顺序写入其混音缓冲区（事件循环中调用）"""
+        self.voice_decode_pool.submit(
+            sender_id, self._get_sender_buffer(sender_id), audio_chunk_list, chunk_samplerate,
+            self.get_sender_volume(sender_id)
+        )
+    
+    def remove_voice_sender(self, sender_id: str):
+        """发送者离开频道时移除其混音缓冲区"""
+        self.speaker_selector.remove_sender(sender_id)
+        self.voice_decode_pool.discard_sender(sender_id)
+        if self._sender_buffers.pop(sender_id, None) is not None:
+            self._playback_sources = tuple(self._sender_buffers.values())
+    
+    def clear_voice_senders(self):
+        """离开频道时移除所有发送者"""
+        self.speaker_selector.reset()
+        self.voice_decode_pool.discard_all()
+        self._sender_buffers.clear()
+        self._playback_sources = ()
     
     async def add_audio_chunk_to_playback_buffer(self, audio_chunk: np.ndarray):
         """添加音频块到播放缓冲区"""
@@ -449,14 +1753,9 @@ class AudioManager:
             if audio_chunk.dtype != self.STANDARD_DTYPE:
                 audio_chunk = audio_chunk.astype(self.STANDARD_DTYPE)
             
-            # 添加到缓冲区（非阻塞）
-            self.audio_output_buffer.put_nowait(audio_chunk)
-        except asyncio.QueueFull:
-            # 如果缓冲区满了，丢弃最旧的音频块
-            try:
-                self.audio_output_buffer.get_nowait()
-                self.audio_output_buffer.put_nowait(audio_chunk)
-            except:
-                pass  # 如果还是失败就忽略这个音频块
+            # 复制进环形缓冲区（非阻塞），缓冲区满时丢弃溢出的样本
+            written = self.audio_output_buffer.write(audio_chunk.reshape(-1))
+            if written < audio_chunk.size:
+                print(f"Playback buffer full, dropped {audio_chunk.size - written} samples")
         except Exception as e:
-            print(f"Error adding audio chunk to buffer: {e}") 
\ No newline at end of file
+            print(f"Error adding audio chunk to buffer: {e}")
@@ -0,0 +1,68 @@
+import numpy as np
+
+
+class AudioRingBuffer:
+    """单生产者/单消费者的无锁音频环形缓冲区
+
+    存储空间在构造时一次性预分配，读写只做 np.copyto，不在音频热路径中分配数组。
+    写索引只由生产者线程修改，读索引只由消费者线程修改，两者都是单调递增的整数，
+    在GIL下的赋值是原子的，因此不需要锁。
+    """
+
+    def __init__(self, capacity: int, dtype=np.float32):
+        self.capacity = int(capacity)
+        self._buffer = np.zeros(self.capacity, dtype=dtype)
+        self._write_index = 0  # 累计写入的样本数（仅生产者修改）
+        self._read_index = 0   # 累计读取的样本数（仅消费者修改）
+        self.dropped_samples = 0  # 因缓冲区已满被丢弃的样本数
+
+    def available(self) -> int:
+        """可读取的样本数"""
+        return self._write_index - self._read_index
+
+    def free_space(self) -> int:
+        """可写入的样本数"""
+        return self.capacity - (self._write_index - self._read_index)
+
+    def write(self, samples: np.ndarray) -> int:
+        """写入一维样本（生产者调用），缓冲区满时丢弃超出部分，返回实际写入数"""
+        count = min(len(samples), self.free_space())
+        if count < len(samples):
+            self.dropped_samples += len(samples) - count
+        if count <= 0:
+            return 0
+
+        start = self._write_index % self.capacity
+        first = min(count, self.capacity - start)
+        np.copyto(self._buffer[start:start + first], samples[:first])
+        if first < count:
+            np.copyto(self._buffer[:count - first], samples[first:count])
+
+        self._write_index += count
+        return count
+
+    def read_into(self, out: np.ndarray) -> int:
+        """读取样本到预分配的一维数组（消费者调用），返回实际读取数，不足部分不做填充"""
+        count = min(len(out), self.available())
+        if count <= 0:
+            return 0
+
+        start = self._read_index % self.capacity
+        first = min(count, self.capacity - start)
+        np.copyto(out[:first], self._buffer[start:start + first])
+        if first < count:
+            np.copyto(out[first:count], self._buffer[:count - first])
+
+        self._read_index += count
+        return count
+
+    def discard(self, count: int) -> int:
+        """丢弃最旧的样本（消费者调用），返回实际丢弃数"""
+        count = min(int(count), self.available())
+        if count > 0:
+            self._read_index += count
+        return max(count, 0)
+
+    def clear(self):
+        """清空缓冲区（消费者调用，或在生产者已停止时调用）"""
+        self._read_index = self._write_index
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import threading
+import wave
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+try:
+    import soundfile
+    SOUNDFILE_AVAILABLE = True
+except Exception as e:
+    print(f"soundfile not available: {e}. Only WAV clips can be decoded.")
+    SOUNDFILE_AVAILABLE = False
+    soundfile = None
+
+
+class ClipCache:
+    """音频片段缓存
+
+    片段只解码一次：转换为目标采样率的单声道float32后写入磁盘上的裸PCM文件，
+    之后通过 np.memmap 只读映射，重复播放既不需要解码，也不需要把整个片段复制进内存。
+    缓存文件名由源文件路径、大小和修改时间决定，源文件变化后会自动重新解码。
+    """
+
+    CACHE_DTYPE = np.float32
+
+    def __init__(self, cache_dir: str, samplerate: int, resample: Callable):
+        self.cache_dir = cache_dir
+        self.samplerate = samplerate
+        self._resample = resample
+        self._lock = threading.Lock()
+        self._mapped: Dict[str, np.memmap] = {}
+
+    def load(self, path: str) -> np.ndarray:
+        """获取片段的只读内存映射（会阻塞，应在事件循环之外调用）"""
+        stat = os.stat(path)
+        key = hashlib.sha1(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{self.samplerate}".encode()).hexdigest()
+        return self._load_cached(key, lambda: self._decode_file(path))
+
+    def tone(self, frequency: float = 440.0, seconds: float = 1.0, amplitude: float = 0.3) -> np.ndarray:
+        """获取测试音（正弦波，首尾各10ms淡入淡出避免爆音）"""
+        return self.chime((frequency,), seconds, amplitude)
+
+    def chime(self, frequencies: tuple, note_seconds: float = 0.08, amplitude: float = 0.3) -> np.ndarray:
+        """获取由若干个音依次组成的提示音（用于没有提供音效文件的通知声音）"""
+        key = f"chime_{'_'.join(f'{f:g}' for f in frequencies)}_{note_seconds:g}_{amplitude:g}_{self.samplerate}"
+
+        def generate():
+            note_count = int(self.samplerate * note_seconds)
+            fade = min(note_count // 2, int(self.samplerate * 0.01))
+            ramp = np.linspace(0, 1, fade, dtype=self.CACHE_DTYPE)
+            notes = []
+            for frequency in frequencies:
+                note = (amplitude * np.sin(2 * np.pi * frequency * np.arange(note_count) / self.samplerate)).astype(self.CACHE_DTYPE)
+                if fade:
+                    note[:fade] *= ramp
+                    note[-fade:] *= ramp[::-1]
+                notes.append(note)
+            return np.concatenate(notes) if notes else np.zeros(0, dtype=self.CACHE_DTYPE)
+
+        return self._load_cached(key, generate)
+
+    def _load_cached(self, key: str, decode: Callable[[], np.ndarray]) -> np.ndarray:
+        with self._lock:
+            mapped = self._mapped.get(key)
+            if mapped is not None:
+                return mapped
+
+            cache_path = os.path.join(self.cache_dir, f"{key}.f32")
+            if not os.path.exists(cache_path):
+                samples = decode()
+                os.makedirs(self.cache_dir, exist_ok=True)
+                temp_path = f"{cache_path}.tmp"
+                samples.astype(self.CACHE_DTYPE, copy=False).tofile(temp_path)
+                os.replace(temp_path, cache_path)  # 写完再改名，中途失败不会留下残缺的缓存
+
+            if os.path.getsize(cache_path) == 0:
+                mapped = np.zeros(0, dtype=self.CACHE_DTYPE)  # 空文件不能映射
+            else:
+                mapped = np.memmap(cache_path, dtype=self.CACHE_DTYPE, mode='r')
+            self._mapped[key] = mapped
+            return mapped
+
+    def _decode_file(self, path: str) -> np.ndarray:
+        """解码为目标采样率的单声道float32"""
+        if path.lower().endswith('.wav'):
+            samples, source_rate = self._decode_wav(path)
+        elif SOUNDFILE_AVAILABLE:
+            samples, source_rate = soundfile.read(path, dtype='float32', always_2d=True)
+        else:
+            raise ValueError(f"Cannot decode {path}: soundfile is not installed")
+
+        if samples.ndim == 2:
+            samples = samples.mean(axis=1)
+        samples = samples.astype(self.CACHE_DTYPE, copy=False)
+        return self._resample(samples, source_rate, self.samplerate)
+
+    @staticmethod
+    def _decode_wav(path: str):
+        with wave.open(path, 'rb') as wav_file:
+            channels = wav_file.getnchannels()
+            sample_width = wav_file.getsampwidth()
+            source_rate = wav_file.getframerate()
+            raw = wav_file.readframes(wav_file.getnframes())
+
+        if sample_width == 1:
+            samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+        elif sample_width == 2:
+            samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768
+        elif sample_width == 3:
+            packed = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+            values = packed[:, 0].astype(np.int32) | (packed[:, 1].astype(np.int32) << 8) | (packed[:, 2].astype(np.int32) << 16)
+            values = np.where(values >= 1 << 23, values - (1 << 24), values)
+            samples = values.astype(np.float32) / (1 << 23)
+        elif sample_width == 4:
+            samples = np.frombuffer(raw, dtype='<i4').astype(np.float32) / (1 << 31)
+        else:
+            raise ValueError(f"Unsupported WAV sample width: {sample_width}")
+        return samples.reshape(-1, channels), source_rate
+
+
+class ClipPlayback:
+    """一次片段播放的进度
+
+    由事件循环创建后交给一个音频回调线程（音板为采集回调，通知声音为播放回调），之后只有该线程推进播放位置。
+    每个音频块只从内存映射中切片读取所需的帧，不复制整个片段。
+    """
+
+    def __init__(self, samples: np.ndarray, volume: float = 1.0, name: Optional[str] = None, blocksize: int = 960):
+        self.samples = samples
+        self.volume = volume
+        self.name = name
+        self.position = 0
+        self._scratch = np.zeros(blocksize, dtype=np.float32)
+
+    @property
+    def finished(self) -> bool:
+        return self.position >= len(self.samples)
+
+    def mix_into(self, out: np.ndarray) -> int:
+        """把下一段帧叠加到out（一维），返回叠加的帧数"""
+        count = min(len(out), len(self.samples) - self.position)
+        if count <= 0:
+            return 0
+        chunk = self.samples[self.position:self.position + count]
+        if self.volume != 1.0:
+            if len(self._scratch) < count:
+                self._scratch = np.zeros(count, dtype=np.float32)
+            chunk = np.multiply(chunk, self.volume, out=self._scratch[:count])
+        np.add(out[:count], chunk, out=out[:count])
+        np.clip(out[:count], -1.0, 1.0, out=out[:count])
+        self.position += count
+        return count
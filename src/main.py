@@ -1,16 +1,24 @@
 import flet as ft
 import asyncio
+import functools
+import multiprocessing
 import numpy as np
 import os
+import time
 from config_loader import ConfigLoader
 from color_palette import *
 from audio_manager import AudioManager
 from network_manager import NetworkManager
-from message_manager import MessageManager
+from message_manager import MessageManager, fetch_missed_messages
 from ui_manager import UIManager
+from push_to_talk import PushToTalkKeyBinding
+from voice_notes import VoiceNoteRecorder
 
 # --- Configuration ---
 CONFIG_FILE = "storage/data/config.json"
+RECORDINGS_DIR = "storage/recordings"
+SOUNDBOARD_DIR = "storage/soundboard"
+SOUNDBOARD_TEST_TONE_KEY = "__test_tone__"
 config_loader = ConfigLoader(CONFIG_FILE)
 SERVER_ADDRESS = config_loader.get("server_address", "127.0.0.1")
 SERVER_PORT = config_loader.get("server_port", 5005)
@@ -30,6 +38,8 @@ current_text_channel_id = None
 current_voice_channel_id = None # ID of the voice channel user is actively (confirmed) in
 previewing_voice_channel_id = None # ID of voice channel being previewed
 is_actively_in_voice_channel = False # Has user clicked "Confirm Join"?
+audio_diagnostics_task = None # 诊断面板刷新任务（page.run_task返回的Future），同一时刻只有一个
+login_timing = None # 正在进行的登录计时：{'started_at', 'prewarmed'}，频道列表加载完成后清除
 
 # --- Voice Activity Detection (Client-side timeout for card color) ---
 user_last_voice_activity_time = {} # Stores user_id: timestamp
@@ -47,10 +57,14 @@ current_chat_messages_data = [] # Holds full dicts of current chat messages
 oldest_message_id_loaded = None # ID of the oldest message currently loaded
 has_more_older_messages_to_load = False # Flag if server indicates more older messages exist
 is_loading_older_messages = False # Flag to prevent duplicate load requests
+latest_message_id_by_channel = {} # channel_id: 已见过的最大消息ID，断线重连后据此只补齐缺失的消息
+missed_message_sync_from = {} # channel_id: 断线时的最大消息ID（重连后收到的消息会推进上面的记录，补齐要从这里开始）
 
 # --- Constants for message loading (client-side) ---
 INITIAL_MESSAGE_LOAD_COUNT = 20 # Matches server, but not strictly necessary for client to define if server controls initial load size
 OLDER_MESSAGE_LOAD_COUNT = 20   # Number of older messages to request each time
+MISSED_MESSAGE_PAGE_SIZE = 50   # 重连后补齐缺失消息时每页请求的条数
+MISSED_MESSAGE_MAX_PAGES = 10   # 断开太久时最多补齐的页数，超过则重新选择频道加载
 
 # 全局管理器实例
 ui_manager = None
@@ -89,10 +103,40 @@ async def main(page: ft.Page):
             
             ui_manager.update_channel_lists(text_channels_data, voice_channels_data)
             ui_manager.update_status_text("频道列表已加载。")
+            _finish_login_timing()
         else:
             print(f"获取频道列表失败: {channel_result.get('message')}")
             ui_manager.update_status_text(f"获取频道列表失败: {channel_result.get('message', '未知错误')}")
 
+    # --- 登录耗时 ---
+    def _finish_login_timing():
+        """记录从点击登录到频道列表加载完成（主界面可用）的时间"""
+        global login_timing
+        if login_timing is None:
+            return
+        timing, login_timing = login_timing, None
+        channels_ms = (time.perf_counter() - timing['started_at']) * 1000
+        network_manager.metrics.record('login_to_channels_ms', channels_ms)
+        network_manager.metrics.record_event('login_timing', prewarmed=timing['prewarmed'],
+                                             main_view_ms=timing.get('main_view_ms'), channels_ms=round(channels_ms, 1))
+        print(f"登录耗时: 主界面 {timing.get('main_view_ms')}ms，频道列表 {channels_ms:.0f}ms（连接预热: {timing['prewarmed']}）")
+
+    # --- 断线重连状态 ---
+    def on_socket_disconnect_handler():
+        print("Socket.IO断开连接")
+        if current_user_info:
+            # 记下断线时各频道的最大消息ID；多次断线而尚未补齐时保留最早的记录
+            for channel_id, message_id in latest_message_id_by_channel.items():
+                missed_message_sync_from.setdefault(channel_id, message_id)
+            ui_manager.update_status_text("与服务器的连接已断开，正在重新连接...")
+    
+    def on_reconnecting_handler(attempt, delay):
+        ui_manager.update_status_text(f"与服务器的连接已断开，{delay:.1f}秒后第{attempt}次重新连接...")
+    
+    async def on_session_restored_handler(report):
+        ui_manager.update_status_text(f"连接已恢复（{report['restore_ms'] / 1000:.1f}秒），已重新加入频道")
+        await sync_missed_messages()
+
     # --- Socket.IO 连接错误处理函数 ---
     def on_socket_connect_error_handler(error_data):
         """处理Socket.IO连接错误"""
@@ -116,9 +160,12 @@ async def main(page: ft.Page):
     async def on_new_message(data):
         """处理新消息事件"""
         global current_text_channel_id, current_chat_messages_data
+        if not (current_user_info and data.get('username') == current_user_info.get('username')):
+            audio_manager.play_notification_sound('message')
+        _note_latest_message_id(data.get('channel_id'), [data])
         if data.get('channel_id') == current_text_channel_id:
-            # 将新消息添加到内部数据列表
-            current_chat_messages_data.append(data)
+            # 将新消息添加到内部数据列表（补齐缺失消息时可能已经加入过）
+            _merge_chat_messages([data])
             # 更新消息UI
             _render_chat_messages()
 
@@ -164,6 +211,14 @@ async def main(page: ft.Page):
             return
 
         messages = data.get('messages', [])
+        _note_latest_message_id(channel_id, messages)
+        if current_chat_messages_data:
+            # 重连后重新加入频道时服务器会再次发送初始批次：合并而不是替换，保留已加载的较早消息
+            _merge_chat_messages(messages)
+            print(f"[HISTORY] 重新加入频道 {channel_id}，合并了 {len(messages)} 条历史消息")
+            _render_chat_messages()
+            if hasattr(page, 'update'): page.update()
+            return
         current_chat_messages_data = messages  # 用此初始批次替换当前数据
         has_more_older_messages_to_load = data.get('has_more_older', False)
         
@@ -205,6 +260,8 @@ async def main(page: ft.Page):
                     'mic_muted': False,
                     'is_card_speaking': False
                 }
+                if is_actively_in_voice_channel:
+                    audio_manager.play_notification_sound('user_join')
                 update_voice_channel_user_list_ui()
 
     async def on_user_left_voice(data):
@@ -212,8 +269,11 @@ async def main(page: ft.Page):
         channel_id_of_update = data.get('channel_id')
         if channel_id_of_update == previewing_voice_channel_id:
             user_id_left = data.get('user_id')
+            audio_manager.remove_voice_sender(str(user_id_left))
             if user_id_left in current_voice_channel_active_users:
                 del current_voice_channel_active_users[user_id_left]
+                if is_actively_in_voice_channel:
+                    audio_manager.play_notification_sound('user_leave')
                 # TODO: 实现语音活动定时器清理逻辑
                 update_voice_channel_user_list_ui()
 
@@ -272,6 +332,11 @@ async def main(page: ft.Page):
         if current_user_info and sender_user_id == current_user_info.get('id'):
             return
         
+        # 本地静音的用户：订阅变更生效前服务器仍可能转发，在任何解码之前直接丢弃
+        sender_key = str(sender_user_id)
+        if audio_manager.is_sender_locally_muted(sender_key):
+            return
+        
         # 检查是否是活跃语音频道中的用户
         if sender_user_id not in current_voice_channel_active_users:
             return
@@ -281,7 +346,8 @@ async def main(page: ft.Page):
         chunk_channels = data.get('channels', audio_manager.STANDARD_CHANNELS)
         chunk_dtype = data.get('dtype', 'float32')
         
-        if audio_chunk_list and isinstance(audio_chunk_list, list):
+        # websocket传来的是JSON列表，UDP传输传来的是已解码的数组
+        if audio_chunk_list is not None and len(audio_chunk_list) and isinstance(audio_chunk_list, (list, np.ndarray)):
             try:
                 # 更新用户的语音活动状态
                 if sender_user_id in current_voice_channel_active_users:
@@ -295,19 +361,12 @@ async def main(page: ft.Page):
                     # 启动或重置语音活动超时定时器
                     await _start_voice_activity_timeout_task(sender_user_id)
                 
-                # 转换音频数据为NumPy数组
-                audio_np_array = np.array(audio_chunk_list, dtype=np.float32)
-                
-                # 如果采样率不同，进行重采样
-                if chunk_samplerate != audio_manager.STANDARD_SAMPLERATE:
-                    print(f"重采样音频从 {chunk_samplerate}Hz 到 {audio_manager.STANDARD_SAMPLERATE}Hz")
-                    audio_np_array = audio_manager.resample_audio(audio_np_array, chunk_samplerate, audio_manager.STANDARD_SAMPLERATE)
+                # 只解码最响的N个说话人，其余的帧直接丢弃
+                if not audio_manager.accept_voice_frame(sender_key, data):
+                    return
                 
-                # 规范化音频数据
-                audio_np_array = audio_manager.normalize_audio_chunk(audio_np_array, volume_factor=1.0)
-                
-                # 添加到播放缓冲区
-                await audio_manager.add_audio_chunk_to_playback_buffer(audio_np_array)
+                # 交给解码线程池（含重采样、按用户音量与规范化），按到达顺序写入该发送者的混音缓冲区
+                audio_manager.submit_voice_frame(sender_key, audio_chunk_list, chunk_samplerate)
                 
             except Exception as e:
                 print(f"处理音频数据块时出错: {e}")
@@ -391,28 +450,53 @@ async def main(page: ft.Page):
             if hasattr(server_users_list_view, 'update'): server_users_list_view.update()
 
     # 音频数据发送处理函数
-    async def send_audio_data(audio_data):
+    async def send_audio_data(audio_data, rms=None, slot=None):
         """处理发送音频数据到服务器"""
         global current_voice_channel_id, sio_client, is_actively_in_voice_channel
         
+        # 发送块来自轮换池，不复制：网络层发出（走websocket时转换为JSON列表，走UDP时直接编码）或丢弃后归还
+        release = functools.partial(audio_manager.release_send_block, audio_data, slot)
         if not is_actively_in_voice_channel or current_voice_channel_id is None or not sio_client or not sio_client.connected:
+            release()
             return
         
         try:
-            # 将NumPy数组转换为列表以便通过JSON发送
-            audio_data_list = audio_data.tolist() if isinstance(audio_data, np.ndarray) else audio_data
-            
-            # 发送到服务器
-            await sio_client.emit('voice_data_stream', {
+            # 放入语音发送队列（经由UDP或独立的语音连接发送，不与聊天数据排队）
+            network_manager.queue_voice_event('voice_data_stream', {
                 'channel_id': current_voice_channel_id,
-                'audio_data': audio_data_list,
+                'audio_data': audio_data,
                 'samplerate': audio_manager.STANDARD_SAMPLERATE,  # 告诉服务器采样率
                 'channels': audio_manager.STANDARD_CHANNELS,      # 告诉服务器声道数
-                'dtype': 'float32'                              # 告诉服务器数据类型
-            })
+                'dtype': 'float32',                             # 告诉服务器数据类型
+                'rms': rms                                      # 块能量，接收端据此选择活跃说话人
+            }, on_sent=release)
         except Exception as e:
+            release()
             print(f"发送音频数据时出错: {e}")
 
+    async def send_echo_audio_data(audio_data, slot, sequence, client_time):
+        """回声测试：把带序号的帧发往服务器回声端点"""
+        try:
+            if not sio_client or not sio_client.connected:
+                return
+            network_manager.queue_voice_event('voice_echo', {
+                'sequence': sequence,
+                'client_time': client_time,
+                'audio_data': audio_data.tolist(),
+                'samplerate': audio_manager.STANDARD_SAMPLERATE,
+                'channels': audio_manager.STANDARD_CHANNELS,
+                'dtype': 'float32'
+            })
+        except Exception as e:
+            print(f"发送回声测试帧时出错: {e}")
+        finally:
+            # 已转换为列表，发送块可以立即归还
+            audio_manager.release_send_block(audio_data, slot)
+    
+    async def on_voice_echo_reply(data):
+        """回声测试回包"""
+        audio_manager.handle_echo_reply(data)
+
     # 定义频道点击处理函数
     def update_voice_panel_button_visibility():
         """更新语音面板按钮的可见性"""
@@ -463,12 +547,39 @@ async def main(page: ft.Page):
             # 根据麦克风状态确定图标
             mic_icon_name = ft.Icons.MIC_OFF if user_data.get('mic_muted', False) else ft.Icons.MIC
 
+            user_display_items = [
+                ft.Icon(name=mic_icon_name, color=user_card_icon_and_name_color, size=16),
+                ft.Text(user_data.get('username', 'Unknown'), color=user_card_icon_and_name_color, weight=ft.FontWeight.NORMAL, size=12, expand=True)
+            ]
+            
+            # 其他用户的本地静音和音量控制（只影响自己听到的声音）
+            card_user_id = user_data.get('id')
+            if card_user_id is not None and not (current_user_info and card_user_id == current_user_info.get('id')):
+                user_key = str(card_user_id)
+                is_locally_muted = audio_manager.is_sender_locally_muted(user_key)
+                user_display_items.append(ft.Slider(
+                    value=audio_manager.get_sender_volume(user_key),
+                    min=0,
+                    max=2,
+                    divisions=20,
+                    width=90,
+                    disabled=is_locally_muted,
+                    active_color=user_card_icon_and_name_color,
+                    tooltip="User volume",
+                    on_change_end=lambda e, key=user_key: handle_user_volume_change(key, e.control.value)
+                ))
+                user_display_items.append(ft.IconButton(
+                    icon=ft.Icons.VOLUME_OFF if is_locally_muted else ft.Icons.VOLUME_UP,
+                    icon_color=user_card_icon_and_name_color,
+                    icon_size=16,
+                    tooltip="Unmute for me" if is_locally_muted else "Mute for me",
+                    on_click=lambda e, key=user_key: page.run_task(handle_user_local_mute_toggle, key)
+                ))
+
             user_display_row = ft.Row(
-                [
-                    ft.Icon(name=mic_icon_name, color=user_card_icon_and_name_color, size=16),
-                    ft.Text(user_data.get('username', 'Unknown'), color=user_card_icon_and_name_color, weight=ft.FontWeight.NORMAL, size=12)
-                ],
+                user_display_items,
                 alignment=ft.MainAxisAlignment.START,
+                vertical_alignment=ft.CrossAxisAlignment.CENTER,
                 spacing=5,
             )
 
@@ -500,6 +611,42 @@ async def main(page: ft.Page):
         # 确保按钮状态正确
         update_voice_panel_button_visibility()
 
+    def save_voice_user_preferences():
+        """保存按用户的本地静音和音量设置"""
+        preferences = {}
+        for user_key in audio_manager.locally_muted_senders:
+            preferences.setdefault(user_key, {})['muted'] = True
+        for user_key, volume in audio_manager.sender_volumes.items():
+            preferences.setdefault(user_key, {})['volume'] = volume
+        config_loader.set("voice_user_preferences", preferences)
+        config_loader.save_config()
+
+    async def send_voice_subscription_update():
+        """告诉服务器不要再转发本地静音用户的语音帧（断线时只记下，重连后重放）"""
+        if not is_actively_in_voice_channel or current_voice_channel_id is None:
+            return
+        try:
+            await network_manager.emit_socketio('update_voice_subscription', {
+                'channel_id': current_voice_channel_id,
+                'muted_user_ids': sorted(audio_manager.locally_muted_senders)
+            })
+        except Exception as e:
+            print(f"发送语音订阅变更时出错: {e}")
+
+    async def handle_user_local_mute_toggle(user_key):
+        """本地静音/取消静音某个用户"""
+        muted = not audio_manager.is_sender_locally_muted(user_key)
+        audio_manager.set_sender_local_mute(user_key, muted)
+        print(f"本地{'静音' if muted else '取消静音'}用户: {user_key}")
+        save_voice_user_preferences()
+        update_voice_channel_user_list_ui()
+        await send_voice_subscription_update()
+
+    def handle_user_volume_change(user_key, volume):
+        """调整某个用户的本地播放音量"""
+        audio_manager.set_sender_volume(user_key, volume)
+        save_voice_user_preferences()
+
     def switch_middle_panel_view(view_type: str, channel_name: str = ""):
         """切换中间面板视图（文字或语音）"""
         is_text_view = view_type == "text"
@@ -525,6 +672,60 @@ async def main(page: ft.Page):
         # 切换视图后更新按钮可见性
         update_voice_panel_button_visibility()
 
+    def _message_id(msg_data):
+        return msg_data.get('message_id', msg_data.get('id'))
+
+    def _note_latest_message_id(channel_id, messages):
+        """记录频道中见过的最大消息ID"""
+        ids = [message_id for message_id in map(_message_id, messages) if message_id is not None]
+        if channel_id is None or not ids:
+            return
+        latest_message_id_by_channel[channel_id] = max(ids + [latest_message_id_by_channel.get(channel_id, ids[0])])
+
+    def _merge_chat_messages(messages):
+        """按消息ID去重后并入当前消息列表，保持时间顺序"""
+        global current_chat_messages_data
+        known_ids = {_message_id(msg) for msg in current_chat_messages_data}
+        new_messages = [msg for msg in messages if _message_id(msg) is None or _message_id(msg) not in known_ids]
+        if not new_messages:
+            return 0
+        last_id = _message_id(current_chat_messages_data[-1]) if current_chat_messages_data else None
+        current_chat_messages_data.extend(new_messages)
+        first_new_id = _message_id(new_messages[0])
+        if last_id is not None and first_new_id is not None and first_new_id < last_id:
+            # 补齐的消息早于断线后收到的实时消息，需要重新排序（没有ID的消息排在最后）
+            current_chat_messages_data.sort(key=lambda msg: (_message_id(msg) is None, _message_id(msg) or 0))
+        return len(new_messages)
+
+    async def sync_missed_messages():
+        """重连后补齐当前文字频道在断线期间缺失的消息"""
+        channel_id = current_text_channel_id
+        if channel_id is None:
+            missed_message_sync_from.clear()
+            return
+
+        def merge_page(messages):
+            if channel_id != current_text_channel_id:
+                return None
+            _note_latest_message_id(channel_id, messages)
+            return _merge_chat_messages(messages)
+
+        fetched = await fetch_missed_messages(
+            channel_id, missed_message_sync_from, network_manager.request_newer_messages, merge_page,
+            reload_text_channel, MISSED_MESSAGE_PAGE_SIZE, MISSED_MESSAGE_MAX_PAGES
+        )
+        if fetched and channel_id == current_text_channel_id:
+            _render_chat_messages()
+            if hasattr(page, 'update'): page.update()
+
+    async def reload_text_channel(channel_id):
+        """丢弃当前消息并重新加入文字频道，由服务器重新发送初始批次"""
+        global current_chat_messages_data, oldest_message_id_loaded, has_more_older_messages_to_load
+        current_chat_messages_data = []
+        oldest_message_id_loaded = None
+        has_more_older_messages_to_load = False
+        await network_manager.emit_socketio('join_text_channel', {'channel_id': channel_id})
+
     async def select_text_channel(page_ref: ft.Page, channel_id: int, channel_name: str):
         """选择文字频道"""
         global current_text_channel_id, current_chat_messages_data, oldest_message_id_loaded
@@ -553,12 +754,11 @@ async def main(page: ft.Page):
             chat_messages_view.controls.clear()
             if hasattr(chat_messages_view, 'update'): chat_messages_view.update()
             
-        # 向服务器发送加入文字频道的事件
-        if sio_client and sio_client.connected:
-            try:
-                await sio_client.emit('join_text_channel', {'channel_id': channel_id})
-            except Exception as e:
-                print(f"发送join_text_channel事件错误: {e}")
+        # 向服务器发送加入文字频道的事件（断线时也要记下，重连后加入的是这个频道）
+        try:
+            await network_manager.emit_socketio('join_text_channel', {'channel_id': channel_id})
+        except Exception as e:
+            print(f"发送join_text_channel事件错误: {e}")
 
         # 更新顶部栏，显示当前语音状态
         if is_actively_in_voice_channel and current_voice_channel_id:
@@ -678,18 +878,21 @@ async def main(page: ft.Page):
             channel_id_to_leave_on_server = current_voice_channel_id
             print(f"用户活跃在语音频道 {current_voice_channel_id}. 准备在服务器上离开.")
 
-        if sio_client and sio_client.connected and channel_id_to_leave_on_server is not None:
+        if channel_id_to_leave_on_server is not None:
             try:
                 print(f"客户端发送leave_voice_channel事件，channel_id: {channel_id_to_leave_on_server}")
-                await sio_client.emit('leave_voice_channel', {'channel_id': channel_id_to_leave_on_server})
+                await network_manager.emit_socketio('leave_voice_channel', {'channel_id': channel_id_to_leave_on_server})
             except Exception as e:
                 print(f"发送leave_voice_channel事件错误: {e}")
+        if was_actively_in_voice:
+            await network_manager.disconnect_voice_transport()
         
-        # 如果之前是活跃状态，停止音频流
+        # 如果之前是活跃状态，停止路由音频（设备保持预热时不关闭）
         if was_actively_in_voice:
-            await audio_manager.stop_audio_stream_if_running()
-            await audio_manager.stop_audio_playback_stream_if_running()
-            print("已停止音频流")
+            stop_audio_diagnostics()
+            await stop_voice_recording()
+            await audio_manager.detach_voice_route()
+            print("已停止语音路由")
 
         is_actively_in_voice_channel = False
         current_voice_channel_id = None  # 离开活跃状态时总是重置
@@ -762,43 +965,82 @@ async def main(page: ft.Page):
             current_voice_channel_text.value = f"Voice: {vc_name}"
             if hasattr(current_voice_channel_text, 'update'): current_voice_channel_text.update()
         
-        # 向服务器发送加入语音频道事件
-        if sio_client and sio_client.connected and current_voice_channel_id is not None:
+        # 向服务器发送加入语音频道事件（断线时只记下，重连后重放并建立语音传输）
+        if current_voice_channel_id is not None:
             try:
                 print(f"客户端发送join_voice_channel事件，channel_id: {current_voice_channel_id}")
-                await sio_client.emit('join_voice_channel', {'channel_id': current_voice_channel_id})
+                await network_manager.emit_socketio('join_voice_channel', {'channel_id': current_voice_channel_id})
             except Exception as e:
                 print(f"发送join_voice_channel事件错误: {e}")
+            # 为语音帧建立独立连接
+            if sio_client and sio_client.connected:
+                await network_manager.connect_voice_transport(current_voice_channel_id)
         
-        # 启动音频流处理
-        if audio_manager.selected_input_device_id is not None:
-            await audio_manager.start_audio_stream(page_ref, audio_manager.selected_input_device_id)
-            print(f"已启动音频输入流，设备ID: {audio_manager.selected_input_device_id}")
-        else:
+        # 开始路由音频（设备已预热时无需重新打开）
+        if audio_manager.selected_input_device_id is None:
             print("没有选择输入设备，无法启动音频流")
             ui_manager.update_status_text("请在设置中选择输入设备以发送语音")
-        
-        # 启动音频播放流
-        await audio_manager.start_audio_playback_stream(page_ref, audio_manager.selected_output_device_id)
+        await audio_manager.attach_voice_route(page_ref)
+        print(f"语音路由已启动，输入设备ID: {audio_manager.selected_input_device_id}，输出设备ID: {audio_manager.selected_output_device_id}")
         
         # 加入语音频道后，立即发送当前麦克风状态
-        if sio_client and sio_client.connected and current_voice_channel_id is not None:
+        if current_voice_channel_id is not None:
             try:
                 # 根据当前逻辑静音状态发送麦克风状态
                 is_unmuted = not audio_manager.is_logically_muted
                 print(f"发送初始麦克风状态: is_unmuted={is_unmuted}")
-                await sio_client.emit('user_microphone_status', {
+                await network_manager.emit_socketio('user_microphone_status', {
                     'channel_id': current_voice_channel_id,
                     'is_unmuted': is_unmuted
                 })
             except Exception as e:
                 print(f"发送麦克风状态错误: {e}")
         
+        populate_soundboard_clips()
+        
+        # 恢复本地静音用户的订阅设置
+        if audio_manager.locally_muted_senders:
+            await send_voice_subscription_update()
+        
         # 更新UI元素
         update_voice_channel_user_list_ui()
         if hasattr(page_ref, 'update'): page_ref.update()
         print(f"成功加入语音频道: {vc_name} (ID: {current_voice_channel_id})")
 
+        # 启动诊断面板刷新任务
+        start_audio_diagnostics(page_ref)
+
+    def start_audio_diagnostics(page_ref: ft.Page):
+        """启动诊断面板刷新任务（已有任务时先取消，快速离开再加入不会留下重复的任务）"""
+        global audio_diagnostics_task
+        stop_audio_diagnostics()
+        audio_diagnostics_task = page_ref.run_task(update_audio_diagnostics_loop)
+
+    def stop_audio_diagnostics():
+        global audio_diagnostics_task
+        if audio_diagnostics_task is not None:
+            audio_diagnostics_task.cancel()
+            audio_diagnostics_task = None
+
+    async def update_audio_diagnostics_loop():
+        """在语音频道中定期刷新诊断面板（读取采集回调已发布的特征，不重复计算）"""
+        diagnostics_text = ui_manager.get_control('voice_settings_diagnostics_text')
+        if not diagnostics_text:
+            return
+
+        def to_dbfs(value):
+            return f"{20 * np.log10(value):.1f} dBFS" if value > 0 else "-inf dBFS"
+
+        while is_actively_in_voice_channel:
+            features = audio_manager.get_audio_features()
+            if features and features['frames']:
+                zero_crossing_rate = features['zero_crossings'] / features['frames']
+                diagnostics_text.value = f"RMS {to_dbfs(features['rms'])} | Peak {to_dbfs(features['peak'])} | ZCR {zero_crossing_rate:.2f}"
+            else:
+                diagnostics_text.value = "RMS -- | Peak -- | ZCR --"
+            if hasattr(diagnostics_text, 'update'): diagnostics_text.update()
+            await asyncio.sleep(0.2)  # 每200ms刷新一次
+
     async def handle_leave_voice_click(page_ref: ft.Page):
         """处理离开语音按钮点击"""
         global is_actively_in_voice_channel, current_voice_channel_id, previewing_voice_channel_id
@@ -816,16 +1058,17 @@ async def main(page: ft.Page):
 
         print(f"离开语音频道: {channel_name_being_left} (ID: {channel_id_being_left})")
 
-        # 向服务器发送离开语音频道事件
-        if sio_client and sio_client.connected:
-            try:
-                await sio_client.emit('leave_voice_channel', {'channel_id': channel_id_being_left})
-            except Exception as e:
-                print(f"发送leave_voice_channel事件错误: {e}")
+        # 向服务器发送离开语音频道事件（断线时也要记下，重连后不再重新加入）
+        try:
+            await network_manager.emit_socketio('leave_voice_channel', {'channel_id': channel_id_being_left})
+        except Exception as e:
+            print(f"发送leave_voice_channel事件错误: {e}")
+        await network_manager.disconnect_voice_transport()
 
-        # 停止音频流
-        await audio_manager.stop_audio_stream_if_running()
-        await audio_manager.stop_audio_playback_stream_if_running()
+        # 停止录音和路由音频（设备保持预热时不关闭）
+        stop_audio_diagnostics()
+        await stop_voice_recording()
+        await audio_manager.detach_voice_route()
         
         is_actively_in_voice_channel = False
         # current_voice_channel_id现在为None（不再主动加入）
@@ -854,7 +1097,50 @@ async def main(page: ft.Page):
     # 设置页面事件循环供AudioManager使用
     audio_manager.set_page_loop(asyncio.get_event_loop())
     
+    # 音频设备在切换频道时保持打开
+    audio_manager.keep_streams_warm = config_loader.get("keep_audio_streams_warm", True)
+    
+    # 可选：设备回调运行在独立子进程中，不受界面重建占用GIL的影响
+    if config_loader.get("audio_engine_process", False):
+        await audio_manager.enable_engine_process()
+    
+    # 设备故障时按优先级尝试的备用设备名称
+    audio_manager.fallback_input_device_names = config_loader.get("audio_fallback_input_devices", [])
+    audio_manager.fallback_output_device_names = config_loader.get("audio_fallback_output_devices", [])
+    
+    # 每个设备组合的延迟校准结果
+    audio_manager.latency_profiles = config_loader.get("audio_latency_profiles", {})
+    
+    # 大频道中只同时播放最响的几个说话人
+    audio_manager.set_max_active_speakers(config_loader.get("voice_max_active_speakers", 3))
+    audio_manager.soundboard_volume = config_loader.get("soundboard_volume", 1.0)
+    
+    # 通知声音混入语音输出流，预先解码到内存
+    audio_manager.notification_sounds_enabled = config_loader.get("notification_sounds_enabled", True)
+    audio_manager.notification_volume = config_loader.get("notification_sound_volume", 0.5)
+    await audio_manager.preload_notification_sounds(config_loader.get("notification_sound_files", {}))
+    
+    # 按用户的本地静音和音量
+    for user_key, preference in config_loader.get("voice_user_preferences", {}).items():
+        audio_manager.set_sender_local_mute(user_key, preference.get('muted', False))
+        audio_manager.set_sender_volume(user_key, preference.get('volume', 1.0))
+    
+    # 语音输入模式与按键说话绑定
+    audio_manager.set_voice_input_mode(
+        config_loader.get("voice_input_mode", AudioManager.VOICE_MODE_ACTIVATION),
+        release_tail_seconds=config_loader.get("push_to_talk_release_tail", AudioManager.PTT_RELEASE_TAIL_SECONDS),
+        pre_roll_seconds=config_loader.get("push_to_talk_pre_roll", AudioManager.PTT_PRE_ROLL_SECONDS)
+    )
+    push_to_talk_binding = PushToTalkKeyBinding(
+        on_change=audio_manager.set_push_to_talk_pressed,
+        key_name=config_loader.get("push_to_talk_key", PushToTalkKeyBinding.DEFAULT_KEY)
+    )
+    
     # --- 创建SSL上下文和HTTP会话 ---
+    # 可选：Socket.IO和HTTP运行在独立线程的事件循环中，页面更新不会推迟socket读取和心跳
+    if config_loader.get("network_dedicated_loop", False):
+        network_manager.start_network_loop()
+    
     # 不再自己创建共享会话，让NetworkManager管理它
     await network_manager.create_http_session()
     await network_manager.create_socketio_client()
@@ -863,20 +1149,22 @@ async def main(page: ft.Page):
     shared_aiohttp_session = network_manager.shared_aiohttp_session
     sio_client = network_manager.sio_client
     
-    # 手动注册Socket.IO事件处理函数
-    if sio_client:
-        sio_client.on('older_messages_loaded', older_messages_loaded)
-        sio_client.on('load_historical_messages', load_historical_messages)
+    # 这两个事件的处理函数定义在main中，同样经由NetworkManager投递（独立网络线程时保证在UI事件循环中执行）
+    network_manager.set_callback('on_older_messages_loaded', older_messages_loaded)
+    network_manager.set_callback('on_load_historical_messages', load_historical_messages)
     
     # --- 设置管理器之间的回调函数 ---
     # AudioManager回调
     audio_manager.set_callback('update_mic_test_bar', _update_mic_test_bar_callback)
     audio_manager.set_callback('send_audio_data', send_audio_data)
+    audio_manager.set_callback('send_echo_audio_data', send_echo_audio_data)
     audio_manager.set_callback('on_speaking_status_change', _update_speaking_status_async)
     
     # NetworkManager回调
     network_manager.set_callback('on_socket_connect', on_socket_connect_handler)
-    network_manager.set_callback('on_socket_disconnect', lambda: print("Socket.IO断开连接"))
+    network_manager.set_callback('on_socket_disconnect', on_socket_disconnect_handler)
+    network_manager.set_callback('on_reconnecting', on_reconnecting_handler)
+    network_manager.set_callback('on_session_restored', on_session_restored_handler)
     network_manager.set_callback('on_socket_connect_error', on_socket_connect_error_handler)
     network_manager.set_callback('on_new_message', on_new_message)
     network_manager.set_callback('on_voice_channel_users', on_voice_channel_users)
@@ -886,6 +1174,7 @@ async def main(page: ft.Page):
     network_manager.set_callback('on_user_mic_status_updated', on_user_mic_status_updated)
     network_manager.set_callback('on_user_voice_activity', on_user_voice_activity)
     network_manager.set_callback('on_voice_data_stream_chunk', on_voice_data_stream_chunk)
+    network_manager.set_callback('on_voice_echo_reply', on_voice_echo_reply)
     network_manager.set_callback('on_server_user_list_update', on_server_user_list_update)
     
     # MessageManager回调
@@ -947,6 +1236,8 @@ async def main(page: ft.Page):
             return
 
         ui_manager.update_status_text("正在登录...")
+        global login_timing
+        login_timing = {'started_at': time.perf_counter(), 'prewarmed': network_manager.prewarmed_host is not None}
         
         try:
             # 使用NetworkManager进行登录
@@ -958,6 +1249,9 @@ async def main(page: ft.Page):
                 
                 ui_manager.set_control_value('top_bar_username_text', f"用户: {username}")
                 ui_manager.show_view('main_app_view')
+                main_view_ms = (time.perf_counter() - login_timing['started_at']) * 1000
+                login_timing['main_view_ms'] = round(main_view_ms, 1)
+                network_manager.metrics.record('login_to_main_view_ms', main_view_ms)
                 ui_manager.update_status_text("登录成功！正在连接服务...")
                 
                 # 保存登录信息（如果选择了"记住我"）
@@ -981,13 +1275,19 @@ async def main(page: ft.Page):
                     # 加载音频设备
                     print("正在初始化音频设备...")
                     await populate_audio_devices()
+                    
+                    # 可选：登录后立即预热音频设备，加入频道时无需等待设备打开
+                    if config_loader.get("prewarm_audio_on_login", False):
+                        page.run_task(audio_manager.prewarm_streams, page)
                 else:
                     print("错误：无法连接Socket.IO，用户信息未初始化")
                     ui_manager.update_status_text("登录凭据错误或Socket客户端问题")
 
             else:
+                    login_timing = None
                     ui_manager.update_status_text(f"登录失败: {result.get('message', '未知错误')}")
         except Exception as e:
+                login_timing = None
                 ui_manager.update_status_text(f"登录错误: {str(e)}")
     
     async def handle_register(e):
@@ -1057,6 +1357,10 @@ async def main(page: ft.Page):
             shared_aiohttp_session = network_manager.shared_aiohttp_session
             sio_client = network_manager.sio_client
             
+            # 新服务器的连接也在登录界面预热
+            if config_loader.get("prewarm_connection_on_login_view", False):
+                page.run_task(network_manager.prewarm_connections)
+            
             # 2秒后返回登录页面
             await asyncio.sleep(2)
             ui_manager.show_view('login_view')
@@ -1070,11 +1374,17 @@ async def main(page: ft.Page):
         """处理登出"""
         global current_user_info
         
-        # 断开Socket.IO连接
-        if network_manager.sio_client and network_manager.sio_client.connected:
-            page.run_task(network_manager.disconnect_socketio)
+        # 清空会话状态并断开Socket.IO连接（断线重连中也要停止重连）
+        page.run_task(network_manager.end_session)
+        
+        # 关闭预热的音频设备并停止设备监视（在事件循环中执行）
+        async def release_audio_devices():
+            audio_manager.stop_device_watcher()
+            await audio_manager.release_streams()
+        page.run_task(release_audio_devices)
         
         current_user_info = None
+        missed_message_sync_from.clear()
         ui_manager.show_view('login_view')
         ui_manager.update_status_text("已登出")
         
@@ -1100,6 +1410,29 @@ async def main(page: ft.Page):
     # 聊天消息相关功能
     def _create_chat_message_control(msg_data):
         """创建单个聊天消息控件"""
+        voice_note = msg_data.get('voice_note')
+        if voice_note and voice_note.get('note_id'):
+            note_id = voice_note['note_id']
+            is_playing = message_manager.playing_voice_note_id == note_id
+            return ft.Row(
+                [
+                    ft.Text(
+                        f"[{msg_data.get('timestamp')}] {msg_data.get('username', 'Unknown')}:",
+                        font_family="Consolas",
+                        color=COLOR_TEXT_ON_WHITE
+                    ),
+                    ft.IconButton(
+                        icon=ft.Icons.STOP_CIRCLE_OUTLINED if is_playing else ft.Icons.PLAY_CIRCLE_OUTLINE,
+                        icon_color=COLOR_PRIMARY,
+                        icon_size=18,
+                        tooltip="Play voice message",
+                        on_click=lambda e, nid=note_id: page.run_task(handle_play_voice_note, nid)
+                    ),
+                    ft.Text(f"{voice_note.get('duration_ms', 0) / 1000:.1f}s", color=COLOR_TEXT_ON_WHITE, size=12)
+                ],
+                spacing=4,
+                vertical_alignment=ft.CrossAxisAlignment.CENTER
+            )
         return ft.Text(
             f"[{msg_data.get('timestamp')}] {msg_data.get('username', 'Unknown')}: {msg_data.get('content')}",
             selectable=True,
@@ -1154,7 +1487,7 @@ async def main(page: ft.Page):
         if hasattr(page, 'update'): page.update()
 
         try:
-            await sio_client.emit('request_older_messages', {
+            await network_manager.emit_socketio('request_older_messages', {
                 'channel_id': current_text_channel_id,
                 'before_message_id': oldest_message_id_loaded,
                 'limit': OLDER_MESSAGE_LOAD_COUNT
@@ -1175,7 +1508,7 @@ async def main(page: ft.Page):
             return
         
         try:
-            await sio_client.emit('send_message', {
+            await network_manager.emit_socketio('send_message', {
                 'channel_id': current_text_channel_id,
                 'message': message_content
             })
@@ -1186,6 +1519,72 @@ async def main(page: ft.Page):
             print(f"发送消息失败: {e}")
             ui_manager.update_status_text(f"发送消息失败: {str(e)}")
     
+    # 文字频道语音消息：按住录制，录制过程中分块上传，松开后只需完成最后一个分块
+    voice_note_state = {'recorder': None, 'channel_id': None, 'pressed': False}
+    
+    async def start_voice_note_recording():
+        if voice_note_state['recorder'] is not None or not current_text_channel_id:
+            return
+        recorder = VoiceNoteRecorder(
+            audio_manager.STANDARD_SAMPLERATE,
+            create_note=network_manager.create_voice_note,
+            upload_chunk=network_manager.upload_voice_note_chunk
+        )
+        voice_note_state['recorder'] = recorder
+        voice_note_state['channel_id'] = current_text_channel_id
+        if not await audio_manager.start_voice_note(page, recorder):
+            voice_note_state['recorder'] = None
+            ui_manager.update_status_text("无法打开麦克风录制语音消息")
+            return
+        ui_manager.update_status_text("正在录制语音消息，松开发送...")
+        if not voice_note_state['pressed']:
+            # 打开麦克风期间已经松开
+            await finish_voice_note_recording()
+    
+    async def finish_voice_note_recording():
+        recorder = voice_note_state['recorder']
+        if recorder is None or audio_manager.voice_note_recorder is not recorder:
+            return
+        voice_note_state['recorder'] = None
+        await audio_manager.stop_voice_note()
+        if recorder.duration_ms < 300:
+            await recorder.cancel()
+            ui_manager.update_status_text("语音消息太短，已取消")
+            return
+        try:
+            info = await recorder.finish()
+            result = await network_manager.complete_voice_note(
+                info['note_id'], voice_note_state['channel_id'], info['duration_ms'], info['chunks']
+            )
+        except Exception as ex:
+            print(f"发送语音消息失败: {ex}")
+            ui_manager.update_status_text(f"发送语音消息失败: {ex}")
+            return
+        if result.get("success"):
+            ui_manager.update_status_text(f"语音消息已发送 ({info['duration_ms'] / 1000:.1f}s, {info['bytes'] / 1024:.0f}KB)")
+        else:
+            ui_manager.update_status_text(result.get("message", "发送语音消息失败"))
+    
+    def handle_voice_note(pressed):
+        """语音消息按钮按下/松开"""
+        if pressed == voice_note_state['pressed']:
+            return
+        voice_note_state['pressed'] = pressed
+        page.run_task(start_voice_note_recording if pressed else finish_voice_note_recording)
+    
+    async def handle_play_voice_note(note_id):
+        """播放/停止语音消息"""
+        await message_manager.play_voice_note(network_manager, audio_manager, page, note_id)
+    
+    def handle_voice_note_playback_finished(note_id):
+        _render_chat_messages()
+    
+    def handle_voice_note_playback_error(note_id, message):
+        ui_manager.update_status_text(message)
+    
+    message_manager.set_callback('on_voice_note_playback_finished', handle_voice_note_playback_finished)
+    message_manager.set_callback('on_voice_note_playback_error', handle_voice_note_playback_error)
+    
     # 设置UI回调
     ui_manager.set_callback('on_login', handle_login)
     ui_manager.set_callback('on_show_register', show_register_view)
@@ -1195,6 +1594,7 @@ async def main(page: ft.Page):
     ui_manager.set_callback('on_save_server_config', handle_save_server_config)
     ui_manager.set_callback('on_logout', handle_logout)
     ui_manager.set_callback('on_send_message', handle_send_message)
+    ui_manager.set_callback('on_voice_note', handle_voice_note)
     
     # 音频设备相关函数
     async def populate_audio_devices():
@@ -1230,8 +1630,8 @@ async def main(page: ft.Page):
         
         # 从AudioManager获取设备列表
         try:
-            # 使用同步方法获取设备列表
-            input_devices, output_devices = audio_manager.get_audio_devices_sync()
+            # 在音频引擎线程中枚举设备（结果会被缓存），不阻塞事件循环
+            input_devices, output_devices = await audio_manager.get_audio_devices()
             
             print(f"找到输入设备: {len(input_devices)}个")
             print(f"找到输出设备: {len(output_devices)}个")
@@ -1312,22 +1712,87 @@ async def main(page: ft.Page):
             
         if hasattr(page, 'update'): page.update()
         
+        # 之后只在设备集合变化时增量更新下拉框
+        audio_manager.start_device_watcher()
+    
+    async def handle_audio_devices_changed(diff):
+        """设备热插拔：按差异增量更新下拉框，而不是重建
+
+        重新扫描后PortAudio的设备索引可能整体移动：仍然存在的设备按(名称, host API)对应到新索引，
+        选中的设备随之映射过去，只有真正被拔出时才回退到默认设备。
+        """
+        for kind, dropdown_name in (('input', 'voice_settings_input_device_dropdown'), ('output', 'voice_settings_output_device_dropdown')):
+            dropdown = ui_manager.get_control(dropdown_name)
+            if not dropdown:
+                continue
+            kind_diff = diff.get(kind, {})
+            removed_keys = {str(d['id']) for d in kind_diff.get('removed', [])}
+            updated_by_old_key = {str(d['old_id']): d for d in kind_diff.get('updated', [])}
+            added_devices = kind_diff.get('added', [])
+            if not removed_keys and not updated_by_old_key and not added_devices:
+                continue
+            
+            # 下拉框的key都是旧索引，一次遍历完成移除和重新映射，避免新旧索引混淆；
+            # 同时去掉"未找到设备"之类的占位项
+            options = []
+            for option in dropdown.options:
+                if option.key in removed_keys or option.key == "-1":
+                    continue
+                device = updated_by_old_key.get(option.key)
+                options.append(ft.dropdown.Option(key=str(device['id']), text=device['name']) if device else option)
+            options.extend(ft.dropdown.Option(key=str(device['id']), text=device['name']) for device in added_devices)
+            # 默认设备可能变了，保持"(Default)"项在最前
+            options.sort(key=lambda option: not (option.text or "").startswith("(Default)"))
+            dropdown.options = options
+            
+            if dropdown.value in updated_by_old_key:
+                # 设备还在，只是索引变了：打开的流在重新扫描时已按名称重新打开，这里只更新选择
+                new_device_id = updated_by_old_key[dropdown.value]['id']
+                dropdown.value = str(new_device_id)
+                if kind == 'input':
+                    audio_manager.selected_input_device_id = new_device_id
+                else:
+                    audio_manager.selected_output_device_id = new_device_id
+            elif dropdown.value in removed_keys or dropdown.value == "-1" or dropdown.value is None:
+                # 当前选中的设备被移除时回退到默认设备
+                fallback = dropdown.options[0] if dropdown.options else None
+                dropdown.value = fallback.key if fallback else None
+                new_device_id = int(fallback.key) if fallback else None
+                print(f"{kind}设备已移除，回退到: {new_device_id}")
+                if kind == 'input':
+                    await audio_manager.switch_input_device(page, new_device_id)
+                else:
+                    await audio_manager.switch_output_device(page, new_device_id)
+            
+            if hasattr(dropdown, 'update'): dropdown.update()
+    
+    async def handle_audio_device_failover(stream_name, device_id):
+        """音频流自动故障转移后同步下拉框（流已在新设备上运行，不再触发切换）"""
+        is_capture = stream_name == AudioManager.STREAM_CAPTURE
+        dropdown = ui_manager.get_control('voice_settings_input_device_dropdown' if is_capture else 'voice_settings_output_device_dropdown')
+        if dropdown and dropdown.options:
+            keys = [option.key for option in dropdown.options]
+            dropdown.value = str(device_id) if str(device_id) in keys else keys[0]
+            if hasattr(dropdown, 'update'): dropdown.update()
+        device_label = "麦克风" if is_capture else "扬声器"
+        ui_manager.update_status_text(f"{device_label}出现故障，已自动切换到备用设备")
+        
     # 音频设备变更处理
     async def handle_input_device_change(e):
         """处理输入设备变更"""
         new_device_id = int(e.control.value) if e.control.value and e.control.value != "-1" else None
-        audio_manager.selected_input_device_id = new_device_id
         print(f"选择了输入设备ID: {new_device_id}")
         
-        # TODO: 如果在语音频道中，重启音频流
+        # 如果采集流正在运行，在音频引擎线程中切换设备，不阻塞事件循环
+        await audio_manager.switch_input_device(page, new_device_id)
         
     async def handle_output_device_change(e):
         """处理输出设备变更"""
         new_device_id = int(e.control.value) if e.control.value and e.control.value != "-1" else None
-        audio_manager.selected_output_device_id = new_device_id
         print(f"选择了输出设备ID: {new_device_id}")
         
-        # TODO: 如果在语音频道中，重启音频播放
+        # 如果播放流正在运行，在音频引擎线程中切换设备，不阻塞事件循环
+        await audio_manager.switch_output_device(page, new_device_id)
         
     async def handle_save_audio_settings(e):
         """保存音频设置"""
@@ -1341,10 +1806,167 @@ async def main(page: ft.Page):
         print(f"音频设置已保存。输入ID: {input_id}, 输出ID: {output_id}")
         ui_manager.update_status_text("音频设置已保存")
         
+    async def handle_calibrate_latency(e):
+        """校准当前设备组合的块大小和延迟，并保存到配置文件"""
+        calibrate_button = ui_manager.get_control('voice_settings_calibrate_button')
+        if audio_manager.is_mic_testing:
+            ui_manager.update_status_text("请先停止麦克风测试再校准")
+            return
+        
+        if calibrate_button:
+            calibrate_button.disabled = True
+            calibrate_button.text = "Calibrating..."
+            if hasattr(calibrate_button, 'update'): calibrate_button.update()
+        ui_manager.update_status_text("正在校准音频延迟，期间语音将暂时中断...")
+        try:
+            profile = await audio_manager.calibrate_latency(page)
+        finally:
+            if calibrate_button:
+                calibrate_button.disabled = False
+                calibrate_button.text = "Calibrate Latency"
+                if hasattr(calibrate_button, 'update'): calibrate_button.update()
+        
+        if profile:
+            config_loader.set("audio_latency_profiles", audio_manager.latency_profiles)
+            config_loader.save_config()
+            ui_manager.update_status_text(
+                f"校准完成: {profile['block_ms']}ms块, 约{profile['total_latency_ms']:.0f}ms延迟"
+            )
+        
+    async def handle_echo_test(e):
+        """端到端回声测试：判断通话质量问题出在网络还是设备"""
+        if audio_manager.is_mic_testing:
+            ui_manager.update_status_text("请先停止麦克风测试再进行回声测试")
+            return
+        if not sio_client or not sio_client.connected:
+            ui_manager.update_status_text("未连接到服务器，无法进行回声测试")
+            return
+        
+        echo_test_button = ui_manager.get_control('voice_settings_echo_test_button')
+        if echo_test_button:
+            echo_test_button.disabled = True
+            if hasattr(echo_test_button, 'update'): echo_test_button.update()
+        ui_manager.update_status_text("正在进行回声测试，请对着麦克风说话（测试期间你的声音不会发送到频道）...")
+        try:
+            report = await audio_manager.run_echo_test(page)
+        finally:
+            if echo_test_button:
+                echo_test_button.disabled = False
+                if hasattr(echo_test_button, 'update'): echo_test_button.update()
+        
+        if not report:
+            ui_manager.update_status_text("回声测试未能启动")
+            return
+        if report['received'] == 0:
+            ui_manager.update_status_text("回声测试: 没有收到回包（服务器可能不支持回声测试或网络中断）")
+            return
+        
+        verdict_text = {
+            'ok': "网络和设备均正常",
+            'network': "问题在网络",
+            'device': "问题在本地音频设备",
+            'network+device': "网络和设备都有问题"
+        }[report['verdict']]
+        ui_manager.update_status_text(
+            f"回声测试: {verdict_text} | 嘴到耳约{report['mouth_to_ear_ms']:.0f}ms | "
+            f"RTT p50/p95/p99 {report['rtt_p50_ms']:.0f}/{report['rtt_p95_ms']:.0f}/{report['rtt_p99_ms']:.0f}ms | "
+            f"丢包{report['loss'] * 100:.1f}% | 抖动{report['jitter_ms']:.1f}ms | 设备{report['device_latency_ms']:.0f}ms"
+        )
+        
+    def update_record_button():
+        record_button = ui_manager.get_control('voice_record_button')
+        if record_button:
+            record_button.text = "Stop Recording" if audio_manager.is_recording else "Record"
+            record_button.icon = ft.Icons.STOP if audio_manager.is_recording else ft.Icons.FIBER_MANUAL_RECORD
+            if hasattr(record_button, 'update'): record_button.update()
+    
+    async def stop_voice_recording():
+        """停止录音并显示写入统计"""
+        stats = await audio_manager.stop_recording()
+        if stats is None:
+            return
+        update_record_button()
+        if stats['write_error']:
+            ui_manager.update_status_text(f"录音写入失败: {stats['write_error']}")
+        else:
+            ui_manager.update_status_text(
+                f"录音已保存: {stats['path']} ({stats['seconds_recorded']:.0f}s, "
+                f"{stats['throughput_bytes_per_second'] / 1024:.0f}KB/s, "
+                f"缓冲区最高占用{stats['max_buffer_occupancy'] * 100:.0f}%, 丢弃{stats['dropped_samples']}个样本)"
+            )
+    
+    async def handle_record_toggle(e):
+        """开始/停止录制当前语音频道"""
+        if audio_manager.is_recording:
+            await stop_voice_recording()
+            return
+        if not is_actively_in_voice_channel:
+            ui_manager.update_status_text("请先加入语音频道再录音")
+            return
+        
+        file_format = config_loader.get("recording_format", "wav")
+        file_name = f"voice_{time.strftime('%Y%m%d_%H%M%S')}.{file_format}"
+        path = os.path.join(config_loader.get("recording_directory", RECORDINGS_DIR), file_name)
+        try:
+            await audio_manager.start_recording(
+                path,
+                include_mic=config_loader.get("recording_include_mic", True),
+                file_format=file_format
+            )
+        except Exception as e:
+            print(f"开始录音失败: {e}")
+            ui_manager.update_status_text(f"开始录音失败: {e}")
+            return
+        update_record_button()
+        ui_manager.update_status_text(f"正在录音: {path}")
+        
+    def populate_soundboard_clips():
+        """列出音板目录中的片段（另附一个测试音）"""
+        dropdown = ui_manager.get_control('soundboard_clip_dropdown')
+        if not dropdown:
+            return
+        soundboard_dir = config_loader.get("soundboard_directory", SOUNDBOARD_DIR)
+        options = [ft.dropdown.Option(key=SOUNDBOARD_TEST_TONE_KEY, text="Test tone (440 Hz)")]
+        try:
+            for file_name in sorted(os.listdir(soundboard_dir)):
+                if file_name.lower().endswith(('.wav', '.flac', '.ogg', '.mp3')):
+                    options.append(ft.dropdown.Option(key=os.path.join(soundboard_dir, file_name), text=file_name))
+        except FileNotFoundError:
+            pass
+        dropdown.options = options
+        if dropdown.value not in [option.key for option in options]:
+            dropdown.value = SOUNDBOARD_TEST_TONE_KEY
+        if hasattr(dropdown, 'update'): dropdown.update()
+    
+    async def handle_soundboard_play(e):
+        """把选中的片段播放到语音频道"""
+        dropdown = ui_manager.get_control('soundboard_clip_dropdown')
+        clip_key = dropdown.value if dropdown else None
+        if not clip_key:
+            return
+        try:
+            played = await audio_manager.play_clip(None if clip_key == SOUNDBOARD_TEST_TONE_KEY else clip_key)
+        except Exception as ex:
+            print(f"播放音板片段失败: {ex}")
+            ui_manager.update_status_text(f"播放片段失败: {ex}")
+            return
+        if not played:
+            ui_manager.update_status_text("请先加入语音频道再播放片段")
+    
+    def handle_soundboard_stop(e):
+        audio_manager.stop_clip()
+        
     # 注册音频设备相关回调
     ui_manager.set_callback('on_input_device_change', handle_input_device_change)
     ui_manager.set_callback('on_output_device_change', handle_output_device_change)
     ui_manager.set_callback('on_save_audio_settings', handle_save_audio_settings)
+    ui_manager.set_callback('on_calibrate_latency', handle_calibrate_latency)
+    ui_manager.set_callback('on_echo_test', handle_echo_test)
+    ui_manager.set_callback('on_record_toggle', handle_record_toggle)
+    ui_manager.set_callback('on_soundboard_play', handle_soundboard_play)
+    ui_manager.set_callback('on_soundboard_stop', handle_soundboard_stop)
+    audio_manager.set_callback('on_audio_devices_changed', handle_audio_devices_changed)
+    audio_manager.set_callback('on_audio_device_failover', handle_audio_device_failover)
     
     # 麦克风测试相关函数
     async def handle_mic_test(e):
@@ -1463,15 +2085,15 @@ async def main(page: ft.Page):
         """向服务器发送麦克风状态更新"""
         global sio_client, current_voice_channel_id, is_actively_in_voice_channel
         
-        # 如果不在语音频道中或Socket.IO未连接，不发送状态
-        if not is_actively_in_voice_channel or current_voice_channel_id is None or not sio_client or not sio_client.connected:
+        # 如果不在语音频道中，不发送状态（断线时只记下，重连后重放最新的状态）
+        if not is_actively_in_voice_channel or current_voice_channel_id is None:
             return
         
         try:
             # 发送麦克风状态
             is_unmuted = not audio_manager.is_logically_muted
             print(f"向服务器发送麦克风状态: is_unmuted={is_unmuted}")
-            await sio_client.emit('user_microphone_status', {
+            await network_manager.emit_socketio('user_microphone_status', {
                 'channel_id': current_voice_channel_id,
                 'is_unmuted': is_unmuted
             })
@@ -1479,10 +2101,48 @@ async def main(page: ft.Page):
             print(f"发送麦克风状态错误: {e}")
             ui_manager.update_status_text(f"更新麦克风状态失败: {str(e)}")
     
+    # 按键说话相关功能
+    def apply_push_to_talk_mode(refresh_ui: bool = True):
+        """根据当前语音输入模式同步按键监听和UI"""
+        is_push_to_talk = audio_manager.voice_input_mode == AudioManager.VOICE_MODE_PUSH_TO_TALK
+        if is_push_to_talk:
+            push_to_talk_binding.start()
+        else:
+            push_to_talk_binding.stop()
+        
+        ptt_switch = ui_manager.get_control('voice_settings_ptt_switch')
+        ptt_button = ui_manager.get_control('voice_settings_ptt_button')
+        if ptt_switch:
+            ptt_switch.value = is_push_to_talk
+            ptt_switch.label = f"Push to Talk ({push_to_talk_binding.key_name})"
+            if refresh_ui and hasattr(ptt_switch, 'update'): ptt_switch.update()
+        if ptt_button:
+            ptt_button.visible = is_push_to_talk
+            if refresh_ui and hasattr(ptt_button, 'update'): ptt_button.update()
+    
+    async def handle_push_to_talk_mode_change(e):
+        """处理按键说话开关切换"""
+        mode = AudioManager.VOICE_MODE_PUSH_TO_TALK if e.control.value else AudioManager.VOICE_MODE_ACTIVATION
+        audio_manager.set_voice_input_mode(mode)
+        apply_push_to_talk_mode()
+        
+        config_loader.set("voice_input_mode", mode)
+        config_loader.save_config()
+        ui_manager.update_status_text("已切换为按键说话" if mode == AudioManager.VOICE_MODE_PUSH_TO_TALK else "已切换为语音激活")
+    
+    async def handle_keyboard_event(e: ft.KeyboardEvent):
+        """窗口内按键事件（全局热键不可用时用于按键说话）"""
+        if audio_manager.voice_input_mode == AudioManager.VOICE_MODE_PUSH_TO_TALK:
+            push_to_talk_binding.handle_page_keyboard_event(e)
+    
     # 设置麦克风相关回调
     ui_manager.set_callback('on_mic_test', handle_mic_test)
     ui_manager.set_callback('on_mute_mic', handle_mute_mic)
     ui_manager.set_callback('on_input_volume_change', handle_input_volume_change)
+    ui_manager.set_callback('on_push_to_talk_mode_change', handle_push_to_talk_mode_change)
+    ui_manager.set_callback('on_push_to_talk', audio_manager.set_push_to_talk_pressed)
+    page.on_keyboard_event = handle_keyboard_event
+    apply_push_to_talk_mode(refresh_ui=False)
 
     # 设置窗口大小和属性（UIManager已经设置了基本属性）
     page.window_width = 1200
@@ -1511,6 +2171,11 @@ async def main(page: ft.Page):
     saved_username = config_loader.get("username", "")
     saved_password = config_loader.get("password", "")
     
+    # 可选：用户输入用户名密码期间预先建立到服务器的TCP/TLS连接（自动登录时直接登录）
+    prewarm_connection = config_loader.get("prewarm_connection_on_login_view", False)
+    if prewarm_connection and not (remember_me and saved_username and saved_password):
+        page.run_task(network_manager.prewarm_connections)
+    
     if remember_me and saved_username and saved_password:
         print("检测到已保存的登录信息，尝试自动登录...")
         # 尝试自动登录
@@ -1526,6 +2191,8 @@ async def main(page: ft.Page):
     # --- 应用关闭时的清理 ---
     async def on_close(e):
         print("应用正在关闭，清理资源...")
+        push_to_talk_binding.stop()
+        await audio_manager.shutdown()
         # 清理所有网络连接和资源
         await network_manager.cleanup()
         print("资源清理完成")
@@ -1536,4 +2203,5 @@ async def main(page: ft.Page):
     page.update()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包后的可执行文件启动音频引擎子进程时需要
     ft.app(target=main) 
\ No newline at end of file
@@ -1,7 +1,60 @@
 import flet as ft
 import asyncio
-from typing import List, Dict, Optional, Callable, Any
+from typing import Awaitable, List, Dict, Optional, Callable, Any
 from datetime import datetime
+from voice_notes import VoiceNoteCodec
+
+
+def _message_id(msg_data: Dict[str, Any]) -> Optional[int]:
+    return msg_data.get('message_id', msg_data.get('id'))
+
+
+async def fetch_missed_messages(channel_id: int, sync_from: Dict[int, int],
+                                request_newer_messages: Callable[[int, int, int], Awaitable[Dict[str, Any]]],
+                                on_page: Callable[[List[Dict[str, Any]]], Optional[int]],
+                                reload_channel: Callable[[int], Awaitable[None]],
+                                page_size: int = 50, max_pages: int = 10) -> int:
+    """重连后补齐文字频道在断线期间缺失的消息，返回补齐的条数
+
+    sync_from记录断线时各频道的最大消息ID（重连后收到的初始批次和实时消息不会推进它）。从这里开始，
+    按每页的最大消息ID逐页向后请求，直到服务器表示没有更多；on_page合并一页消息并返回新增的条数，
+    返回None表示不再需要（例如用户已切换频道）。请求失败时保留sync_from，下次重连后重试；
+    超过max_pages页时调用reload_channel重新加载频道。
+    """
+    after_message_id = sync_from.get(channel_id)
+    if after_message_id is None:
+        sync_from.clear()
+        return 0
+
+    fetched = 0
+    for _ in range(max_pages):
+        result = await request_newer_messages(channel_id, after_message_id, page_size)
+        if not result.get("success"):
+            print(f"[SYNC] 补齐频道 {channel_id} 的缺失消息失败: {result.get('message')}")
+            return fetched
+        messages = result.get("messages", [])
+        merged = on_page(messages)
+        if merged is None:
+            break
+        fetched += merged
+        if not result.get("has_more"):
+            break
+        page_ids = [message_id for message_id in map(_message_id, messages) if message_id is not None]
+        if not page_ids or max(page_ids) <= after_message_id:
+            # 服务器表示还有更多却没有给出更新的消息：视为已补齐，不再重复请求同一页
+            break
+        after_message_id = max(page_ids)
+    else:
+        # 断开太久，缺失的消息太多：重新加载频道而不是继续逐页补齐
+        sync_from.clear()
+        print(f"[SYNC] 频道 {channel_id} 缺失消息超过 {max_pages * page_size} 条，重新加载")
+        await reload_channel(channel_id)
+        return fetched
+
+    sync_from.clear()
+    print(f"[SYNC] 频道 {channel_id} 补齐了 {fetched} 条缺失消息")
+    return fetched
+
 
 class MessageManager:
     """消息管理器类，处理所有消息相关功能"""
@@ -19,6 +72,10 @@ class MessageManager:
         self.INITIAL_MESSAGE_LOAD_COUNT = 20
         self.OLDER_MESSAGE_LOAD_COUNT = 20
         
+        # 语音消息播放
+        self.playing_voice_note_id: Optional[str] = None
+        self._voice_note_playback_task: Optional[asyncio.Task] = None
+        
         # 回调函数
         self.callbacks: Dict[str, Callable] = {}
     
@@ -217,6 +274,52 @@ class MessageManager:
         if scroll_callback:
             asyncio.create_task(scroll_callback())
     
+    async def play_voice_note(self, network_manager, audio_manager, page_ref: ft.Page, note_id: str):
+        """流式播放语音消息：收到第一个分块就开始播放，不等整条下载完成
+
+        再次点击正在播放的语音消息会停止播放。播放设备无法打开或中途停止时停止下载，
+        并通过 on_voice_note_playback_error 回调告知用户。
+        """
+        if self._voice_note_playback_task and not self._voice_note_playback_task.done():
+            was_playing = self.playing_voice_note_id
+            self._voice_note_playback_task.cancel()
+            if was_playing == note_id:
+                return
+        self._voice_note_playback_task = asyncio.current_task()
+        self.playing_voice_note_id = note_id
+        
+        try:
+            await audio_manager.start_audio_playback_stream(page_ref, audio_manager.selected_output_device_id)
+            if not audio_manager.is_audio_playback_active:
+                self._report_voice_note_error(note_id, "无法打开播放设备，语音消息无法播放")
+                return
+            async for data in network_manager.stream_voice_note(note_id):
+                samples = VoiceNoteCodec.upsample(VoiceNoteCodec.decode(data), audio_manager.STANDARD_SAMPLERATE)
+                if not await audio_manager.write_streamed_playback(samples):
+                    self._report_voice_note_error(note_id, "播放设备已停止，语音消息播放中断")
+                    return
+            # 等待缓冲区播完；不在语音频道且不保持预热时关闭为此打开的播放流
+            while audio_manager.audio_output_buffer.available() > 0 and audio_manager.is_audio_playback_active:
+                await asyncio.sleep(0.05)
+            if not audio_manager.is_voice_routing_active and not audio_manager.keep_streams_warm:
+                await audio_manager.stop_audio_playback_stream_if_running()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self._report_voice_note_error(note_id, f"播放语音消息失败: {e}")
+        finally:
+            if self.playing_voice_note_id == note_id:
+                self.playing_voice_note_id = None
+            callback = self.get_callback('on_voice_note_playback_finished')
+            if callback:
+                callback(note_id)
+    
+    def _report_voice_note_error(self, note_id: str, message: str):
+        print(f"语音消息 {note_id}: {message}")
+        callback = self.get_callback('on_voice_note_playback_error')
+        if callback:
+            callback(note_id, message)
+    
     def get_message_count(self) -> int:
         """获取当前消息数量"""
         return len(self.current_chat_messages_data)
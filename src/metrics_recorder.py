@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Any, Optional
+
+
+class MetricsRecorder:
+    """轻量级指标记录器，线程安全
+
+    支持三类指标：计数器（累加）、最新值（覆盖）和有界时间序列（保留最近的样本，可求分位数），
+    另外保留最近的事件记录。音频回调线程、引擎线程和事件循环都可以直接调用。
+    """
+
+    def __init__(self, max_series_length: int = 500, max_events: int = 100):
+        self._lock = threading.Lock()
+        self._max_series_length = max_series_length
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, Any] = {}
+        self._series: Dict[str, deque] = {}
+        self._events: deque = deque(maxlen=max_events)
+
+    def increment(self, name: str, value: float = 1):
+        """累加计数器"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: Any):
+        """设置最新值"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def record(self, name: str, value: float):
+        """向时间序列追加一个样本"""
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                series = self._series[name] = deque(maxlen=self._max_series_length)
+            series.append((time.time(), value))
+
+    def reset_series(self, name: str):
+        """清空一个时间序列（例如开始新一轮测量前）"""
+        with self._lock:
+            self._series.pop(name, None)
+
+    def record_event(self, name: str, **fields):
+        """记录一个事件"""
+        with self._lock:
+            self._events.append({'name': name, 'timestamp': time.time(), **fields})
+
+    def get_counter(self, name: str) -> float:
+        """获取计数器值"""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def get_gauge(self, name: str, default: Any = None) -> Any:
+        """获取最新值"""
+        with self._lock:
+            return self._gauges.get(name, default)
+
+    def get_series(self, name: str) -> List[tuple]:
+        """获取时间序列的(时间戳, 值)列表"""
+        with self._lock:
+            return list(self._series.get(name, ()))
+
+    def get_events(self, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """获取最近的事件，可按名称过滤"""
+        with self._lock:
+            return [event for event in self._events if name is None or event['name'] == name]
+
+    def percentile(self, name: str, percent: float) -> Optional[float]:
+        """计算时间序列的分位数（最近邻取值），没有样本时返回None"""
+        values = sorted(value for _, value in self.get_series(name))
+        if not values:
+            return None
+        index = min(len(values) - 1, max(0, int(round(percent / 100.0 * (len(values) - 1)))))
+        return values[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出所有指标的快照"""
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'series': {name: list(series) for name, series in self._series.items()},
+                'events': list(self._events),
+            }
@@ -2,13 +2,55 @@ import aiohttp
 import socketio
 import ssl
 import asyncio
+import functools
+import threading
+import time
+from collections import deque
 import flet as ft
-from typing import Optional, Dict, Callable, Any
+from typing import Optional, Dict, Callable, Any, Set
 from config_loader import ConfigLoader
+from metrics_recorder import MetricsRecorder
+from reconnection_manager import ReconnectionManager
+from udp_voice_transport import UdpVoiceTransport
+
+
+def _on_network_loop(method):
+    """协程方法装饰器：启用独立网络线程时，把调用转交给网络事件循环执行，调用方在自己的事件循环中等待结果"""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        network_loop = self.network_loop
+        if network_loop is None or asyncio.get_running_loop() is network_loop:
+            return await method(self, *args, **kwargs)
+        future = asyncio.run_coroutine_threadsafe(method(self, *args, **kwargs), network_loop)
+        return await asyncio.wrap_future(future)
+    return wrapper
+
 
 class NetworkManager:
     """网络管理器类，处理所有网络通信功能"""
     
+    # 事件投递队列：语音事件与聊天/控制事件分开投递，互不排队
+    EVENT_QUEUE_CONTROL = "control"
+    EVENT_QUEUE_VOICE = "voice"
+    
+    VOICE_NAMESPACE = "/voice"
+    VOICE_SEND_QUEUE_FRAMES = 10  # 语音发送队列上限（约200ms），积压时丢弃最旧的帧
+    VOICE_CONNECT_TIMEOUT_SECONDS = 5
+    
+    # 应用层心跳：engine.io的默认超时要几十秒才能发现半开连接（休眠唤醒、切换网络），
+    # 在语音频道中使用更短的间隔和超时，尽早回收死连接并交给重连
+    LIVENESS_INTERVAL_SECONDS = 10.0
+    LIVENESS_TIMEOUT_SECONDS = 5.0
+    LIVENESS_VOICE_INTERVAL_SECONDS = 2.0
+    LIVENESS_VOICE_TIMEOUT_SECONDS = 2.0
+    LIVENESS_MAX_MISSES = 2
+    
+    # 共享连接池：登录、频道列表和Socket.IO握手都发往同一主机，保持空闲连接以便复用，
+    # 省去重复的TCP和TLS握手；DNS结果也缓存起来
+    HTTP_KEEPALIVE_SECONDS = 75
+    DNS_CACHE_SECONDS = 300
+    PREWARM_CONNECTIONS = 2  # 一条给登录等HTTP请求，一条给Socket.IO的websocket升级
+    
     def __init__(self, config_file: str):
         self.config_loader = ConfigLoader(config_file)
         self.server_address = self.config_loader.get("server_address", "127.0.0.1")
@@ -24,11 +66,52 @@ class NetworkManager:
         # 回调函数
         self.callbacks: Dict[str, Callable] = {}
         
+        # 可选的独立网络线程：Socket.IO客户端和HTTP会话运行在自己的事件循环中，
+        # 页面更新再慢也不会推迟websocket读取和心跳（见 start_network_loop）
+        self.network_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.ui_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._network_thread: Optional[threading.Thread] = None
+        self._loop_lag_task = None
+        self._event_lock = threading.Lock()
+        self._pending_events: Dict[str, list] = {self.EVENT_QUEUE_CONTROL: [], self.EVENT_QUEUE_VOICE: []}
+        self._event_flush_scheduled: Set[str] = set()
+        self.metrics = MetricsRecorder()
+        
+        # 语音传输：加入语音频道时协商的第二条Socket.IO连接（/voice命名空间），
+        # 聊天记录等大块数据不会在同一个websocket上阻塞语音帧；连接失败时退回主连接
+        self.voice_sio_client: Optional[socketio.AsyncClient] = None
+        self.voice_channel_id: Optional[int] = None
+        self._voice_send_queue: deque = deque()
+        self._voice_send_lock = threading.Lock()
+        self._voice_send_wakeup: Optional[asyncio.Event] = None
+        self._voice_send_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._voice_send_task: Optional[asyncio.Task] = None
+        self.voice_frames_dropped = 0
+        
+        # 可选的UDP语音传输：Socket.IO只负责信令，语音帧走带序号的数据报；
+        # voice_udp_relay（"host:port"）用于跳过服务器信令直接连接本地中继进行测试
+        self.voice_udp_enabled = self.config_loader.get("voice_udp_enabled", False)
+        self.voice_udp_relay = self.config_loader.get("voice_udp_relay", "")
+        self.udp_voice: Optional[UdpVoiceTransport] = None
+        # 由同步回调（数据报接收、UDP失效）创建的任务，保留引用直到完成，避免被垃圾回收
+        self._background_tasks: Set[asyncio.Task] = set()
+        
+        # 断线重连：意外断开后按退避重试，连接恢复后重新加入原来的文字/语音频道
+        self.reconnection = ReconnectionManager()
+        self._disconnect_requested = False
+        self._liveness_task: Optional[asyncio.Task] = None
+        # 服务器是否支持client_ping，按服务器地址记在配置中（None表示尚未确定），
+        # 不支持的服务器最多只会因为确认这一点而重连一次
+        self._liveness_server: Optional[str] = None
+        self._liveness_supported: Optional[bool] = None
+        self._liveness_unconfirmed_recycle = False
+        self.prewarmed_host: Optional[str] = None
+        
         # SSL上下文
         self.ssl_context = self._create_ssl_context()
     
     def _create_ssl_context(self):
-        """创建SSL上下文（忽略证书验证）"""
+        """创建SSL上下文（忽略证书验证），整个会话共用一个上下文"""
         ssl_context = ssl.create_default_context()
         ssl_context.check_hostname = False
         ssl_context.verify_mode = ssl.CERT_NONE
@@ -54,14 +137,76 @@ class NetworkManager:
         """更新服务器配置"""
         self.server_address = address
         self.server_port = port
+        self.prewarmed_host = None
         self.config_loader.set("server_address", address)
         self.config_loader.set("server_port", port)
         self.config_loader.save_config()
     
+    # --- 独立网络线程 ---
+    NETWORK_LOOP_LAG_INTERVAL_SECONDS = 0.1
+    
+    def start_network_loop(self):
+        """在独立线程中运行网络事件循环（在UI事件循环中、创建HTTP会话和Socket.IO客户端之前调用）"""
+        if self.network_loop is not None:
+            return
+        self.ui_loop = asyncio.get_running_loop()
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(ready.set)
+            loop.run_forever()
+            loop.close()
+        
+        self._network_thread = threading.Thread(target=run, name="network-io", daemon=True)
+        self._network_thread.start()
+        ready.wait()
+        self.network_loop = loop
+        loop.call_soon_threadsafe(self._start_loop_lag_probe)
+        print("网络事件循环已在独立线程中启动")
+    
+    def stop_network_loop(self):
+        """停止网络线程（会话和连接应已关闭）"""
+        loop, self.network_loop = self.network_loop, None
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        self._network_thread.join(timeout=2.0)
+        self._network_thread = None
+    
+    def _start_loop_lag_probe(self):
+        self._loop_lag_task = asyncio.get_running_loop().create_task(self._measure_loop_lag())
+    
+    async def _measure_loop_lag(self):
+        """在网络事件循环中测量调度延迟，反映socket读取被推迟的程度"""
+        loop = asyncio.get_running_loop()
+        interval = self.NETWORK_LOOP_LAG_INTERVAL_SECONDS
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            self.metrics.record('network_loop_lag_ms', max(0.0, (loop.time() - started - interval) * 1000))
+    
+    def get_loop_latency_report(self) -> Dict[str, Any]:
+        """网络事件循环调度延迟与事件投递到UI回调的延迟（p50/p95，毫秒）"""
+        report = {'dedicated_network_loop': self.network_loop is not None}
+        for name in ('network_loop_lag_ms', 'event_delivery_delay_ms', 'event_batch_size'):
+            report[name] = {
+                'p50': self.metrics.percentile(name, 50),
+                'p95': self.metrics.percentile(name, 95),
+            }
+        return report
+    
+    @_on_network_loop
     async def create_http_session(self):
         """创建HTTP会话"""
         if self.shared_aiohttp_session is None:
-            connector = aiohttp.TCPConnector(ssl=self.ssl_context)
+            connector = aiohttp.TCPConnector(
+                ssl=self.ssl_context,
+                keepalive_timeout=self.HTTP_KEEPALIVE_SECONDS,
+                use_dns_cache=True,
+                ttl_dns_cache=self.DNS_CACHE_SECONDS
+            )
             # 使用cookie_jar允许保存和使用cookie，这对Socket.IO认证很重要
             cookie_jar = aiohttp.CookieJar(unsafe=True)
             self.shared_aiohttp_session = aiohttp.ClientSession(
@@ -70,12 +215,43 @@ class NetworkManager:
             )
             print("HTTP会话已创建，配置了cookie支持")
     
+    @_on_network_loop
+    async def prewarm_connections(self):
+        """在登录界面预先建立到服务器的连接（DNS、TCP和TLS握手），放入连接池供登录和Socket.IO复用
+
+        只发送轻量的HEAD请求，响应状态无关紧要；失败时静默忽略，登录时照常建立连接。
+        """
+        host = self.get_sio_url()
+        if self.prewarmed_host == host:
+            return
+        await self.create_http_session()
+        await self.create_socketio_client()
+        
+        started = time.perf_counter()
+        
+        async def warm_one():
+            async with self.shared_aiohttp_session.head(self.get_api_base_url(), allow_redirects=False) as response:
+                await response.read()
+        
+        results = await asyncio.gather(*(warm_one() for _ in range(self.PREWARM_CONNECTIONS)), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if len(errors) == len(results):
+            print(f"预热连接失败: {errors[0]}")
+            return
+        self.prewarmed_host = host
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.metrics.set_gauge('prewarm_ms', round(elapsed_ms, 1))
+        print(f"已预热 {len(results) - len(errors)} 条到 {host} 的连接，用时 {elapsed_ms:.0f}ms")
+    
+    @_on_network_loop
     async def close_http_session(self):
         """关闭HTTP会话"""
         if self.shared_aiohttp_session:
             await self.shared_aiohttp_session.close()
             self.shared_aiohttp_session = None
+            self.prewarmed_host = None
     
+    @_on_network_loop
     async def create_socketio_client(self):
         """创建SocketIO客户端"""
         # 确保HTTP会话已创建
@@ -84,9 +260,11 @@ class NetworkManager:
             
         if self.sio_client is None:
             # 使用共享的HTTP会话创建Socket.IO客户端
+            # 关闭客户端自带的重连，由ReconnectionManager重连并恢复会话
             self.sio_client = socketio.AsyncClient(
                 ssl_verify=False,
                 http_session=self.shared_aiohttp_session,
+                reconnection=False,
                 logger=True,
                 engineio_logger=True
             )
@@ -101,109 +279,128 @@ class NetworkManager:
         @self.sio_client.event
         async def connect():
             print("Connected to SocketIO server")
-            callback = self.get_callback('on_socket_connect')
-            if callback:
-                await callback()
+            await self._dispatch_event('on_socket_connect')
         
         @self.sio_client.event
         async def disconnect():
             print("Disconnected from SocketIO server")
-            callback = self.get_callback('on_socket_disconnect')
-            if callback:
-                await callback()
+            await self._dispatch_event('on_socket_disconnect')
+            if not self._disconnect_requested and self.current_user_info:
+                self.reconnection.start(
+                    self._reconnect_socketio, self._restore_session,
+                    on_attempt=self._on_reconnect_attempt, on_restored=self._on_session_restored
+                )
         
         @self.sio_client.event
         async def connect_error(data):
             print(f"SocketIO connection error: {data}")
-            callback = self.get_callback('on_socket_connect_error')
-            if callback and callable(callback):
-                try:
-                    # 如果回调是一个异步函数，则使用await调用它
-                    if asyncio.iscoroutinefunction(callback):
-                        await callback(data)
-                    # 如果回调是普通函数，则直接调用
-                    else:
-                        callback(data)
-                except Exception as e:
-                    print(f"Error in connect_error callback: {e}")
+            await self._dispatch_event('on_socket_connect_error', data)
         
         @self.sio_client.event
         async def new_message(data):
-            callback = self.get_callback('on_new_message')
-            if callback:
-                await callback(data)
+            await self._dispatch_event('on_new_message', data)
         
         @self.sio_client.event
         async def voice_channel_users(data):
-            callback = self.get_callback('on_voice_channel_users')
-            if callback:
-                await callback(data)
+            await self._dispatch_event('on_voice_channel_users', data)
         
         @self.sio_client.event
         async def user_joined_voice(data):
-            callback = self.get_callback('on_user_joined_voice')
-            if callback:
-                await callback(data)
+            await self._dispatch_event('on_user_joined_voice', data)
         
         @self.sio_client.event
         async def user_left_voice(data):
-            callback = self.get_callback('on_user_left_voice')
-            if callback:
-                await callback(data)
+            await self._dispatch_event('on_user_left_voice', data)
         
         @self.sio_client.event
         async def user_speaking(data):
-            callback = self.get_callback('on_user_speaking')
-            if callback:
-                await callback(data)
+            await self._dispatch_event('on_user_speaking', data)
         
         @self.sio_client.event
         async def user_mic_status_updated(data):
-            callback = self.get_callback('on_user_mic_status_updated')
-            if callback:
-                await callback(data)
+            await self._dispatch_event('on_user_mic_status_updated', data)
         
         @self.sio_client.event
         async def user_voice_activity(data):
-            callback = self.get_callback('on_user_voice_activity')
-            if callback:
-                await callback(data)
+            await self._dispatch_event('on_user_voice_activity', data)
         
+        # 语音传输未建立时语音帧仍经由主连接到达
         @self.sio_client.event
         async def voice_data_stream_chunk(data):
-            callback = self.get_callback('on_voice_data_stream_chunk')
-            if callback:
-                await callback(data)
+            await self._dispatch_event('on_voice_data_stream_chunk', data, queue=self.EVENT_QUEUE_VOICE)
+        
+        @self.sio_client.event
+        async def voice_echo_reply(data):
+            await self._dispatch_event('on_voice_echo_reply', data, queue=self.EVENT_QUEUE_VOICE)
         
         @self.sio_client.event
         async def error(data):
-            callback = self.get_callback('on_socket_error')
-            if callback:
-                await callback(data)
+            await self._dispatch_event('on_socket_error', data)
         
         @self.sio_client.event
         async def server_user_list_update(data):
-            callback = self.get_callback('on_server_user_list_update')
-            if callback:
-                await callback(data)
+            await self._dispatch_event('on_server_user_list_update', data)
         
         @self.sio_client.event
         async def older_messages_loaded(data):
-            callback = self.get_callback('on_older_messages_loaded')
-            if callback:
-                await callback(data)
+            await self._dispatch_event('on_older_messages_loaded', data)
         
         @self.sio_client.event
         async def load_historical_messages(data):
-            callback = self.get_callback('on_load_historical_messages')
-            if callback:
-                await callback(data)
+            await self._dispatch_event('on_load_historical_messages', data)
     
+    async def _dispatch_event(self, callback_name: str, *args, queue: str = EVENT_QUEUE_CONTROL):
+        """把Socket.IO事件交给回调
+
+        与UI共用事件循环时直接调用；运行在独立网络线程时放入对应队列的待投递批次，
+        一批事件只唤醒UI事件循环一次，并在UI事件循环中按到达顺序逐个调用回调。
+        语音队列和控制队列各自投递，语音帧不会排在大块聊天记录的处理之后。
+        """
+        if self.network_loop is None:
+            await self._invoke_callback(callback_name, args)
+            return
+        with self._event_lock:
+            self._pending_events[queue].append((callback_name, args, time.perf_counter()))
+            if queue in self._event_flush_scheduled:
+                return
+            self._event_flush_scheduled.add(queue)
+        self.ui_loop.call_soon_threadsafe(self._schedule_event_flush, queue)
+    
+    def _schedule_event_flush(self, queue: str):
+        self.ui_loop.create_task(self._flush_events(queue))
+    
+    async def _flush_events(self, queue: str):
+        """在UI事件循环中投递网络线程积累的事件"""
+        while True:
+            with self._event_lock:
+                batch, self._pending_events[queue] = self._pending_events[queue], []
+                if not batch:
+                    self._event_flush_scheduled.discard(queue)
+                    return
+            self.metrics.record('event_batch_size', len(batch))
+            for callback_name, args, received_at in batch:
+                self.metrics.record('event_delivery_delay_ms', (time.perf_counter() - received_at) * 1000)
+                await self._invoke_callback(callback_name, args)
+    
+    async def _invoke_callback(self, callback_name: str, args: tuple):
+        callback = self.get_callback(callback_name)
+        if not callback or not callable(callback):
+            return
+        try:
+            # 回调可以是异步函数，也可以是普通函数
+            result = callback(*args)
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception as e:
+            print(f"Error in {callback_name} callback: {e}")
+    
+    @_on_network_loop
     async def connect_socketio(self, auth_data: Dict[str, str] = None):
         """连接到SocketIO服务器"""
         if not self.sio_client:
             await self.create_socketio_client()
         
+        self._disconnect_requested = False
         try:
             # 简化认证逻辑，与参考代码保持一致
             # 如果服务器使用HTTP cookie进行认证，则不需要显式传递token
@@ -214,23 +411,363 @@ class NetworkManager:
                 transports=['websocket', 'polling']  # 支持多种传输方式
             )
             print("Socket.IO连接成功!")
+            self._ensure_voice_sender()
+            self._start_liveness_watchdog()
             return True
         except Exception as e:
             print(f"Failed to connect to SocketIO: {e}")
             return False
     
+    @_on_network_loop
     async def disconnect_socketio(self):
-        """断开SocketIO连接"""
+        """断开SocketIO连接（主动断开，不触发重连）"""
+        self._disconnect_requested = True
+        self.reconnection.cancel()
+        self._stop_liveness_watchdog()
         if self.sio_client and self.sio_client.connected:
             await self.sio_client.disconnect()
     
+    @_on_network_loop
+    async def end_session(self):
+        """退出登录：清空重连要恢复的会话状态，关闭语音传输并断开连接"""
+        self.reconnection.reset()
+        await self.disconnect_voice_transport()
+        await self.disconnect_socketio()
+    
+    # --- 断线重连 ---
+    async def _reconnect_socketio(self) -> bool:
+        if self._disconnect_requested:
+            return False
+        if self.sio_client.connected:
+            return True
+        return await self.connect_socketio()
+    
+    async def _restore_session(self, events: list):
+        """重新发送会话事件，并为当前语音频道重建语音传输"""
+        for event, data in events:
+            await self.sio_client.emit(event, data)
+        voice_channel_id = self.reconnection.voice_channel_id
+        if voice_channel_id is not None:
+            await self.connect_voice_transport(voice_channel_id)
+    
+    # --- 应用层心跳 ---
+    def _start_liveness_watchdog(self):
+        self._stop_liveness_watchdog()
+        server = self.get_sio_url()
+        if server != self._liveness_server:
+            self._liveness_server = server
+            self._liveness_supported = self.config_loader.get("liveness_supported_by_server", {}).get(server)
+            self._liveness_unconfirmed_recycle = False
+        self._liveness_task = asyncio.get_running_loop().create_task(self._liveness_watchdog())
+    
+    def _stop_liveness_watchdog(self):
+        if self._liveness_task and self._liveness_task is not asyncio.current_task():
+            self._liveness_task.cancel()
+        self._liveness_task = None
+    
+    async def _liveness_watchdog(self):
+        """定期发送client_ping并等待确认，测量往返时间；连续超时即强制关闭连接，由重连恢复会话
+
+        服务器从未确认过client_ping时，超时同样计入心跳失败（首个ping就可能遇上半开连接）。
+        只有因此重连成功后服务器仍不响应，才认为服务器不支持该事件，之后超时不再计数，只依赖engine.io自身的心跳。
+        结论按服务器记入配置，以后的会话不再为此断开重连。
+        """
+        client = self.sio_client
+        misses = 0
+        while client.connected:
+            in_voice = self.voice_channel_id is not None
+            interval = self.LIVENESS_VOICE_INTERVAL_SECONDS if in_voice else self.LIVENESS_INTERVAL_SECONDS
+            timeout = self.LIVENESS_VOICE_TIMEOUT_SECONDS if in_voice else self.LIVENESS_TIMEOUT_SECONDS
+            await asyncio.sleep(interval)
+            if not client.connected:
+                return
+            
+            started = time.perf_counter()
+            try:
+                await client.call('client_ping', {'sent_at': time.time()}, timeout=timeout)
+            except Exception:
+                if self._liveness_supported is False:
+                    # 不支持client_ping的服务器：继续发送，服务器升级后开始响应即恢复心跳检测
+                    continue
+                misses += 1
+                self.metrics.increment('liveness_misses')
+                print(f"心跳超时（连续{misses}次）")
+                if misses >= self.LIVENESS_MAX_MISSES:
+                    if self._liveness_supported is None:
+                        if self._liveness_unconfirmed_recycle:
+                            # 上次无响应后已经重新连上，服务器仍不响应：不是连接问题，而是不支持client_ping
+                            print("服务器未响应client_ping，应用层心跳停用")
+                            self._remember_liveness_support(False)
+                            misses = 0
+                            continue
+                        self._liveness_unconfirmed_recycle = True
+                    await self._recycle_dead_connection(client)
+                    return
+                continue
+            
+            if not self._liveness_supported:
+                self._remember_liveness_support(True)
+            misses = 0
+            rtt_ms = (time.perf_counter() - started) * 1000
+            self.metrics.record('socket_rtt_ms', rtt_ms)
+            self.metrics.set_gauge('socket_rtt_ms', round(rtt_ms, 1))
+    
+    def _remember_liveness_support(self, supported: bool):
+        self._liveness_supported = supported
+        by_server = dict(self.config_loader.get("liveness_supported_by_server", {}))
+        by_server[self._liveness_server] = supported
+        self.config_loader.set("liveness_supported_by_server", by_server)
+        self.config_loader.save_config()
+    
+    async def _recycle_dead_connection(self, client):
+        """不等待关闭握手直接丢弃半开连接，断开事件会触发重连"""
+        print("连接已失去响应，强制断开并重新连接")
+        self.metrics.increment('liveness_recycles')
+        try:
+            await client.eio.disconnect(abort=True)
+        except Exception as e:
+            print(f"强制断开连接时出错: {e}")
+            await client.disconnect()
+    
+    def get_connection_health(self) -> Dict[str, Any]:
+        """连接往返时间（p50/p95，毫秒）和心跳超时、回收、重连次数"""
+        return {
+            'connected': bool(self.sio_client and self.sio_client.connected),
+            'rtt_ms': self.metrics.get_gauge('socket_rtt_ms'),
+            'rtt_p50_ms': self.metrics.percentile('socket_rtt_ms', 50),
+            'rtt_p95_ms': self.metrics.percentile('socket_rtt_ms', 95),
+            'liveness_misses': self.metrics.get_counter('liveness_misses'),
+            'liveness_recycles': self.metrics.get_counter('liveness_recycles'),
+            'reconnects': self.metrics.get_counter('reconnects'),
+        }
+    
+    async def _on_reconnect_attempt(self, attempt: int, delay: float):
+        await self._dispatch_event('on_reconnecting', attempt, delay)
+    
+    async def _on_session_restored(self, report: Dict[str, Any]):
+        self.metrics.increment('reconnects')
+        self.metrics.record('reconnect_restore_ms', report['restore_ms'])
+        await self._dispatch_event('on_session_restored', report)
+    
+    @_on_network_loop
     async def emit_socketio(self, event: str, data: Any = None):
         """发送SocketIO事件"""
+        self.reconnection.track_emit(event, data)
         if self.sio_client and self.sio_client.connected:
             await self.sio_client.emit(event, data)
         else:
             print(f"Cannot emit {event}: SocketIO not connected")
     
+    # --- 语音传输 ---
+    @property
+    def is_voice_transport_connected(self) -> bool:
+        return self.voice_sio_client is not None and self.voice_sio_client.connected
+    
+    @_on_network_loop
+    async def connect_voice_transport(self, channel_id: int) -> bool:
+        """加入语音频道时建立独立的语音连接，失败时语音继续走主连接"""
+        self._ensure_voice_sender()
+        self.voice_channel_id = channel_id
+        if self.voice_udp_enabled:
+            await self._connect_udp_voice(channel_id)
+        if self.is_voice_transport_connected:
+            await self.voice_sio_client.emit('join_voice_transport', {'channel_id': channel_id}, namespace=self.VOICE_NAMESPACE)
+            return True
+        
+        client = socketio.AsyncClient(ssl_verify=False, http_session=self.shared_aiohttp_session, reconnection=False)
+        
+        @client.on('voice_data_stream_chunk', namespace=self.VOICE_NAMESPACE)
+        async def voice_data_stream_chunk(data):
+            await self._dispatch_event('on_voice_data_stream_chunk', data, queue=self.EVENT_QUEUE_VOICE)
+        
+        @client.on('voice_echo_reply', namespace=self.VOICE_NAMESPACE)
+        async def voice_echo_reply(data):
+            await self._dispatch_event('on_voice_echo_reply', data, queue=self.EVENT_QUEUE_VOICE)
+        
+        @client.on('disconnect', namespace=self.VOICE_NAMESPACE)
+        async def disconnect():
+            print("语音连接已断开，语音暂时经由主连接发送")
+        
+        try:
+            await client.connect(
+                self.get_sio_url(),
+                namespaces=[self.VOICE_NAMESPACE],
+                transports=['websocket'],
+                wait_timeout=self.VOICE_CONNECT_TIMEOUT_SECONDS
+            )
+            await client.emit('join_voice_transport', {'channel_id': channel_id}, namespace=self.VOICE_NAMESPACE)
+        except Exception as e:
+            print(f"建立语音连接失败，语音经由主连接发送: {e}")
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+            return False
+        
+        self.voice_sio_client = client
+        print(f"语音连接已建立: {self.get_sio_url()}{self.VOICE_NAMESPACE}")
+        return True
+    
+    async def _request_udp_voice_params(self, channel_id: int) -> Optional[Dict[str, Any]]:
+        """通过Socket.IO信令获取UDP中继地址、端口和会话令牌"""
+        if self.voice_udp_relay:
+            host, _, port = self.voice_udp_relay.rpartition(':')
+            return {'host': host or '127.0.0.1', 'port': int(port), 'token': 0}
+        if not self.sio_client or not self.sio_client.connected:
+            return None
+        try:
+            params = await self.sio_client.call('voice_udp_offer', {'channel_id': channel_id}, timeout=3)
+        except Exception as e:
+            print(f"UDP语音信令失败: {e}")
+            return None
+        if not params or not params.get('success', True) or not params.get('port'):
+            return None
+        return params
+    
+    async def _connect_udp_voice(self, channel_id: int) -> bool:
+        """尝试建立UDP语音传输，UDP被阻断或服务器不支持时返回False（语音继续走websocket）"""
+        self._close_udp_voice()
+        params = await self._request_udp_voice_params(channel_id)
+        if params is None:
+            return False
+        user_id = int(self.current_user_info.get('id', 0)) if self.current_user_info else 0
+        transport = UdpVoiceTransport(
+            params.get('host') or self.server_address, int(params['port']), int(params.get('token', 0)),
+            user_id, channel_id,
+            on_voice_frame=self._on_udp_voice_frame,
+            on_failed=self._on_udp_voice_failed
+        )
+        if not await transport.start():
+            return False
+        self.udp_voice = transport
+        return True
+    
+    def _spawn_background_task(self, coro):
+        """在当前事件循环中创建任务并保留引用直到完成"""
+        task = asyncio.get_running_loop().create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+    
+    def _on_udp_voice_frame(self, data: Dict[str, Any]):
+        self._spawn_background_task(self._dispatch_event('on_voice_data_stream_chunk', data, queue=self.EVENT_QUEUE_VOICE))
+    
+    def _on_udp_voice_failed(self, reason: str):
+        self.udp_voice = None
+        if self.voice_channel_id is not None:
+            self._spawn_background_task(self._announce_voice_transport('websocket', reason))
+    
+    async def _announce_voice_transport(self, transport: str, reason: str = ""):
+        """通知服务器本客户端的语音改走哪条路径，服务器据此改用websocket投递给本客户端的语音"""
+        data = {'channel_id': self.voice_channel_id, 'transport': transport, 'reason': reason}
+        try:
+            if self.is_voice_transport_connected:
+                await self.voice_sio_client.emit('voice_transport_switch', data, namespace=self.VOICE_NAMESPACE)
+            elif self.sio_client and self.sio_client.connected:
+                await self.sio_client.emit('voice_transport_switch', data)
+            else:
+                return  # 重连恢复会话时会重新协商语音传输
+            print(f"已通知服务器语音传输切换为 {transport}")
+        except Exception as e:
+            print(f"通知服务器语音传输切换失败: {e}")
+    
+    def _close_udp_voice(self):
+        transport, self.udp_voice = self.udp_voice, None
+        if transport is not None:
+            transport.close()
+    
+    @_on_network_loop
+    async def disconnect_voice_transport(self):
+        """离开语音频道时关闭语音连接，丢弃未发送的语音帧并停止语音发送任务（再次加入时重新启动）"""
+        self.voice_channel_id = None
+        self._stop_voice_sender()
+        self._drop_queued_voice_events()
+        self._close_udp_voice()
+        client, self.voice_sio_client = self.voice_sio_client, None
+        if client is not None and client.connected:
+            await client.disconnect()
+    
+    def queue_voice_event(self, event: str, data: Any, on_sent: Optional[Callable[[], None]] = None):
+        """把一个语音帧放入语音发送队列（任意线程可调用，不等待发送）
+
+        队列满时丢弃最旧的帧：迟到的语音没有播放价值，不应让后面的帧继续排队。
+        on_sent在帧发出（数据已序列化）或被丢弃后调用，调用方据此归还帧的缓冲区。
+        """
+        loop, wakeup = self._voice_send_loop, self._voice_send_wakeup  # 离开语音频道时可能在其他线程中被清空
+        if loop is None:
+            if on_sent:
+                on_sent()
+            return
+        with self._voice_send_lock:
+            evicted = self._voice_send_queue.popleft() if len(self._voice_send_queue) >= self.VOICE_SEND_QUEUE_FRAMES else None
+            self._voice_send_queue.append((event, data, on_sent))
+        if evicted is not None:
+            self.voice_frames_dropped += 1
+            self._release_voice_event(evicted)
+        loop.call_soon_threadsafe(wakeup.set)
+    
+    def _release_voice_event(self, item: tuple):
+        on_sent = item[2]
+        if on_sent:
+            try:
+                on_sent()
+            except Exception as e:
+                print(f"Error in voice frame release callback: {e}")
+    
+    def _drop_queued_voice_events(self):
+        with self._voice_send_lock:
+            items = list(self._voice_send_queue)
+            self._voice_send_queue.clear()
+        for item in items:
+            self._release_voice_event(item)
+    
+    def _ensure_voice_sender(self):
+        """在当前（网络）事件循环中启动语音发送任务"""
+        if self._voice_send_task is not None and not self._voice_send_task.done():
+            return
+        self._voice_send_loop = asyncio.get_running_loop()
+        self._voice_send_wakeup = asyncio.Event()
+        self._voice_send_task = self._voice_send_loop.create_task(self._voice_send_worker())
+    
+    def _stop_voice_sender(self):
+        if self._voice_send_task:
+            self._voice_send_task.cancel()
+            self._voice_send_task = None
+            self._voice_send_loop = None
+    
+    async def _voice_send_worker(self):
+        """依次发送语音队列中的帧：优先UDP，其次语音连接，否则走主连接"""
+        while True:
+            await self._voice_send_wakeup.wait()
+            self._voice_send_wakeup.clear()
+            while True:
+                with self._voice_send_lock:
+                    if not self._voice_send_queue:
+                        break
+                    item = self._voice_send_queue.popleft()
+                event, data, _ = item
+                audio_data = data.get('audio_data') if isinstance(data, dict) else None
+                try:
+                    if event == 'voice_data_stream' and self.udp_voice is not None and self.udp_voice.is_active:
+                        self.udp_voice.send_voice(audio_data, data['samplerate'], data.get('rms'))
+                        continue
+                    if hasattr(audio_data, 'tolist'):
+                        # websocket路径以JSON列表发送
+                        data = {**data, 'audio_data': audio_data.tolist()}
+                    # 数据已序列化（UDP路径在编码后），帧缓冲区可以归还
+                    self._release_voice_event(item)
+                    item = None
+                    if self.is_voice_transport_connected:
+                        await self.voice_sio_client.emit(event, data, namespace=self.VOICE_NAMESPACE)
+                    elif self.sio_client and self.sio_client.connected:
+                        await self.sio_client.emit(event, data)
+                except Exception as e:
+                    print(f"发送语音帧失败: {e}")
+                finally:
+                    if item is not None:
+                        self._release_voice_event(item)
+    
+    @_on_network_loop
     async def login(self, username: str, password: str) -> Dict[str, Any]:
         """用户登录"""
         await self.create_http_session()
@@ -269,6 +806,7 @@ class NetworkManager:
         except Exception as e:
             return {"success": False, "message": f"网络错误: {str(e)}"}
     
+    @_on_network_loop
     async def register(self, username: str, password: str, invite_code: str) -> Dict[str, Any]:
         """用户注册"""
         await self.create_http_session()
@@ -293,6 +831,7 @@ class NetworkManager:
         except Exception as e:
             return {"success": False, "message": f"网络错误: {str(e)}"}
     
+    @_on_network_loop
     async def fetch_channels(self) -> Dict[str, Any]:
         """获取频道列表"""
         await self.create_http_session()
@@ -318,6 +857,7 @@ class NetworkManager:
             print(f"Exception fetching channels: {str(e)}")
             return {"success": False, "message": f"获取频道时发生未知错误: {str(e)}"}
     
+    @_on_network_loop
     async def send_message(self, channel_id: int, content: str) -> Dict[str, Any]:
         """发送消息"""
         if not self.current_user_info:
@@ -346,6 +886,7 @@ class NetworkManager:
         except Exception as e:
             return {"success": False, "message": f"网络错误: {str(e)}"}
     
+    @_on_network_loop
     async def join_voice_channel(self, channel_id: int) -> Dict[str, Any]:
         """加入语音频道"""
         if not self.current_user_info:
@@ -371,6 +912,7 @@ class NetworkManager:
         except Exception as e:
             return {"success": False, "message": f"网络错误: {str(e)}"}
     
+    @_on_network_loop
     async def leave_voice_channel(self) -> Dict[str, Any]:
         """离开语音频道"""
         if not self.current_user_info:
@@ -394,6 +936,7 @@ class NetworkManager:
         except Exception as e:
             return {"success": False, "message": f"网络错误: {str(e)}"}
     
+    @_on_network_loop
     async def request_older_messages(self, channel_id: int, oldest_message_id: Optional[int] = None, count: int = 20) -> Dict[str, Any]:
         """请求更早的消息"""
         if not self.current_user_info:
@@ -428,8 +971,164 @@ class NetworkManager:
         except Exception as e:
             return {"success": False, "message": f"网络错误: {str(e)}"}
     
+    @_on_network_loop
+    async def request_newer_messages(self, channel_id: int, after_message_id: int, count: int = 50) -> Dict[str, Any]:
+        """请求某条消息之后的消息（断线重连后补齐缺失的部分），按时间顺序返回"""
+        if not self.current_user_info:
+            return {"success": False, "message": "用户未登录"}
+        
+        await self.create_http_session()
+        
+        params = {
+            "channel_id": channel_id,
+            "count": count,
+            "after_message_id": after_message_id
+        }
+        
+        try:
+            async with self.shared_aiohttp_session.get(
+                f"{self.get_api_base_url()}/messages",
+                params=params,
+                headers=self._auth_headers()
+            ) as response:
+                result = await response.json()
+                
+                if response.status == 200 and result.get("success"):
+                    return {
+                        "success": True,
+                        "messages": result.get("messages", []),
+                        "has_more": result.get("has_more", False)
+                    }
+                else:
+                    return {"success": False, "message": result.get("message", "获取消息失败")}
+        except Exception as e:
+            return {"success": False, "message": f"网络错误: {str(e)}"}
+    
+    def _auth_headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.current_user_info.get('token', '') if self.current_user_info else ''}"}
+    
+    @_on_network_loop
+    async def create_voice_note(self) -> Dict[str, Any]:
+        """创建一条语音消息，返回用于分块上传的note_id"""
+        if not self.current_user_info:
+            return {"success": False, "message": "用户未登录"}
+        
+        await self.create_http_session()
+        
+        try:
+            async with self.shared_aiohttp_session.post(
+                f"{self.get_api_base_url()}/voice_notes",
+                json={"codec": "mulaw", "samplerate": 16000, "channels": 1},
+                headers=self._auth_headers()
+            ) as response:
+                result = await response.json()
+                
+                if response.status == 200 and result.get("success"):
+                    return {"success": True, "note_id": result.get("note_id")}
+                else:
+                    return {"success": False, "message": result.get("message", "创建语音消息失败")}
+        except Exception as e:
+            return {"success": False, "message": f"网络错误: {str(e)}"}
+    
+    @_on_network_loop
+    async def upload_voice_note_chunk(self, note_id: str, index: int, data: bytes) -> Dict[str, Any]:
+        """上传语音消息的一个编码分块（复用共享会话的keep-alive连接）"""
+        await self.create_http_session()
+        
+        try:
+            async with self.shared_aiohttp_session.put(
+                f"{self.get_api_base_url()}/voice_notes/{note_id}/chunks/{index}",
+                data=data,
+                headers={**self._auth_headers(), "Content-Type": "application/octet-stream"}
+            ) as response:
+                if response.status == 200:
+                    return {"success": True}
+                return {"success": False, "message": f"上传语音分块失败: {response.status}"}
+        except Exception as e:
+            return {"success": False, "message": f"网络错误: {str(e)}"}
+    
+    @_on_network_loop
+    async def complete_voice_note(self, note_id: str, channel_id: int, duration_ms: int, chunk_count: int) -> Dict[str, Any]:
+        """完成上传并把语音消息发送到文字频道"""
+        await self.create_http_session()
+        
+        try:
+            async with self.shared_aiohttp_session.post(
+                f"{self.get_api_base_url()}/voice_notes/{note_id}/complete",
+                json={"channel_id": channel_id, "duration_ms": duration_ms, "chunk_count": chunk_count},
+                headers=self._auth_headers()
+            ) as response:
+                result = await response.json()
+                
+                if response.status == 200 and result.get("success"):
+                    return {"success": True}
+                else:
+                    return {"success": False, "message": result.get("message", "发送语音消息失败")}
+        except Exception as e:
+            return {"success": False, "message": f"网络错误: {str(e)}"}
+    
+    async def stream_voice_note(self, note_id: str, chunk_size: int = 3200):
+        """流式下载语音消息，边下载边产出编码字节（异步生成器）"""
+        if self.network_loop is None or asyncio.get_running_loop() is self.network_loop:
+            async for data in self._stream_voice_note(note_id, chunk_size):
+                yield data
+            return
+        
+        # 下载在网络事件循环中进行，分块通过队列交给调用方所在的事件循环
+        caller_loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=16)
+        done = object()
+        
+        async def pump():
+            try:
+                async for data in self._stream_voice_note(note_id, chunk_size):
+                    # 等待调用方消费（背压），但不阻塞网络事件循环
+                    await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(queue.put(data), caller_loop))
+                item = done
+            except Exception as e:
+                item = e
+            caller_loop.call_soon_threadsafe(queue.put_nowait, item)
+        
+        future = asyncio.run_coroutine_threadsafe(pump(), self.network_loop)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+    
+    async def _stream_voice_note(self, note_id: str, chunk_size: int):
+        await self.create_http_session()
+        
+        async with self.shared_aiohttp_session.get(
+            f"{self.get_api_base_url()}/voice_notes/{note_id}/stream",
+            headers=self._auth_headers()
+        ) as response:
+            if response.status != 200:
+                raise RuntimeError(f"下载语音消息失败: {response.status}")
+            async for data in response.content.iter_chunked(chunk_size):
+                yield data
+    
     async def cleanup(self):
         """清理资源"""
+        await self._close_connections()
+        self.stop_network_loop()
+    
+    @_on_network_loop
+    async def _close_connections(self):
+        self.reconnection.reset()
+        await self.disconnect_voice_transport()
         await self.disconnect_socketio()
         await self.close_http_session()
+        if self._loop_lag_task:
+            self._loop_lag_task.cancel()
+            try:
+                await self._loop_lag_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_lag_task = None
         self.current_user_info = None 
\ No newline at end of file
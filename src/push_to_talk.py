@@ -0,0 +1,97 @@
+import asyncio
+from typing import Optional, Callable
+import flet as ft
+
+try:
+    from pynput import keyboard as pynput_keyboard
+    PYNPUT_AVAILABLE = True
+except Exception as e:
+    print(f"pynput not available: {e}. Push-to-talk hotkey will only work inside the window.")
+    PYNPUT_AVAILABLE = False
+    pynput_keyboard = None
+
+
+class PushToTalkKeyBinding:
+    """按键说话的按键绑定
+
+    优先使用pynput注册全局热键（能收到真正的按下/松开事件）；pynput不可用时退回到窗口内的
+    Flet键盘事件。Flet只上报按下事件，因此窗口内模式把系统的按键自动重复视为"仍按住"，
+    超过IN_WINDOW_REPEAT_GRACE秒没有新的按下事件即视为松开。
+    """
+
+    DEFAULT_KEY = "F8"
+    IN_WINDOW_REPEAT_GRACE = 0.6  # 需大于系统按键自动重复的初始延迟
+
+    def __init__(self, on_change: Callable[[bool], None], key_name: str = DEFAULT_KEY, use_global_hotkey: bool = True):
+        self.on_change = on_change
+        self.key_name = key_name
+        self.use_global_hotkey = use_global_hotkey
+        self.is_pressed = False
+        self._global_listener = None
+        self._in_window_release_handle: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def is_global(self) -> bool:
+        """是否正在使用全局热键"""
+        return self._global_listener is not None
+
+    def start(self):
+        """启动全局热键监听（如果可用）"""
+        if self._global_listener or not self.use_global_hotkey or not PYNPUT_AVAILABLE:
+            return
+        try:
+            self._global_listener = pynput_keyboard.Listener(
+                on_press=self._on_global_press,
+                on_release=self._on_global_release
+            )
+            self._global_listener.daemon = True
+            self._global_listener.start()
+            print(f"Push-to-talk global hotkey registered: {self.key_name}")
+        except Exception as e:
+            print(f"Failed to register global push-to-talk hotkey: {e}")
+            self._global_listener = None
+
+    def stop(self):
+        """停止监听并释放按键状态"""
+        if self._global_listener:
+            self._global_listener.stop()
+            self._global_listener = None
+        if self._in_window_release_handle:
+            self._in_window_release_handle.cancel()
+            self._in_window_release_handle = None
+        self._set_pressed(False)
+
+    def set_key(self, key_name: str):
+        """修改绑定的按键"""
+        self.key_name = key_name
+        self._set_pressed(False)
+
+    def _set_pressed(self, pressed: bool):
+        if pressed == self.is_pressed:
+            return
+        self.is_pressed = pressed
+        self.on_change(pressed)
+
+    def _matches_global_key(self, key) -> bool:
+        key_name = getattr(key, 'name', None) or getattr(key, 'char', None)
+        return bool(key_name) and key_name.lower() == self.key_name.lower()
+
+    def _on_global_press(self, key):
+        if self._matches_global_key(key):
+            self._set_pressed(True)
+
+    def _on_global_release(self, key):
+        if self._matches_global_key(key):
+            self._set_pressed(False)
+
+    def handle_page_keyboard_event(self, e: ft.KeyboardEvent):
+        """处理窗口内键盘事件（需在事件循环中调用，全局热键生效时忽略）"""
+        if self.is_global or (e.key or "").lower() != self.key_name.lower():
+            return
+        self._set_pressed(True)
+
+        # 每次自动重复都推迟松开时间
+        loop = asyncio.get_running_loop()
+        if self._in_window_release_handle:
+            self._in_window_release_handle.cancel()
+        self._in_window_release_handle = loop.call_later(self.IN_WINDOW_REPEAT_GRACE, self._set_pressed, False)
@@ -0,0 +1,102 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple
+
+
+class ReconnectionManager:
+    """Socket.IO断线重连与会话恢复
+
+    记录当前会话的房间状态（文字频道、语音频道、麦克风状态、语音订阅），连接意外断开后按带抖动的
+    指数退避重试连接，连接恢复后按原顺序重新发送这些事件，让服务器把客户端放回原来的房间。
+    抖动使同时掉线的客户端不会在同一时刻一起重连。
+    """
+
+    BASE_DELAY_SECONDS = 0.5
+    MAX_DELAY_SECONDS = 30.0
+    MAX_ATTEMPTS = 0  # 0表示不限次数，直到用户退出或连接恢复
+
+    # 需要在重连后重放的事件，按重放顺序排列
+    REPLAY_ORDER = ('join_text_channel', 'join_voice_channel', 'user_microphone_status', 'update_voice_subscription')
+    _VOICE_EVENTS = ('join_voice_channel', 'user_microphone_status', 'update_voice_subscription')
+
+    def __init__(self):
+        self._session: Dict[str, Any] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.disconnected_at: Optional[float] = None
+        self.last_report: Optional[Dict[str, Any]] = None
+
+    @property
+    def is_reconnecting(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def voice_channel_id(self) -> Optional[int]:
+        data = self._session.get('join_voice_channel')
+        return data.get('channel_id') if isinstance(data, dict) else None
+
+    # --- 会话状态 ---
+    def track_emit(self, event: str, data: Any):
+        """根据发出的事件更新会话状态"""
+        if event in self.REPLAY_ORDER:
+            if event == 'join_voice_channel' and self.voice_channel_id != (data or {}).get('channel_id'):
+                # 换了语音频道，旧频道的麦克风状态和订阅不再适用
+                self._session.pop('user_microphone_status', None)
+                self._session.pop('update_voice_subscription', None)
+            self._session[event] = data
+        elif event == 'leave_voice_channel':
+            for voice_event in self._VOICE_EVENTS:
+                self._session.pop(voice_event, None)
+
+    def replay_events(self) -> List[Tuple[str, Any]]:
+        """重连后需要依次发送的事件"""
+        return [(event, self._session[event]) for event in self.REPLAY_ORDER if event in self._session]
+
+    def reset(self):
+        """退出登录时清空会话状态并停止重连"""
+        self._session.clear()
+        self.cancel()
+
+    # --- 重连 ---
+    def next_delay(self, attempt: int) -> float:
+        """第attempt次重试前的等待时间：指数退避上限的一半固定、一半随机"""
+        ceiling = min(self.MAX_DELAY_SECONDS, self.BASE_DELAY_SECONDS * (2 ** attempt))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def start(self, connect: Callable[[], Awaitable[bool]], restore: Callable[[List[Tuple[str, Any]]], Awaitable[None]],
+              on_attempt: Optional[Callable[[int, float], Awaitable[None]]] = None,
+              on_restored: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None):
+        """在当前事件循环中开始重连（已在重连时忽略）"""
+        if self.is_reconnecting:
+            return
+        self.disconnected_at = time.perf_counter()
+        self._task = asyncio.get_running_loop().create_task(self._run(connect, restore, on_attempt, on_restored))
+
+    def cancel(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+    async def _run(self, connect, restore, on_attempt, on_restored):
+        attempt = 0
+        while not self.MAX_ATTEMPTS or attempt < self.MAX_ATTEMPTS:
+            delay = self.next_delay(attempt)
+            attempt += 1
+            if on_attempt:
+                await on_attempt(attempt, delay)
+            await asyncio.sleep(delay)
+            if not await connect():
+                continue
+
+            events = self.replay_events()
+            await restore(events)
+            self.last_report = {
+                'attempts': attempt,
+                'restore_ms': round((time.perf_counter() - self.disconnected_at) * 1000, 1),
+                'replayed_events': [event for event, _ in events],
+            }
+            print(f"会话已恢复: 重试{attempt}次，用时{self.last_report['restore_ms']}ms，重放事件 {self.last_report['replayed_events']}")
+            if on_restored:
+                await on_restored(self.last_report)
+            return
+        print(f"重连失败: 已重试{attempt}次")
@@ -0,0 +1,126 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedAudioRingBuffer:
+    """跨进程的单生产者/单消费者音频环形缓冲区
+
+    与 AudioRingBuffer 的读写约定相同，但索引和样本都存放在 multiprocessing.shared_memory 中，
+    音频引擎子进程和主进程各自映射同一块内存。头部每个字段只由一方写入：
+    写索引、丢弃样本数和生产者状态计数由生产者写，读索引、欠载次数和消费者状态计数由消费者写。
+    索引是对齐的int64，先写样本再推进索引，对方读到新索引时样本已经就绪。
+    """
+
+    HEADER_FIELDS = 8
+    _WRITE_INDEX = 0
+    _READ_INDEX = 1
+    _DROPPED = 2
+    _PRODUCER_XRUNS = 3   # 生产者一侧的设备状态异常次数（采集流的溢出等）
+    _CONSUMER_XRUNS = 4   # 消费者一侧的设备状态异常次数（播放流的欠载标志等）
+    _UNDERRUNS = 5        # 消费者读取时数据不足的次数
+
+    def __init__(self, shm: shared_memory.SharedMemory, capacity: int, owner: bool):
+        self._shm = shm
+        self._owner = owner
+        self.capacity = int(capacity)
+        self.name = shm.name
+        self._header = np.ndarray((self.HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        self._buffer = np.ndarray((self.capacity,), dtype=np.float32, buffer=shm.buf, offset=self._header.nbytes)
+
+    @classmethod
+    def create(cls, capacity: int) -> "SharedAudioRingBuffer":
+        """创建新的共享缓冲区（主进程调用，负责最终释放）"""
+        size = cls.HEADER_FIELDS * 8 + int(capacity) * 4
+        ring = cls(shared_memory.SharedMemory(create=True, size=size), capacity, owner=True)
+        ring._header.fill(0)
+        return ring
+
+    @classmethod
+    def attach(cls, name: str, capacity: int) -> "SharedAudioRingBuffer":
+        """映射已有的共享缓冲区（子进程调用，生命周期由创建方管理）"""
+        return cls(shared_memory.SharedMemory(name=name, track=False), capacity, owner=False)
+
+    # --- 计数 ---
+    def available(self) -> int:
+        """可读取的样本数"""
+        return int(self._header[self._WRITE_INDEX] - self._header[self._READ_INDEX])
+
+    def free_space(self) -> int:
+        """可写入的样本数"""
+        return self.capacity - self.available()
+
+    @property
+    def dropped_samples(self) -> int:
+        return int(self._header[self._DROPPED])
+
+    @property
+    def underruns(self) -> int:
+        return int(self._header[self._UNDERRUNS])
+
+    @property
+    def producer_xruns(self) -> int:
+        return int(self._header[self._PRODUCER_XRUNS])
+
+    @property
+    def consumer_xruns(self) -> int:
+        return int(self._header[self._CONSUMER_XRUNS])
+
+    def mark_producer_xrun(self):
+        self._header[self._PRODUCER_XRUNS] += 1
+
+    def mark_consumer_xrun(self):
+        self._header[self._CONSUMER_XRUNS] += 1
+
+    # --- 读写 ---
+    def write(self, samples: np.ndarray) -> int:
+        """写入一维样本（生产者调用），缓冲区满时丢弃超出部分，返回实际写入数"""
+        write_index = int(self._header[self._WRITE_INDEX])
+        count = min(len(samples), self.capacity - (write_index - int(self._header[self._READ_INDEX])))
+        if count < len(samples):
+            self._header[self._DROPPED] += len(samples) - count
+        if count <= 0:
+            return 0
+
+        start = write_index % self.capacity
+        first = min(count, self.capacity - start)
+        np.copyto(self._buffer[start:start + first], samples[:first])
+        if first < count:
+            np.copyto(self._buffer[:count - first], samples[first:count])
+
+        self._header[self._WRITE_INDEX] = write_index + count
+        return count
+
+    def read_into(self, out: np.ndarray) -> int:
+        """读取样本到预分配的一维数组（消费者调用），返回实际读取数，不足时记一次欠载"""
+        read_index = int(self._header[self._READ_INDEX])
+        count = min(len(out), int(self._header[self._WRITE_INDEX]) - read_index)
+        if count < len(out):
+            self._header[self._UNDERRUNS] += 1
+        if count <= 0:
+            return 0
+
+        start = read_index % self.capacity
+        first = min(count, self.capacity - start)
+        np.copyto(out[:first], self._buffer[start:start + first])
+        if first < count:
+            np.copyto(out[first:count], self._buffer[:count - first])
+
+        self._header[self._READ_INDEX] = read_index + count
+        return count
+
+    def clear(self):
+        """清空缓冲区（消费者调用，或在生产者已停止时调用）"""
+        self._header[self._READ_INDEX] = self._header[self._WRITE_INDEX]
+
+    def close(self):
+        """解除映射；创建方同时释放共享内存"""
+        # numpy视图引用着共享内存的缓冲区，必须先释放才能关闭
+        self._header = None
+        self._buffer = None
+        self._shm.close()
+        if self._owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
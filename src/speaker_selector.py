@@ -0,0 +1,98 @@
+import math
+import time
+from typing import Dict, Optional, Set
+
+
+class ActiveSpeakerSelector:
+    """接收端的Top-N活跃说话人选择器
+
+    按最近能量（RMS的指数平滑）给发送者排名，只保留最响的N个。为避免两人能量接近时来回切换，
+    新说话人必须比当前最弱的入选者响 SWITCH_RATIO 倍才能替换它，且入选者至少保留 MIN_HOLD_SECONDS。
+    超过 SPEAKER_TIMEOUT_SECONDS 没有收到帧的入选者自动让出位置。
+    所有方法都在事件循环中调用，不需要加锁。
+    """
+
+    DEFAULT_MAX_SPEAKERS = 3
+    ENERGY_SMOOTHING = 0.3          # 新帧能量的权重
+    SWITCH_RATIO = 1.5              # 替换入选者所需的能量倍数
+    MIN_HOLD_SECONDS = 0.5          # 入选后至少保留的时间
+    SPEAKER_TIMEOUT_SECONDS = 0.4   # 入选者停止发送多久后让出位置
+    ENERGY_SAMPLE_STRIDE = 16       # 帧内没有rms字段时抽样估算能量的步长
+
+    def __init__(self, max_speakers: int = DEFAULT_MAX_SPEAKERS):
+        self.max_speakers = max(1, int(max_speakers))
+        self._energy: Dict[str, float] = {}
+        self._last_seen: Dict[str, float] = {}
+        self._selected_since: Dict[str, float] = {}
+        self.accepted_frames = 0
+        self.dropped_frames = 0
+
+    @property
+    def selected_speakers(self) -> Set[str]:
+        return set(self._selected_since)
+
+    @classmethod
+    def estimate_frame_energy(cls, data: Dict) -> float:
+        """取帧携带的rms；旧版客户端没有该字段时从音频列表中抽样估算（不做完整解码）"""
+        rms = data.get('rms')
+        if isinstance(rms, (int, float)):
+            return float(rms)
+        audio_chunk_list = data.get('audio_data') or []
+        total = 0.0
+        count = 0
+        for sample in audio_chunk_list[::cls.ENERGY_SAMPLE_STRIDE]:
+            value = sample[0] if isinstance(sample, list) else sample
+            total += value * value
+            count += 1
+        return math.sqrt(total / count) if count else 0.0
+
+    def should_accept(self, sender_id: str, energy: float, now: Optional[float] = None) -> bool:
+        """登记一帧的能量并决定是否解码播放"""
+        now = time.monotonic() if now is None else now
+        previous = self._energy.get(sender_id)
+        smoothed = energy if previous is None else previous + (energy - previous) * self.ENERGY_SMOOTHING
+        self._energy[sender_id] = smoothed
+        self._last_seen[sender_id] = now
+
+        self._expire_silent_speakers(now)
+
+        if sender_id in self._selected_since or len(self._selected_since) < self.max_speakers:
+            self._selected_since.setdefault(sender_id, now)
+            self.accepted_frames += 1
+            return True
+
+        # 在已过保留期的入选者中找能量最低的
+        weakest_id = None
+        weakest_energy = math.inf
+        for selected_id, selected_at in self._selected_since.items():
+            if now - selected_at < self.MIN_HOLD_SECONDS:
+                continue
+            selected_energy = self._energy.get(selected_id, 0.0)
+            if selected_energy < weakest_energy:
+                weakest_id, weakest_energy = selected_id, selected_energy
+
+        if weakest_id is not None and smoothed > weakest_energy * self.SWITCH_RATIO:
+            del self._selected_since[weakest_id]
+            self._selected_since[sender_id] = now
+            self.accepted_frames += 1
+            return True
+
+        self.dropped_frames += 1
+        return False
+
+    def _expire_silent_speakers(self, now: float):
+        for selected_id in [sid for sid in self._selected_since
+                            if now - self._last_seen.get(sid, 0.0) > self.SPEAKER_TIMEOUT_SECONDS]:
+            del self._selected_since[selected_id]
+
+    def remove_sender(self, sender_id: str):
+        """发送者离开频道"""
+        self._energy.pop(sender_id, None)
+        self._last_seen.pop(sender_id, None)
+        self._selected_since.pop(sender_id, None)
+
+    def reset(self):
+        """离开频道时清空所有状态"""
+        self._energy.clear()
+        self._last_seen.clear()
+        self._selected_since.clear()
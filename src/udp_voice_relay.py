@@ -0,0 +1,137 @@
+"""本地UDP语音中继（测试用的替身）
+
+在一台机器上完整走通UDP语音路径：客户端的HELLO注册（用户ID、频道），保活确认，
+以及把语音数据报转发给同一频道的其他客户端。不做令牌校验，只用于本地测试。
+
+用法：
+    python src/udp_voice_relay.py --port 5006            # 启动中继
+    python src/udp_voice_relay.py --port 5006 --echo     # 同时把语音回送给发送者（单客户端测试）
+    python src/udp_voice_relay.py --selftest             # 启动中继并用两个客户端验证整条路径
+客户端在配置中设置 "voice_udp_enabled": true 和 "voice_udp_relay": "127.0.0.1:5006" 即可跳过服务器信令直接使用本中继。
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, Tuple, Any
+
+import numpy as np
+
+from udp_voice_transport import UdpVoiceProtocol, UdpVoiceTransport
+
+
+class UdpVoiceRelay(asyncio.DatagramProtocol):
+    """按频道转发语音数据报的中继"""
+
+    CLIENT_TIMEOUT_SECONDS = 60.0
+
+    def __init__(self, echo: bool = False):
+        self.echo = echo
+        self.clients: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self.forwarded_packets = 0
+        self._transport = None
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        packet = UdpVoiceProtocol.unpack(data)
+        if packet is None:
+            return
+        packet_type, token, sequence, _, samplerate, rms, payload = packet
+        now = time.monotonic()
+
+        if packet_type == UdpVoiceProtocol.HELLO:
+            try:
+                info = json.loads(payload.decode())
+            except ValueError:
+                return
+            self.clients[addr] = {'user_id': int(info.get('user_id', 0)), 'channel_id': info.get('channel_id'), 'last_seen': now}
+            self._transport.sendto(UdpVoiceProtocol.pack(UdpVoiceProtocol.HELLO_ACK, token), addr)
+            print(f"Relay: {addr} joined channel {info.get('channel_id')} as user {info.get('user_id')}")
+            return
+
+        client = self.clients.get(addr)
+        if client is None:
+            return  # 未注册的地址
+        client['last_seen'] = now
+
+        if packet_type == UdpVoiceProtocol.KEEPALIVE:
+            self._transport.sendto(UdpVoiceProtocol.pack(UdpVoiceProtocol.KEEPALIVE_ACK, token), addr)
+        elif packet_type == UdpVoiceProtocol.VOICE:
+            # 发送者ID由中继按注册信息填写，客户端不能冒充他人
+            forwarded = UdpVoiceProtocol.pack(
+                UdpVoiceProtocol.VOICE, 0, sequence, client['user_id'], samplerate, rms, payload
+            )
+            for other_addr, other in list(self.clients.items()):
+                if now - other['last_seen'] > self.CLIENT_TIMEOUT_SECONDS:
+                    del self.clients[other_addr]
+                    continue
+                if other['channel_id'] != client['channel_id']:
+                    continue
+                if other_addr == addr and not self.echo:
+                    continue
+                self._transport.sendto(forwarded, other_addr)
+                self.forwarded_packets += 1
+
+
+async def start_relay(host: str, port: int, echo: bool = False):
+    loop = asyncio.get_running_loop()
+    transport, relay = await loop.create_datagram_endpoint(lambda: UdpVoiceRelay(echo), local_addr=(host, port))
+    bound_host, bound_port = transport.get_extra_info('sockname')[:2]
+    print(f"UDP voice relay listening on {bound_host}:{bound_port}{' (echo)' if echo else ''}")
+    return transport, relay
+
+
+async def run_selftest(host: str = '127.0.0.1', port: int = 0) -> bool:
+    """启动中继和两个客户端，验证探测、转发、序号和编解码"""
+    relay_transport, relay = await start_relay(host, port)
+    port = relay_transport.get_extra_info('sockname')[1]
+    received = []
+    sender = UdpVoiceTransport(host, port, token=1, user_id=1, channel_id=7, on_voice_frame=lambda frame: None)
+    listener = UdpVoiceTransport(host, port, token=2, user_id=2, channel_id=7, on_voice_frame=received.append)
+    try:
+        if not (await sender.start() and await listener.start()):
+            print("Selftest failed: relay did not answer")
+            return False
+        tone = (0.3 * np.sin(2 * np.pi * 440 * np.arange(960) / 48000)).astype(np.float32)
+        for _ in range(50):
+            sender.send_voice(tone, 48000, 0.2)
+            await asyncio.sleep(0.002)
+        await asyncio.sleep(0.2)
+
+        ok = len(received) == 50 and all(frame['user_id'] == 1 for frame in received)
+        error = float(np.max(np.abs(received[0]['audio_data'] - tone))) if received else 1.0
+        ok = ok and error < 0.02
+        print(f"Selftest {'passed' if ok else 'failed'}: received {len(received)}/50 frames, "
+              f"max codec error {error:.4f}, listener stats {listener.get_stats()}")
+        return ok
+    finally:
+        sender.close()
+        listener.close()
+        relay_transport.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local UDP voice relay for testing")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5006)
+    parser.add_argument('--echo', action='store_true', help="also send voice back to the sender")
+    parser.add_argument('--selftest', action='store_true', help="run the relay with two local clients and exit")
+    args = parser.parse_args()
+
+    if args.selftest:
+        raise SystemExit(0 if asyncio.run(run_selftest(args.host)) else 1)
+
+    async def serve():
+        await start_relay(args.host, args.port, args.echo)
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import struct
+from typing import Callable, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from voice_notes import VoiceNoteCodec
+
+
+class UdpVoiceProtocol:
+    """UDP语音数据报格式（客户端与中继共用）
+
+    头部：魔数、包类型、会话令牌、序号、发送者ID（由中继填写）、采样率、块RMS，之后是负载。
+    语音负载为8位μ-law（20ms@48kHz为960字节，加上头部不超过以太网MTU）。
+    """
+
+    MAGIC = b'ARCV'
+    HEADER = struct.Struct('!4sBQIIIf')
+
+    VOICE = 1
+    KEEPALIVE = 2
+    HELLO = 3
+    HELLO_ACK = 4
+    KEEPALIVE_ACK = 5
+
+    SEQUENCE_MODULO = 1 << 32
+
+    @classmethod
+    def pack(cls, packet_type: int, token: int, sequence: int = 0, sender_id: int = 0,
+             samplerate: int = 0, rms: float = 0.0, payload: bytes = b'') -> bytes:
+        return cls.HEADER.pack(cls.MAGIC, packet_type, token, sequence % cls.SEQUENCE_MODULO,
+                               sender_id, samplerate, rms) + payload
+
+    @classmethod
+    def unpack(cls, data: bytes) -> Optional[Tuple[int, int, int, int, int, float, bytes]]:
+        """解析数据报，格式不符时返回None：(类型, 令牌, 序号, 发送者ID, 采样率, RMS, 负载)"""
+        if len(data) < cls.HEADER.size:
+            return None
+        magic, packet_type, token, sequence, sender_id, samplerate, rms = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            return None
+        return packet_type, token, sequence, sender_id, samplerate, rms, data[cls.HEADER.size:]
+
+    @classmethod
+    def sequence_delta(cls, sequence: int, previous: int) -> int:
+        """考虑回绕的序号差（正数表示更新的包）"""
+        delta = (sequence - previous) % cls.SEQUENCE_MODULO
+        return delta - cls.SEQUENCE_MODULO if delta >= cls.SEQUENCE_MODULO // 2 else delta
+
+
+class _TransportProtocol(asyncio.DatagramProtocol):
+    def __init__(self, owner: "UdpVoiceTransport"):
+        self._owner = owner
+
+    def datagram_received(self, data: bytes, addr):
+        self._owner._on_datagram(data)
+
+    def error_received(self, exc):
+        # ICMP端口不可达等错误：中继不可用或UDP被阻断，由探测/保活超时统一处理
+        self._owner.last_error = str(exc)
+
+
+class UdpVoiceTransport:
+    """基于UDP数据报的语音传输
+
+    Socket.IO连接只用于信令（加入、令牌、中继地址和端口），语音帧以带序号的数据报收发：
+    丢失的帧不重传，也不会阻塞后续的帧。建立时先发送HELLO探测，收不到确认即认为UDP被阻断；
+    之后定期发送保活包维持NAT映射；一段时间收不到中继的任何数据就每秒发送保活探测，
+    几秒内仍收不到确认即通知调用方退回websocket路径。
+    """
+
+    PROBE_TIMEOUT_SECONDS = 2.0
+    PROBE_RETRY_SECONDS = 0.25
+    KEEPALIVE_INTERVAL_SECONDS = 15.0  # 一直收到数据时维持NAT映射的保活间隔
+    PROBE_INTERVAL_SECONDS = 1.0       # 超过该时间没有收到任何数据时，每隔该时间发送一次保活探测
+    FAILURE_TIMEOUT_SECONDS = 3.0      # 持续这么久收不到任何数据（包括保活确认）即判定UDP路径失效
+    REORDER_WINDOW = 64  # 序号落后超过该值视为发送者重新加入（序号从0开始），而不是迟到
+
+    def __init__(self, host: str, port: int, token: int, user_id: int, channel_id: Any,
+                 on_voice_frame: Callable[[Dict[str, Any]], None],
+                 on_failed: Optional[Callable[[str], None]] = None):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self._on_voice_frame = on_voice_frame
+        self._on_failed = on_failed
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._hello_acked: Optional[asyncio.Event] = None
+        self._keepalive_task: Optional[asyncio.Task] = None
+        self._last_received = 0.0
+        self._next_sequence = 0
+        self._last_sequences: Dict[int, int] = {}
+        self.closed = False
+        self.last_error: Optional[str] = None
+        self.sent_frames = 0
+        self.received_frames = 0
+        self.lost_frames = 0
+        self.late_frames = 0
+
+    @property
+    def is_active(self) -> bool:
+        return self._transport is not None and not self.closed
+
+    async def start(self) -> bool:
+        """打开UDP套接字并探测中继，成功返回True（UDP被阻断时返回False）"""
+        loop = asyncio.get_running_loop()
+        self._hello_acked = asyncio.Event()
+        try:
+            self._transport, _ = await loop.create_datagram_endpoint(
+                lambda: _TransportProtocol(self), remote_addr=(self.host, self.port)
+            )
+        except OSError as e:
+            print(f"UDP语音传输无法打开套接字: {e}")
+            return False
+
+        hello = UdpVoiceProtocol.pack(
+            UdpVoiceProtocol.HELLO, self.token, sender_id=self.user_id,
+            payload=json.dumps({'user_id': self.user_id, 'channel_id': self.channel_id}).encode()
+        )
+        deadline = loop.time() + self.PROBE_TIMEOUT_SECONDS
+        while loop.time() < deadline:
+            self._transport.sendto(hello)
+            try:
+                await asyncio.wait_for(self._hello_acked.wait(), self.PROBE_RETRY_SECONDS)
+                break
+            except asyncio.TimeoutError:
+                continue
+        if not self._hello_acked.is_set():
+            print(f"UDP语音中继 {self.host}:{self.port} 无响应（{self.last_error or '超时'}），使用websocket传输")
+            self.close()
+            return False
+
+        self._last_received = loop.time()
+        self._keepalive_task = loop.create_task(self._keepalive_loop())
+        print(f"UDP语音传输已建立: {self.host}:{self.port}")
+        return True
+
+    def send_voice(self, samples: np.ndarray, samplerate: int, rms: Optional[float]):
+        """编码并发送一个语音帧（不等待、不重传）"""
+        if not self.is_active:
+            return
+        payload = VoiceNoteCodec.encode(samples.reshape(-1))
+        packet = UdpVoiceProtocol.pack(
+            UdpVoiceProtocol.VOICE, self.token, self._next_sequence, self.user_id,
+            samplerate, float(rms or 0.0), payload
+        )
+        self._next_sequence += 1
+        self._transport.sendto(packet)
+        self.sent_frames += 1
+
+    def close(self):
+        self.closed = True
+        if self._keepalive_task:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        if self._transport:
+            self._transport.close()
+            self._transport = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'sent_frames': self.sent_frames,
+            'received_frames': self.received_frames,
+            'lost_frames': self.lost_frames,
+            'late_frames': self.late_frames,
+        }
+
+    async def _keepalive_loop(self):
+        """维持NAT映射并检测路径失效：静默时每秒探测，FAILURE_TIMEOUT_SECONDS内收不到任何数据即失效"""
+        loop = asyncio.get_running_loop()
+        keepalive = UdpVoiceProtocol.pack(UdpVoiceProtocol.KEEPALIVE, self.token, sender_id=self.user_id)
+        last_keepalive = loop.time()
+        while not self.closed:
+            await asyncio.sleep(self.PROBE_INTERVAL_SECONDS)
+            now = loop.time()
+            silent_seconds = now - self._last_received
+            if silent_seconds >= self.FAILURE_TIMEOUT_SECONDS:
+                reason = f"{silent_seconds:.1f}秒未收到中继的任何数据"
+                print(f"UDP语音传输失效（{reason}），退回websocket传输")
+                self.close()
+                if self._on_failed:
+                    self._on_failed(reason)
+                return
+            if silent_seconds >= self.PROBE_INTERVAL_SECONDS or now - last_keepalive >= self.KEEPALIVE_INTERVAL_SECONDS:
+                self._transport.sendto(keepalive)
+                last_keepalive = now
+
+    def _on_datagram(self, data: bytes):
+        packet = UdpVoiceProtocol.unpack(data)
+        if packet is None:
+            return
+        packet_type, token, sequence, sender_id, samplerate, rms, payload = packet
+        # 任何来自中继的数据（包括保活确认）都说明路径可用
+        self._last_received = asyncio.get_running_loop().time()
+        if packet_type == UdpVoiceProtocol.HELLO_ACK:
+            self._hello_acked.set()
+            return
+        if packet_type != UdpVoiceProtocol.VOICE:
+            return
+
+        previous = self._last_sequences.get(sender_id)
+        if previous is not None:
+            delta = UdpVoiceProtocol.sequence_delta(sequence, previous)
+            if -self.REORDER_WINDOW < delta <= 0:
+                self.late_frames += 1  # 迟到或重复的帧直接丢弃，后面的帧已经播放
+                return
+            if delta > 0:
+                self.lost_frames += delta - 1
+        self._last_sequences[sender_id] = sequence
+        self.received_frames += 1
+
+        self._on_voice_frame({
+            'user_id': sender_id,
+            'audio_data': VoiceNoteCodec.decode(payload),
+            'samplerate': samplerate,
+            'channels': 1,
+            'dtype': 'float32',
+            'rms': rms,
+            'sequence': sequence,
+        })
@@ -244,6 +244,20 @@ class UIManager:
             icon_color=COLOR_PRIMARY
         )
         
+        # 按住录制语音消息，松开发送
+        self.controls['voice_note_button'] = ft.GestureDetector(
+            content=ft.Container(
+                content=ft.Icon(ft.Icons.MIC_NONE, color=COLOR_PRIMARY, size=22),
+                padding=8,
+                tooltip="Hold to record a voice message"
+            ),
+            on_tap_down=lambda e: self._on_voice_note(True),
+            on_tap_up=lambda e: self._on_voice_note(False),
+            on_long_press_start=lambda e: self._on_voice_note(True),
+            on_long_press_end=lambda e: self._on_voice_note(False),
+            on_pan_end=lambda e: self._on_voice_note(False)
+        )
+        
         # 语音相关
         self.controls['voice_channel_topic_display'] = ft.Text(
             "Voice Channel", 
@@ -393,6 +407,97 @@ class UIManager:
             tooltip="Save selected Input/Output devices"
         )
         
+        self.controls['voice_settings_calibrate_button'] = ft.TextButton(
+            text="Calibrate Latency",
+            icon=ft.Icons.TUNE,
+            on_click=self._on_calibrate_latency_click,
+            style=ft.ButtonStyle(color=COLOR_PRIMARY),
+            height=32,
+            tooltip="Find the lowest stable latency for the selected devices"
+        )
+        
+        self.controls['voice_settings_echo_test_button'] = ft.TextButton(
+            text="Network Echo Test",
+            icon=ft.Icons.NETWORK_CHECK,
+            on_click=self._on_echo_test_click,
+            style=ft.ButtonStyle(color=COLOR_PRIMARY),
+            height=32,
+            tooltip="Send your voice through the server and back to measure latency, loss and jitter"
+        )
+        
+        self.controls['voice_record_button'] = ft.TextButton(
+            text="Record",
+            icon=ft.Icons.FIBER_MANUAL_RECORD,
+            on_click=self._on_record_click,
+            style=ft.ButtonStyle(color=COLOR_PRIMARY),
+            height=32,
+            tooltip="Record this voice channel to a WAV file"
+        )
+        
+        # 音板
+        self.controls['soundboard_clip_dropdown'] = ft.Dropdown(
+            hint_text="Soundboard",
+            options=[],
+            text_size=12,
+            dense=True,
+            expand=True,
+            border_color=COLOR_BORDER,
+            color=COLOR_TEXT_ON_WHITE
+        )
+        
+        self.controls['soundboard_play_button'] = ft.IconButton(
+            icon=ft.Icons.PLAY_CIRCLE_OUTLINE,
+            icon_color=COLOR_PRIMARY,
+            tooltip="Play clip into the channel",
+            on_click=self._on_soundboard_play_click
+        )
+        
+        self.controls['soundboard_stop_button'] = ft.IconButton(
+            icon=ft.Icons.STOP_CIRCLE_OUTLINED,
+            icon_color=COLOR_PRIMARY,
+            tooltip="Stop clip",
+            on_click=self._on_soundboard_stop_click
+        )
+        
+        self.controls['voice_settings_ptt_switch'] = ft.Switch(
+            label="Push to Talk",
+            value=False,
+            active_color=COLOR_PRIMARY,
+            label_style=ft.TextStyle(color=COLOR_TEXT_ON_WHITE, size=12),
+            on_change=self._on_push_to_talk_mode_change
+        )
+        
+        # 按住说话按钮：GestureDetector能同时收到按下和松开事件
+        self.controls['voice_settings_ptt_button'] = ft.GestureDetector(
+            content=ft.Container(
+                content=ft.Row(
+                    [
+                        ft.Icon(ft.Icons.KEYBOARD_VOICE, color=COLOR_BUTTON_TEXT, size=16),
+                        ft.Text("Hold to Talk", color=COLOR_BUTTON_TEXT, size=12)
+                    ],
+                    alignment=ft.MainAxisAlignment.CENTER,
+                    spacing=5
+                ),
+                bgcolor=COLOR_PRIMARY,
+                border_radius=5,
+                height=36,
+                padding=ft.padding.symmetric(horizontal=12)
+            ),
+            on_tap_down=lambda e: self._on_push_to_talk(True),
+            on_tap_up=lambda e: self._on_push_to_talk(False),
+            on_long_press_start=lambda e: self._on_push_to_talk(True),
+            on_long_press_end=lambda e: self._on_push_to_talk(False),
+            on_pan_end=lambda e: self._on_push_to_talk(False),
+            visible=False
+        )
+        
+        self.controls['voice_settings_diagnostics_text'] = ft.Text(
+            "RMS -- | Peak -- | ZCR --",
+            size=11,
+            color=COLOR_STATUS_TEXT_MUTED,
+            font_family="Consolas"
+        )
+        
         self.controls['voice_settings_area'] = ft.Column(
             [
                 ft.Text("Voice Settings", weight=ft.FontWeight.BOLD, size=14, color=COLOR_TEXT_ON_WHITE),
@@ -419,7 +524,34 @@ class UIManager:
                     ],
                     alignment=ft.MainAxisAlignment.SPACE_AROUND,
                     vertical_alignment=ft.CrossAxisAlignment.CENTER,
-                )
+                ),
+                ft.Row(
+                    [
+                        self.controls['voice_settings_ptt_switch'],
+                        self.controls['voice_settings_ptt_button']
+                    ],
+                    alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
+                    vertical_alignment=ft.CrossAxisAlignment.CENTER,
+                ),
+                ft.Row(
+                    [
+                        self.controls['voice_settings_calibrate_button'],
+                        self.controls['voice_settings_echo_test_button'],
+                        self.controls['voice_record_button']
+                    ],
+                    alignment=ft.MainAxisAlignment.SPACE_AROUND,
+                    spacing=0
+                ),
+                ft.Row(
+                    [
+                        self.controls['soundboard_clip_dropdown'],
+                        self.controls['soundboard_play_button'],
+                        self.controls['soundboard_stop_button']
+                    ],
+                    vertical_alignment=ft.CrossAxisAlignment.CENTER,
+                    spacing=0
+                ),
+                self.controls['voice_settings_diagnostics_text']
             ],
             visible=False,
             spacing=10,
@@ -478,7 +610,7 @@ class UIManager:
             self.controls['current_chat_topic'],
             ft.Divider(height=1, color=COLOR_DIVIDER_ON_WHITE),
             self.controls['chat_messages_view'],
-            ft.Row([self.controls['message_input_field'], self.controls['send_message_button']])
+            ft.Row([self.controls['message_input_field'], self.controls['voice_note_button'], self.controls['send_message_button']])
         ], expand=True, visible=True)
         
         # 语音面板
@@ -644,6 +776,47 @@ class UIManager:
         if callback:
             self.page.run_task(callback, e)
     
+    def _on_calibrate_latency_click(self, e):
+        callback = self.get_callback('on_calibrate_latency')
+        if callback:
+            self.page.run_task(callback, e)
+    
+    def _on_soundboard_play_click(self, e):
+        callback = self.get_callback('on_soundboard_play')
+        if callback:
+            self.page.run_task(callback, e)
+    
+    def _on_soundboard_stop_click(self, e):
+        callback = self.get_callback('on_soundboard_stop')
+        if callback:
+            callback(e)
+    
+    def _on_record_click(self, e):
+        callback = self.get_callback('on_record_toggle')
+        if callback:
+            self.page.run_task(callback, e)
+    
+    def _on_echo_test_click(self, e):
+        callback = self.get_callback('on_echo_test')
+        if callback:
+            self.page.run_task(callback, e)
+    
+    def _on_push_to_talk_mode_change(self, e):
+        callback = self.get_callback('on_push_to_talk_mode_change')
+        if callback:
+            self.page.run_task(callback, e)
+    
+    def _on_push_to_talk(self, pressed: bool):
+        # 按键状态直接同步传递，避免排队延迟吞掉第一个音节
+        callback = self.get_callback('on_push_to_talk')
+        if callback:
+            callback(pressed)
+    
+    def _on_voice_note(self, pressed: bool):
+        callback = self.get_callback('on_voice_note')
+        if callback:
+            callback(pressed)
+    
     # UI状态管理方法
     def show_view(self, view_name: str):
         """显示指定视图"""
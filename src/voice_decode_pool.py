@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Any, List, Set
+
+import numpy as np
+
+from audio_ring_buffer import AudioRingBuffer
+
+
+class VoiceDecodePool:
+    """接收语音帧的解码线程池
+
+    事件循环只把帧放入发送者的待解码队列；列表到数组的转换、重采样和规范化都在工作线程中完成，
+    结果直接写入该发送者的混音环形缓冲区。同一发送者同一时刻最多只有一个工作线程在解码，
+    按到达顺序逐帧处理，因此每个环形缓冲区仍然只有一个生产者，帧顺序也不会被打乱；
+    不同发送者之间并行解码（NumPy/SciPy的数值运算会释放GIL）。
+
+    卡顿（GC停顿、拖动窗口、网络突发）之后同一发送者积压了多帧时，不再逐帧走Python路径，
+    而是一次取出全部积压帧：先按混音缓冲区剩余空间丢弃已经迟到的旧帧，再把剩下的帧作为一个批次
+    一起解码、重采样和应用音量，一步追上实时。
+    """
+
+    MAX_WORKERS = 4
+    MAX_PENDING_FRAMES = 8  # 每个发送者最多积压的帧数（约160ms），超出时丢弃最旧的帧
+    BATCH_THRESHOLD = 2     # 积压帧数达到该值时按批次处理
+
+    def __init__(self, decode: Callable[[list, int, float, np.ndarray], np.ndarray],
+                 decode_batch: Callable[[List[list], int, float], np.ndarray],
+                 output_samplerate: int, max_workers: int = 0):
+        workers = max_workers or max(1, min(self.MAX_WORKERS, (os.cpu_count() or 2) - 1))
+        self.max_workers = workers
+        self._decode = decode
+        self._decode_batch = decode_batch
+        self.output_samplerate = output_samplerate
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="voice-decode")
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Deque[tuple]] = {}
+        self._draining: Set[str] = set()
+        self._local = threading.local()
+        self.decoded_frames = 0
+        self.dropped_frames = 0
+        self.decode_errors = 0
+        self.max_decode_ms = 0.0
+        self.batches = 0
+        self.max_batch_frames = 0
+        self.late_dropped_frames = 0
+
+    def submit(self, sender_id: str, sink: AudioRingBuffer, audio_chunk_list: list, samplerate: int, volume: float = 1.0):
+        """把一帧交给解码线程池（事件循环中调用，不阻塞）"""
+        with self._lock:
+            queue = self._pending.get(sender_id)
+            if queue is None:
+                queue = self._pending[sender_id] = deque()
+            if len(queue) >= self.MAX_PENDING_FRAMES:
+                queue.popleft()
+                self.dropped_frames += 1
+            queue.append((sink, audio_chunk_list, samplerate, volume))
+            if sender_id in self._draining:
+                return
+            self._draining.add(sender_id)
+        self._executor.submit(self._drain_sender, sender_id)
+
+    def discard_sender(self, sender_id: str):
+        """丢弃某个发送者尚未解码的帧（正在解码的一帧仍会写入旧的缓冲区，随后被丢弃）"""
+        with self._lock:
+            self._pending.pop(sender_id, None)
+
+    def discard_all(self):
+        with self._lock:
+            self._pending.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = sum(len(queue) for queue in self._pending.values())
+        return {
+            'workers': self.max_workers,
+            'decoded_frames': self.decoded_frames,
+            'dropped_frames': self.dropped_frames,
+            'decode_errors': self.decode_errors,
+            'pending_frames': pending,
+            'max_decode_ms': round(self.max_decode_ms, 3),
+            'batches': self.batches,
+            'max_batch_frames': self.max_batch_frames,
+            'late_dropped_frames': self.late_dropped_frames,
+        }
+
+    def shutdown(self):
+        self.discard_all()
+        self._executor.shutdown(wait=False)
+
+    def _process_batch(self, frames: List[tuple]) -> int:
+        """一次处理同一发送者积压的多帧，返回实际解码的帧数"""
+        # 按最新一帧的缓冲区、采样率和音量处理；采样率中途变化的旧帧直接视为迟到
+        sink, _, samplerate, volume = frames[-1]
+        frames = [frame for frame in frames if frame[2] == samplerate and frame[0] is sink]
+
+        # 迟到丢弃：混音缓冲区放不下的部分本来也会被丢弃，只保留能放下的最新帧，且不去解码被丢弃的帧
+        samples_per_frame = max(1, int(len(frames[-1][1]) * self.output_samplerate / samplerate))
+        keep = max(1, sink.free_space() // samples_per_frame)
+        late = max(0, len(frames) - keep)
+        if late:
+            frames = frames[late:]
+
+        samples = self._decode_batch([frame[1] for frame in frames], samplerate, volume)
+        sink.write(samples.reshape(-1))
+        with self._lock:
+            self.batches += 1
+            self.max_batch_frames = max(self.max_batch_frames, len(frames) + late)
+            self.late_dropped_frames += late
+        return len(frames)
+
+    def _scratch(self, sample_count: int) -> np.ndarray:
+        """每个工作线程一块预分配的解码缓冲区"""
+        scratch = getattr(self._local, 'scratch', None)
+        if scratch is None or len(scratch) < sample_count:
+            scratch = np.zeros(max(sample_count, 4096), dtype=np.float32)
+            self._local.scratch = scratch
+        return scratch
+
+    def _drain_sender(self, sender_id: str):
+        while True:
+            with self._lock:
+                queue = self._pending.get(sender_id)
+                if not queue:
+                    self._pending.pop(sender_id, None)
+                    self._draining.discard(sender_id)
+                    return
+                if len(queue) >= self.BATCH_THRESHOLD:
+                    frames = list(queue)
+                    queue.clear()
+                else:
+                    frames = [queue.popleft()]
+
+            started = time.perf_counter()
+            try:
+                if len(frames) == 1:
+                    sink, audio_chunk_list, samplerate, volume = frames[0]
+                    samples = self._decode(audio_chunk_list, samplerate, volume, self._scratch(len(audio_chunk_list)))
+                    sink.write(samples.reshape(-1))
+                    decoded = 1
+                else:
+                    decoded = self._process_batch(frames)
+            except Exception as e:
+                with self._lock:
+                    self.decode_errors += 1
+                print(f"处理音频数据块时出错: {e}")
+                continue
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.decoded_frames += decoded
+                self.max_decode_ms = max(self.max_decode_ms, elapsed_ms)
@@ -0,0 +1,134 @@
+"""本地Socket.IO回声服务器（回声测试用的替身）
+
+实现客户端回声测试用到的服务器端点：主连接和/voice语音连接上的 voice_echo 原样回送为
+voice_echo_reply，加入语音传输的 join_voice_transport，以及应用层心跳 client_ping。
+可以模拟单向时延和丢包，用来验证回声测试对网络问题的判断。不做认证，只用于本地测试。
+
+用法：
+    python src/voice_echo_server.py --port 5000                          # 启动（HTTP）
+    python src/voice_echo_server.py --port 5000 --delay-ms 80 --loss 0.1 # 模拟较差的网络
+    python src/voice_echo_server.py --certfile cert.pem --keyfile key.pem # HTTPS，供客户端直接连接
+客户端使用HTTPS地址，在配置中把 "server_address"/"server_port" 指向以HTTPS启动的本服务器即可。
+"""
+import argparse
+import asyncio
+import random
+import ssl
+from typing import Optional, Set, Tuple
+
+import socketio
+from aiohttp import web
+
+VOICE_NAMESPACE = "/voice"
+STOP_TIMEOUT_SECONDS = 2.0  # 停止时等待断开客户端、关闭连接的上限
+
+
+class VoiceEchoServer:
+    """回送voice_echo帧的Socket.IO服务器"""
+
+    def __init__(self, delay_ms: float = 0.0, loss: float = 0.0):
+        self.delay_ms = delay_ms
+        self.loss = loss
+        self.echoed_frames = 0
+        self.dropped_frames = 0
+        self.sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins='*')
+        self.app = web.Application()
+        self.sio.attach(self.app)
+        self._runner: Optional[web.AppRunner] = None
+        self._pending_replies: Set[asyncio.Task] = set()
+        self._register_handlers()
+
+    def _register_handlers(self):
+        for namespace in ('/', VOICE_NAMESPACE):
+            self.sio.on('voice_echo', self._make_echo_handler(namespace), namespace=namespace)
+        self.sio.on('client_ping', self._client_ping, namespace='/')
+        self.sio.on('join_voice_transport', self._join_voice_transport, namespace=VOICE_NAMESPACE)
+
+    def _make_echo_handler(self, namespace: str):
+        async def voice_echo(sid, data):
+            if self.loss and random.random() < self.loss:
+                self.dropped_frames += 1
+                return
+            if self.delay_ms:
+                # 不阻塞后续帧：每帧各自延迟后回送
+                task = asyncio.create_task(self._reply(sid, data, namespace, self.delay_ms / 1000))
+                self._pending_replies.add(task)
+                task.add_done_callback(self._pending_replies.discard)
+                return
+            await self._reply(sid, data, namespace)
+        return voice_echo
+
+    async def _reply(self, sid, data, namespace: str, delay: float = 0.0):
+        if delay:
+            await asyncio.sleep(delay)
+        self.echoed_frames += 1
+        await self.sio.emit('voice_echo_reply', data, to=sid, namespace=namespace)
+
+    async def _client_ping(self, sid, data):
+        return {'ok': True}
+
+    async def _join_voice_transport(self, sid, data):
+        return {'ok': True}
+
+    async def start(self, host: str, port: int, ssl_context: Optional[ssl.SSLContext] = None) -> Tuple[str, int]:
+        """开始监听，返回实际绑定的(地址, 端口)（port为0时由系统分配）"""
+        self._runner = web.AppRunner(self.app, shutdown_timeout=STOP_TIMEOUT_SECONDS)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port, ssl_context=ssl_context)
+        await site.start()
+        bound_host, bound_port = self._runner.addresses[0][:2]
+        print(f"Voice echo server listening on {'https' if ssl_context else 'http'}://{bound_host}:{bound_port}"
+              f" (delay {self.delay_ms}ms, loss {self.loss:.0%})")
+        return bound_host, bound_port
+
+    async def stop(self):
+        for task in list(self._pending_replies):
+            task.cancel()
+        if self._runner is None:
+            return
+        # 先断开客户端，否则aiohttp要等到websocket连接自行关闭才会停止。
+        # 刚断开的客户端可能还留在sockets中，其发送循环已退出，再关闭会一直等待发送队列，所以只断开仍连接的客户端
+        sids = [sid for sid, socket in self.sio.eio.sockets.items()
+                if socket.connected and not socket.closed and not socket.closing]
+        try:
+            if sids:
+                await asyncio.wait_for(asyncio.gather(*(self.sio.eio.disconnect(sid) for sid in sids)),
+                                       STOP_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            print(f"Voice echo server: {len(sids)} clients did not close within {STOP_TIMEOUT_SECONDS}s")
+        finally:
+            runner, self._runner = self._runner, None
+            try:
+                await asyncio.wait_for(runner.cleanup(), STOP_TIMEOUT_SECONDS * 2)
+            except asyncio.TimeoutError:
+                print("Voice echo server: shutdown timed out")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Socket.IO voice echo server for testing")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--delay-ms', type=float, default=0.0, help="simulated one-way delay before each reply")
+    parser.add_argument('--loss', type=float, default=0.0, help="fraction of frames to drop")
+    parser.add_argument('--certfile', help="serve HTTPS with this certificate")
+    parser.add_argument('--keyfile', help="private key for --certfile")
+    args = parser.parse_args()
+
+    ssl_context = None
+    if args.certfile:
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(args.certfile, args.keyfile)
+
+    async def serve():
+        server = VoiceEchoServer(args.delay_ms, args.loss)
+        await server.start(args.host, args.port, ssl_context)
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import threading
+import time
+from typing import Dict, Any, Optional
+
+from metrics_recorder import MetricsRecorder
+
+
+class EchoTestSession:
+    """端到端回声测试的一次会话
+
+    采集回调为每个发送帧分配序号并记录发送时间，服务器原样回送后在事件循环中登记回包，
+    据此统计往返时延分位数、丢包率和到达抖动（RFC 3550的平滑抖动算法）。
+    结合设备自身的输入/输出延迟估算嘴到耳延迟，并判断问题更可能出在网络还是设备。
+    """
+
+    # 判定阈值
+    NETWORK_LOSS_THRESHOLD = 0.05       # 丢包率
+    NETWORK_RTT_P95_THRESHOLD_MS = 300  # 往返时延p95
+    NETWORK_JITTER_THRESHOLD_MS = 30    # 平滑抖动
+    DEVICE_LATENCY_THRESHOLD_MS = 100   # 设备输入+输出延迟
+    MAX_PENDING_FRAMES = 1000           # 未回包帧记录上限，防止服务器不回送时无限增长
+
+    def __init__(self, metrics: MetricsRecorder):
+        self.metrics = metrics
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._next_sequence = 0
+        self._send_times: Dict[int, float] = {}
+        self.sent_frames = 0
+        self.received_frames = 0
+        self.late_or_duplicate_frames = 0
+        self.jitter_ms = 0.0
+        self._last_transit: Optional[float] = None
+
+    def stamp_send(self) -> tuple:
+        """分配下一个序号并记录发送时间（采集回调线程调用），返回(序号, 发送时间)"""
+        send_time = time.perf_counter()
+        with self._lock:
+            sequence = self._next_sequence
+            self._next_sequence += 1
+            self.sent_frames += 1
+            self._send_times[sequence] = send_time
+            if len(self._send_times) > self.MAX_PENDING_FRAMES:
+                self._send_times.pop(next(iter(self._send_times)))
+        return sequence, send_time
+
+    def record_reply(self, sequence: int) -> Optional[float]:
+        """登记一个回包，返回往返时延(ms)，未知或重复的序号返回None"""
+        receive_time = time.perf_counter()
+        with self._lock:
+            send_time = self._send_times.pop(sequence, None)
+            if send_time is None:
+                self.late_or_duplicate_frames += 1
+                return None
+            self.received_frames += 1
+            transit = receive_time - send_time
+            if self._last_transit is not None:
+                deviation_ms = abs(transit - self._last_transit) * 1000
+                self.jitter_ms += (deviation_ms - self.jitter_ms) / 16
+            self._last_transit = transit
+        rtt_ms = transit * 1000
+        self.metrics.record('echo_rtt_ms', rtt_ms)
+        return rtt_ms
+
+    def build_report(self, device_latency_ms: float, playback_buffer_ms: float, device_xruns: int) -> Dict[str, Any]:
+        """汇总测试结果"""
+        sent = self.sent_frames
+        loss = 1 - self.received_frames / sent if sent else 0.0
+        rtt_p50 = self.metrics.percentile('echo_rtt_ms', 50)
+        rtt_p95 = self.metrics.percentile('echo_rtt_ms', 95)
+        rtt_p99 = self.metrics.percentile('echo_rtt_ms', 99)
+
+        report = {
+            'sent': sent,
+            'received': self.received_frames,
+            'loss': round(loss, 4),
+            'rtt_p50_ms': rtt_p50,
+            'rtt_p95_ms': rtt_p95,
+            'rtt_p99_ms': rtt_p99,
+            'jitter_ms': round(self.jitter_ms, 2),
+            'device_latency_ms': round(device_latency_ms, 1),
+            'device_xruns': device_xruns,
+            # 单向网络时延按往返的一半估算
+            'mouth_to_ear_ms': round(device_latency_ms + playback_buffer_ms + rtt_p50 / 2, 1) if rtt_p50 is not None else None,
+        }
+
+        network_problem = (
+            self.received_frames == 0
+            or loss > self.NETWORK_LOSS_THRESHOLD
+            or rtt_p95 > self.NETWORK_RTT_P95_THRESHOLD_MS
+            or self.jitter_ms > self.NETWORK_JITTER_THRESHOLD_MS
+        )
+        device_problem = device_latency_ms > self.DEVICE_LATENCY_THRESHOLD_MS or device_xruns > 0
+        if network_problem and device_problem:
+            report['verdict'] = 'network+device'
+        elif network_problem:
+            report['verdict'] = 'network'
+        elif device_problem:
+            report['verdict'] = 'device'
+        else:
+            report['verdict'] = 'ok'
+        return report
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from typing import Optional, Callable, Awaitable, Dict, Any
+
+import numpy as np
+
+from audio_ring_buffer import AudioRingBuffer
+
+
+class VoiceNoteCodec:
+    """语音消息编解码：16kHz单声道、8位μ-law（64kbps，约为float32 JSON列表的1/20）"""
+
+    CODEC_NAME = "mulaw"
+    SAMPLERATE = 16000
+    MU = 255.0
+
+    @classmethod
+    def downsample(cls, samples: np.ndarray, source_rate: int) -> np.ndarray:
+        """降采样到16kHz；源采样率为整数倍时按组求平均（同时起到简单的抗混叠作用）"""
+        if source_rate == cls.SAMPLERATE:
+            return samples
+        factor = source_rate // cls.SAMPLERATE
+        if factor * cls.SAMPLERATE == source_rate:
+            usable = len(samples) - len(samples) % factor
+            return samples[:usable].reshape(-1, factor).mean(axis=1)
+        target_length = int(len(samples) * cls.SAMPLERATE / source_rate)
+        return np.interp(np.linspace(0, len(samples) - 1, target_length), np.arange(len(samples)), samples).astype(np.float32)
+
+    @classmethod
+    def upsample(cls, samples: np.ndarray, target_rate: int) -> np.ndarray:
+        """从16kHz线性插值到播放采样率"""
+        if target_rate == cls.SAMPLERATE or len(samples) == 0:
+            return samples
+        target_length = int(len(samples) * target_rate / cls.SAMPLERATE)
+        return np.interp(np.linspace(0, len(samples) - 1, target_length), np.arange(len(samples)), samples).astype(np.float32)
+
+    @classmethod
+    def encode(cls, samples: np.ndarray) -> bytes:
+        """float32 [-1, 1] -> μ-law字节"""
+        clipped = np.clip(samples, -1.0, 1.0)
+        compressed = np.sign(clipped) * np.log1p(cls.MU * np.abs(clipped)) / np.log1p(cls.MU)
+        return np.round((compressed + 1) * 127.5).astype(np.uint8).tobytes()
+
+    @classmethod
+    def decode(cls, data: bytes) -> np.ndarray:
+        """μ-law字节 -> float32 [-1, 1]"""
+        compressed = np.frombuffer(data, dtype=np.uint8).astype(np.float32) / 127.5 - 1
+        return (np.sign(compressed) * np.expm1(np.abs(compressed) * np.log1p(cls.MU)) / cls.MU).astype(np.float32)
+
+
+class VoiceNoteRecorder:
+    """录制一条语音消息并在录制过程中分块上传
+
+    采集回调只把样本写入环形缓冲区；事件循环中的上传任务每隔 UPLOAD_INTERVAL_SECONDS
+    取出数据、编码并按顺序上传一个分块。松开按键时只剩最后一小段需要上传，发送几乎是即时的。
+    """
+
+    UPLOAD_INTERVAL_SECONDS = 0.5
+    MAX_SECONDS = 120.0          # 单条语音消息的最长时长
+    RING_SECONDS = 4.0           # 上传卡顿时最多缓冲的采集音频
+
+    def __init__(self, capture_samplerate: int,
+                 create_note: Callable[[], Awaitable[Dict[str, Any]]],
+                 upload_chunk: Callable[[str, int, bytes], Awaitable[Dict[str, Any]]]):
+        self.capture_samplerate = capture_samplerate
+        self._create_note = create_note
+        self._upload_chunk = upload_chunk
+        self._ring = AudioRingBuffer(int(capture_samplerate * self.RING_SECONDS))
+        self._scratch = np.zeros(self._ring.capacity, dtype=np.float32)
+        self._max_samples = int(capture_samplerate * self.MAX_SECONDS)
+        self._captured_samples = 0
+        self._stop_requested = False
+        self._upload_task: Optional[asyncio.Task] = None
+        self.note_id: Optional[str] = None
+        self.chunks_uploaded = 0
+        self.bytes_uploaded = 0
+        self.started_at = 0.0
+
+    @property
+    def duration_ms(self) -> int:
+        return int(self._captured_samples * 1000 / self.capture_samplerate)
+
+    @property
+    def is_full(self) -> bool:
+        return self._captured_samples >= self._max_samples
+
+    def write(self, samples: np.ndarray):
+        """写入一块采集音频（采集回调线程调用，不阻塞）"""
+        if self._stop_requested or self.is_full:
+            return
+        self._captured_samples += self._ring.write(samples)
+
+    def start(self):
+        """启动上传任务（事件循环中调用）"""
+        self.started_at = time.perf_counter()
+        self._upload_task = asyncio.get_running_loop().create_task(self._upload_loop())
+
+    async def finish(self) -> Dict[str, Any]:
+        """停止录制并等待剩余分块上传完成，返回 note_id 等信息"""
+        self._stop_requested = True
+        if self._upload_task:
+            await self._upload_task
+        return {
+            'note_id': self.note_id,
+            'duration_ms': self.duration_ms,
+            'chunks': self.chunks_uploaded,
+            'bytes': self.bytes_uploaded,
+        }
+
+    async def cancel(self):
+        """放弃这条语音消息"""
+        self._stop_requested = True
+        if self._upload_task:
+            self._upload_task.cancel()
+            try:
+                await self._upload_task
+            except (asyncio.CancelledError, RuntimeError):
+                pass
+
+    async def _upload_loop(self):
+        # 创建语音消息与录音同时进行，不耽误按下按键后的第一段音频
+        result = await self._create_note()
+        if not result.get("success"):
+            raise RuntimeError(result.get("message", "创建语音消息失败"))
+        self.note_id = result["note_id"]
+
+        while True:
+            stopping = self._stop_requested
+            if not stopping:
+                await asyncio.sleep(self.UPLOAD_INTERVAL_SECONDS)
+            await self._upload_pending()
+            if stopping:
+                return
+
+    async def _upload_pending(self):
+        count = self._ring.read_into(self._scratch)
+        if count == 0:
+            return
+        encoded = VoiceNoteCodec.encode(VoiceNoteCodec.downsample(self._scratch[:count], self.capture_samplerate))
+        result = await self._upload_chunk(self.note_id, self.chunks_uploaded, encoded)
+        if not result.get("success"):
+            raise RuntimeError(result.get("message", "上传语音分块失败"))
+        self.chunks_uploaded += 1
+        self.bytes_uploaded += len(encoded)
@@ -0,0 +1,204 @@
+import os
+import struct
+import threading
+import time
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+from audio_ring_buffer import AudioRingBuffer
+
+
+class VoiceRecorder:
+    """语音频道录音器
+
+    播放回调把混音后的输出（可选地，采集回调把本地麦克风）写入无锁环形缓冲区，
+    后台写入线程负责取出数据、转换为16位PCM并写入WAV或裸PCM文件。
+    音频回调只做一次内存复制，从不等待磁盘I/O。WAV头部在录音过程中定期回填长度，
+    程序异常退出时已写入的内容仍然可以播放。
+    录制麦克风时输出双声道：左声道为远端混音，右声道为本地麦克风（只包含实际发送出去的部分）。
+    """
+
+    FORMAT_WAV = "wav"
+    FORMAT_PCM = "pcm"
+
+    RING_SECONDS = 4.0              # 每路环形缓冲区容量
+    WRITER_POLL_SECONDS = 0.05      # 写入线程轮询间隔
+    HEADER_FIXUP_SECONDS = 2.0      # WAV头部回填间隔
+    MAX_CHANNEL_SKEW_SECONDS = 0.5  # 一路持续没有数据（例如采集流已停止）时，另一路积压超过该值就用静音补齐
+    SAMPLE_WIDTH = 2                # 16位PCM
+    MAX_SILENCE_BLOCK_SECONDS = 0.1 # 一次写入的静音块上限（采集块为20ms）
+
+    def __init__(self, path: str, samplerate: int, include_mic: bool = False, file_format: str = FORMAT_WAV):
+        if file_format not in (self.FORMAT_WAV, self.FORMAT_PCM):
+            raise ValueError(f"Unsupported recording format: {file_format}")
+        self.path = path
+        self.samplerate = samplerate
+        self.include_mic = include_mic
+        self.file_format = file_format
+        self.channels = 2 if include_mic else 1
+
+        capacity = int(samplerate * self.RING_SECONDS)
+        self.playback_ring = AudioRingBuffer(capacity)
+        self.capture_ring = AudioRingBuffer(capacity) if include_mic else None
+
+        # 写入线程的预分配缓冲区
+        chunk = capacity
+        self._mix_scratch = np.zeros(chunk, dtype=np.float32)
+        self._mic_scratch = np.zeros(chunk, dtype=np.float32)
+        self._pcm_scratch = np.zeros(chunk * self.channels, dtype=np.int16)
+        self._float_scratch = np.zeros(chunk * self.channels, dtype=np.float32)
+        self._capture_silence = np.zeros(int(samplerate * self.MAX_SILENCE_BLOCK_SECONDS), dtype=np.float32) if include_mic else None
+
+        self._file = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._data_bytes = 0
+        self._started_at = 0.0
+        self._stopped_at = 0.0
+        self.max_occupancy = 0.0  # 环形缓冲区最高占用比例
+        self.write_error: Optional[str] = None
+
+    # --- 音频回调线程调用 ---
+    def write_playback(self, samples: np.ndarray):
+        """写入一块播放混音（播放回调调用，不阻塞）"""
+        self.playback_ring.write(samples)
+
+    def write_capture(self, samples: np.ndarray):
+        """写入一块本地麦克风音频（采集回调调用，不阻塞）"""
+        if self.capture_ring is not None:
+            self.capture_ring.write(samples)
+
+    def write_capture_silence(self, count: int):
+        """本地麦克风这一块没有发送时写入等长的静音（采集回调调用，不阻塞）"""
+        if self.capture_ring is not None:
+            self.capture_ring.write(self._capture_silence[:count])
+
+    # --- 生命周期 ---
+    def start(self):
+        """打开文件并启动写入线程"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'wb')
+        if self.file_format == self.FORMAT_WAV:
+            self._file.write(self._build_wav_header(0))
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._writer_loop, name="VoiceRecorderWriter", daemon=True)
+        self._thread.start()
+        print(f"Recording started: {self.path}")
+
+    def stop(self) -> Dict[str, Any]:
+        """停止写入线程、写完剩余数据并关闭文件（会阻塞，应在事件循环之外调用），返回统计信息"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self._stopped_at = time.perf_counter()
+        if self._file:
+            try:
+                self._fixup_wav_header()
+            finally:
+                self._file.close()
+                self._file = None
+        stats = self.get_stats()
+        print(f"Recording stopped: {stats}")
+        return stats
+
+    def get_stats(self) -> Dict[str, Any]:
+        """写入吞吐量、缓冲区最高占用和丢弃的样本数"""
+        end = self._stopped_at or time.perf_counter()
+        elapsed = max(end - self._started_at, 1e-6) if self._started_at else 0.0
+        dropped = self.playback_ring.dropped_samples + (self.capture_ring.dropped_samples if self.capture_ring else 0)
+        return {
+            'path': self.path,
+            'bytes_written': self._data_bytes,
+            'seconds_recorded': self._data_bytes / (self.SAMPLE_WIDTH * self.channels * self.samplerate),
+            'throughput_bytes_per_second': self._data_bytes / elapsed if elapsed else 0.0,
+            'max_buffer_occupancy': round(self.max_occupancy, 4),
+            'dropped_samples': dropped,
+            'write_error': self.write_error,
+        }
+
+    # --- 写入线程 ---
+    def _writer_loop(self):
+        last_fixup = time.perf_counter()
+        try:
+            while not self._stop_event.wait(self.WRITER_POLL_SECONDS):
+                self._drain(final=False)
+                now = time.perf_counter()
+                if self.file_format == self.FORMAT_WAV and now - last_fixup >= self.HEADER_FIXUP_SECONDS:
+                    self._fixup_wav_header()
+                    last_fixup = now
+            self._drain(final=True)
+        except Exception as e:
+            self.write_error = str(e)
+            print(f"Recording writer error: {e}")
+
+    def _drain(self, final: bool):
+        """取出环形缓冲区中的数据并写入文件"""
+        playback_available = self.playback_ring.available()
+        self.max_occupancy = max(self.max_occupancy, playback_available / self.playback_ring.capacity)
+
+        if self.capture_ring is None:
+            count = self.playback_ring.read_into(self._mix_scratch[:playback_available])
+            self._write_pcm(self._mix_scratch[:count])
+            return
+
+        capture_available = self.capture_ring.available()
+        self.max_occupancy = max(self.max_occupancy, capture_available / self.capture_ring.capacity)
+
+        # 两路按相同帧数对齐；一路长时间没有数据时另一路用静音补齐
+        count = min(playback_available, capture_available)
+        skew_limit = int(self.samplerate * self.MAX_CHANNEL_SKEW_SECONDS)
+        if final or abs(playback_available - capture_available) > skew_limit:
+            count = max(playback_available, capture_available)
+        if count <= 0:
+            return
+
+        mix = self._mix_scratch[:count]
+        mic = self._mic_scratch[:count]
+        mix_count = self.playback_ring.read_into(mix)
+        mic_count = self.capture_ring.read_into(mic)
+        mix[mix_count:].fill(0)
+        mic[mic_count:].fill(0)
+
+        interleaved = self._float_scratch[:count * 2]
+        interleaved[0::2] = mix
+        interleaved[1::2] = mic
+        self._write_pcm(interleaved)
+
+    def _write_pcm(self, samples: np.ndarray):
+        count = len(samples)
+        if count == 0:
+            return
+        pcm = self._pcm_scratch[:count]
+        scaled = self._float_scratch[:count]  # 双声道时samples本身就是这段内存，原地处理
+        np.clip(samples, -1.0, 1.0, out=scaled)
+        np.multiply(scaled, 32767, out=scaled)
+        pcm[:] = scaled  # float -> int16，原地转换
+        self._file.write(memoryview(pcm).cast('B'))
+        self._data_bytes += pcm.nbytes
+
+    def _build_wav_header(self, data_bytes: int) -> bytes:
+        byte_rate = self.samplerate * self.channels * self.SAMPLE_WIDTH
+        block_align = self.channels * self.SAMPLE_WIDTH
+        return struct.pack(
+            '<4sI4s4sIHHIIHH4sI',
+            b'RIFF', 36 + data_bytes, b'WAVE',
+            b'fmt ', 16, 1, self.channels, self.samplerate, byte_rate, block_align, self.SAMPLE_WIDTH * 8,
+            b'data', data_bytes
+        )
+
+    def _fixup_wav_header(self):
+        """回填WAV头部中的长度字段并刷新到磁盘"""
+        if not self._file:
+            return
+        if self.file_format != self.FORMAT_WAV:
+            self._file.flush()
+            return
+        position = self._file.tell()
+        self._file.seek(0)
+        self._file.write(self._build_wav_header(self._data_bytes))
+        self._file.seek(position)
+        self._file.flush()
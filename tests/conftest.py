@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import types
+
+import pytest
+
+# 源码是src目录下的平铺模块（与 `flet run src` 一致）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+class FakeStream:
+    """模拟PortAudio流：start/stop/close像真实设备一样会阻塞一段时间"""
+
+    OPEN_DELAY_SECONDS = 0.2
+    CLOSE_DELAY_SECONDS = 0.2
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.active = False
+        self.closed = False
+        self.blocksize = kwargs.get('blocksize', 0)
+        self.samplerate = kwargs.get('samplerate', 0)
+        self.latency = 0.01
+        time.sleep(self.OPEN_DELAY_SECONDS)
+
+    def start(self):
+        time.sleep(self.OPEN_DELAY_SECONDS)
+        self.active = True
+
+    def stop(self):
+        time.sleep(self.CLOSE_DELAY_SECONDS)
+        self.active = False
+
+    def close(self):
+        time.sleep(self.CLOSE_DELAY_SECONDS)
+        self.active = False
+        self.closed = True
+
+
+def _make_fake_sounddevice():
+    devices = [
+        {'name': 'Test Mic', 'hostapi': 0, 'max_input_channels': 1, 'max_output_channels': 0, 'default_samplerate': 48000.0},
+        {'name': 'Test Speaker', 'hostapi': 0, 'max_input_channels': 0, 'max_output_channels': 2, 'default_samplerate': 48000.0},
+    ]
+    sd = types.ModuleType('sounddevice')
+    sd.InputStream = sd.OutputStream = sd.Stream = FakeStream
+    sd.devices = devices
+    # 系统当前连接的设备；PortAudio的设备列表(devices)只在重新初始化时更新
+    sd.connected_devices = list(devices)
+    sd._terminate = lambda: None
+    sd._initialize = lambda: devices.__setitem__(slice(None), sd.connected_devices)
+    sd.query_devices = lambda device=None, kind=None: devices[device] if device is not None else list(devices)
+    sd.query_hostapis = lambda index=None: {'name': 'Test API'} if index is not None else [{'name': 'Test API'}]
+    sd.default = types.SimpleNamespace(device=[0, 1])
+    sd.check_input_settings = lambda **kwargs: None
+    sd.check_output_settings = lambda **kwargs: None
+    return sd
+
+
+@pytest.fixture
+def fake_sd(monkeypatch):
+    """用模拟的sounddevice替换audio_manager中的sd"""
+    audio_manager = pytest.importorskip("audio_manager")
+    sd = _make_fake_sounddevice()
+    monkeypatch.setattr(audio_manager, "sd", sd)
+    monkeypatch.setattr(audio_manager, "SOUNDDEVICE_AVAILABLE", True)
+    return sd
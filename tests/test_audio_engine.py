@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+import pytest
+
+audio_manager_module = pytest.importorskip("audio_manager")
+AudioManager = audio_manager_module.AudioManager
+from audio_engine_process import device_set_from
+
+PROBE_INTERVAL_SECONDS = 0.001
+MAX_LOOP_LAG_SECONDS = 0.05  # 模拟设备每次打开/关闭阻塞200ms，远大于此上限
+
+
+@pytest.fixture
+def engine(fake_sd, monkeypatch):
+    # 模拟流不会触发回调，关掉健康检查以免被当成停滞的流自动恢复
+    monkeypatch.setattr(AudioManager, "HEALTH_CHECK_INTERVAL_SECONDS", 3600)
+    return AudioManager()
+
+
+async def _run_with_lag_probe(operations):
+    """在执行设备操作的同时测量事件循环最长的停顿时间"""
+    max_lag = 0.0
+    done = asyncio.Event()
+
+    async def probe():
+        nonlocal max_lag
+        while not done.is_set():
+            expected = time.perf_counter() + PROBE_INTERVAL_SECONDS
+            await asyncio.sleep(PROBE_INTERVAL_SECONDS)
+            max_lag = max(max_lag, time.perf_counter() - expected)
+
+    probe_task = asyncio.create_task(probe())
+    await asyncio.sleep(0)
+    try:
+        await operations()
+    finally:
+        done.set()
+        await probe_task
+    return max_lag
+
+
+def test_stream_open_close_switch_do_not_block_event_loop(engine):
+    manager = engine
+    page = object()
+    errors = []
+
+    async def show_error(page_ref, message):
+        errors.append(message)
+
+    manager.set_callback('show_error', show_error)
+
+    async def operations():
+        await manager.start_audio_stream(page, 0)
+        await manager.start_audio_playback_stream(page, 1)
+        assert manager.stream_states[manager.STREAM_CAPTURE] == manager.STREAM_STATE_RUNNING
+        assert manager.stream_states[manager.STREAM_PLAYBACK] == manager.STREAM_STATE_RUNNING
+        assert await manager.switch_input_device(page, 0)
+        assert await manager.switch_output_device(page, 1)
+        await manager.stop_audio_stream_if_running()
+        await manager.stop_audio_playback_stream_if_running()
+
+    async def main():
+        try:
+            return await _run_with_lag_probe(operations)
+        finally:
+            await manager.shutdown()
+
+    max_lag = asyncio.run(main())
+
+    assert errors == []
+    assert manager.stream_states[manager.STREAM_CAPTURE] == manager.STREAM_STATE_STOPPED
+    assert manager.stream_states[manager.STREAM_PLAYBACK] == manager.STREAM_STATE_STOPPED
+    assert max_lag < MAX_LOOP_LAG_SECONDS
+
+
+def test_shutdown_waits_for_in_flight_stream_close(engine):
+    """关闭时等待引擎线程中正在进行的设备关闭完成，同时不阻塞事件循环"""
+    manager = engine
+    page = object()
+
+    async def main():
+        await manager.start_audio_stream(page, 0)
+        stream = manager.audio_input_stream
+        max_lag = await _run_with_lag_probe(manager.shutdown)
+        return stream, max_lag
+
+    stream, max_lag = asyncio.run(main())
+
+    assert stream.closed
+    assert manager.audio_input_stream is None
+    assert max_lag < MAX_LOOP_LAG_SECONDS
+
+
+def test_hot_plug_is_detected_and_remapped_while_streams_are_open(engine, fake_sd, monkeypatch):
+    """预热的流打开时也能发现新设备，索引移动后选中的设备按名称找回"""
+    manager = engine
+    monkeypatch.setattr(
+        audio_manager_module, "probe_device_set",
+        lambda timeout: device_set_from(fake_sd.connected_devices, fake_sd.query_hostapis())
+    )
+    monkeypatch.setattr(AudioManager, "DEVICE_PROBE_INTERVAL_SECONDS", 0)
+    page = object()
+
+    async def main():
+        await manager.get_audio_devices()
+        manager.selected_input_device_id = 0
+        await manager.start_audio_stream(page, 0)
+        unchanged = await manager.refresh_audio_devices(rescan=True)
+
+        # 插入的新设备排在前面，原来的麦克风从索引0移到1
+        usb_mic = {'name': 'USB Mic', 'hostapi': 0, 'max_input_channels': 1, 'max_output_channels': 0, 'default_samplerate': 48000.0}
+        fake_sd.connected_devices = [usb_mic] + fake_sd.connected_devices
+        diff = await manager.refresh_audio_devices(rescan=True)
+        stream = manager.audio_input_stream
+        await manager.shutdown()
+        return unchanged, diff, stream
+
+    unchanged, diff, stream = asyncio.run(main())
+
+    assert unchanged is None
+    assert [d['key'] for d in diff['input']['added']] == [('USB Mic', 'Test API')]
+    assert diff['input']['removed'] == []
+    assert [(d['old_id'], d['id']) for d in diff['input']['updated']] == [(0, 1)]
+    assert manager.selected_input_device_id == 1
+    assert stream.kwargs['device'] == 1
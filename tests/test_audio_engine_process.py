@@ -0,0 +1,92 @@
+import sys
+import textwrap
+
+import pytest
+
+pytest.importorskip("numpy")
+
+# 子进程映射共享内存时使用 SharedMemory(track=False)（Python 3.13+，与项目要求的版本一致）
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 13), reason="audio engine process requires Python 3.13+")
+
+BENCHMARK_SECONDS = 4.0
+
+# 按真实时间驱动回调的模拟设备：每个周期唤醒一次调用回调，回调没能在这一块播放完之前返回就是一次xrun，
+# 下一次回调的status会带上欠载标志。模拟设备线程本身也要拿GIL，和PortAudio调用Python回调一样。
+FAKE_SOUNDDEVICE = textwrap.dedent('''
+    import threading
+    import time
+
+    import numpy as np
+
+
+    class _DeadlineStream:
+        def __init__(self, callback=None, samplerate=48000, blocksize=960, channels=1, dtype='float32', **kwargs):
+            self._callback = callback
+            self._period = blocksize / samplerate
+            self._data = np.zeros((blocksize, channels), dtype=np.float32)
+            self.blocksize = blocksize
+            self.samplerate = samplerate
+            self.latency = self._period
+            self.active = False
+            self._thread = None
+
+        def start(self):
+            self.active = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+        def stop(self):
+            self.active = False
+            if self._thread is not None:
+                self._thread.join()
+
+        def close(self):
+            self.active = False
+
+        def _run(self):
+            block_start = time.perf_counter()
+            status = None
+            while self.active:
+                self._call(status)
+                now = time.perf_counter()
+                if now > block_start + self._period:
+                    status = "output underflow"
+                    block_start = now
+                else:
+                    status = None
+                    block_start += self._period
+                time.sleep(max(0.0, block_start - time.perf_counter()))
+
+
+    class OutputStream(_DeadlineStream):
+        def _call(self, status):
+            self._callback(self._data, self.blocksize, None, status)
+
+
+    class InputStream(_DeadlineStream):
+        def _call(self, status):
+            self._callback(self._data, self.blocksize, None, status)
+''')
+
+
+@pytest.fixture
+def deadline_sounddevice(tmp_path, monkeypatch):
+    """让本进程和（继承sys.path的）引擎子进程都导入模拟设备"""
+    (tmp_path / "sounddevice.py").write_text(FAKE_SOUNDDEVICE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "sounddevice", raising=False)
+
+
+def test_engine_process_keeps_device_callbacks_on_time_under_ui_load(deadline_sounddevice):
+    from audio_engine_process import run_ui_load_benchmark
+
+    results = run_ui_load_benchmark(BENCHMARK_SECONDS)
+    print(results)
+    in_process, child = results['in-process'], results['process']
+
+    assert child['alive'] and child['restarts'] == 0
+    assert in_process['callbacks'] > 0 and child['callbacks'] > 0
+    # 进程内的设备回调被UI负载持有的GIL拖过截止时间；子进程中的设备回调不受主进程GIL影响。
+    # 主进程泵线程仍可能被拖过共享缓冲区的余量（欠载），这取决于机器的核数，不在这里断言
+    assert in_process['xruns'] >= 10
+    assert child['playback_xruns'] * 5 <= in_process['xruns']
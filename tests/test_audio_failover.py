@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+import pytest
+
+audio_manager_module = pytest.importorskip("audio_manager")
+AudioManager = audio_manager_module.AudioManager
+from conftest import FakeStream
+
+FAILING_OPEN_SECONDS = 0.4
+
+
+def _add_input_devices(fake_sd, *names):
+    for name in names:
+        fake_sd.connected_devices.append({'name': name, 'hostapi': 0, 'max_input_channels': 1,
+                                          'max_output_channels': 0, 'default_samplerate': 48000.0})
+    fake_sd._initialize()
+
+
+def _fail_opening(fake_sd, *device_ids):
+    """指定的设备打开时阻塞一段时间后失败，像拔出的设备一样"""
+    class FlakyStream(FakeStream):
+        def __init__(self, **kwargs):
+            if kwargs.get('device') in device_ids:
+                time.sleep(FAILING_OPEN_SECONDS)
+                raise RuntimeError(f"device {kwargs.get('device')} unavailable")
+            super().__init__(**kwargs)
+
+    fake_sd.InputStream = fake_sd.OutputStream = FlakyStream
+
+
+@pytest.fixture
+def manager(fake_sd, monkeypatch):
+    monkeypatch.setattr(AudioManager, "HEALTH_CHECK_INTERVAL_SECONDS", 3600)
+    _add_input_devices(fake_sd, 'Backup Mic', 'USB Mic')  # 索引2、3
+    manager = AudioManager()
+    yield manager
+    manager._engine_executor.shutdown(wait=True)
+    manager.voice_decode_pool.shutdown()
+
+
+def test_failover_candidates_are_original_by_name_then_fallbacks_then_default(manager, fake_sd):
+    manager._stream_device_names[manager.STREAM_CAPTURE] = 'USB Mic'
+    manager.fallback_input_device_names = ['Missing Mic', 'Backup Mic', 'USB Mic', 'Test Speaker']
+
+    assert manager._failover_candidates(manager.STREAM_CAPTURE) == [3, 2, None]
+
+    # 重新扫描后设备索引变化：原设备按名称找回
+    fake_sd.connected_devices[2], fake_sd.connected_devices[3] = fake_sd.connected_devices[3], fake_sd.connected_devices[2]
+    fake_sd._initialize()
+    assert manager._failover_candidates(manager.STREAM_CAPTURE) == [2, 3, None]
+
+
+def test_recovery_falls_through_failing_candidates_to_the_default(manager, fake_sd):
+    manager._open_capture_stream_sync(3)
+    manager.fallback_input_device_names = ['Backup Mic']
+    _fail_opening(fake_sd, 3, 2)
+
+    results = manager._recover_streams_sync([manager.STREAM_CAPTURE])
+
+    assert results == {manager.STREAM_CAPTURE: (True, None)}
+    assert manager.audio_input_stream.kwargs['device'] is None
+
+
+def test_recovery_gives_up_at_the_deadline(manager, fake_sd, monkeypatch):
+    # 每个失败的候选设备耗时0.4秒，两个之后已超过0.5秒的时限，不再尝试默认设备
+    monkeypatch.setattr(AudioManager, "FAILOVER_DEADLINE_SECONDS", 0.5)
+    manager._open_capture_stream_sync(3)
+    manager.fallback_input_device_names = ['Backup Mic']
+    _fail_opening(fake_sd, 3, 2)
+
+    started = time.monotonic()
+    results = manager._recover_streams_sync([manager.STREAM_CAPTURE])
+    elapsed = time.monotonic() - started
+
+    assert results == {manager.STREAM_CAPTURE: (False, None)}
+    assert manager.audio_input_stream is None
+    assert elapsed < 0.5 + FAILING_OPEN_SECONDS + FakeStream.CLOSE_DELAY_SECONDS * 2 + 0.2
+
+
+def test_failed_stream_recovers_on_the_next_device_and_reports_it(manager, fake_sd):
+    page = object()
+    failovers = []
+
+    async def on_failover(stream_name, device_id):
+        failovers.append((stream_name, device_id))
+
+    manager.set_callback('on_audio_device_failover', on_failover)
+    manager.fallback_input_device_names = ['Backup Mic']
+
+    async def main():
+        try:
+            await manager.start_audio_stream(page, 3)
+            assert manager.stream_states[manager.STREAM_CAPTURE] == manager.STREAM_STATE_RUNNING
+            _fail_opening(fake_sd, 3)
+            await manager._recover_streams({manager.STREAM_CAPTURE: "callback stalled"})
+        finally:
+            await manager.shutdown()
+
+    asyncio.run(main())
+
+    assert failovers == [(manager.STREAM_CAPTURE, 2)]
+    assert manager.selected_input_device_id == 2
+    event, = manager.metrics.get_events('audio_failover')
+    assert (event['stream'], event['reason'], event['success'], event['device_id']) == \
+        (manager.STREAM_CAPTURE, "callback stalled", True, 2)
+    assert manager.metrics.get_counter('audio_failover_total') == 1
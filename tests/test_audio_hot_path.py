@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import tracemalloc
+
+import numpy as np
+import pytest
+
+audio_manager_module = pytest.importorskip("audio_manager")
+AudioManager = audio_manager_module.AudioManager
+
+HOT_PATH_FILES = ("audio_manager.py", "audio_features.py", "audio_ring_buffer.py")
+WARMUP_BLOCKS = 600   # 让有界的指标序列等先填满
+TRACED_WARMUP_BLOCKS = 50
+MEASURED_BLOCKS = 500
+
+
+def _net_hot_path_bytes(before, after) -> int:
+    """两次快照之间热路径模块中净增加的字节数"""
+    filters = [tracemalloc.Filter(True, f"*{name}") for name in HOT_PATH_FILES]
+    before = before.filter_traces(filters)
+    after = after.filter_traces(filters)
+    return sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+
+
+@pytest.fixture
+def page_loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=2.0)
+    loop.close()
+
+
+def _drain(loop):
+    """等待事件循环处理完已提交的发送协程"""
+    asyncio.run_coroutine_threadsafe(asyncio.sleep(0), loop).result(timeout=2.0)
+    asyncio.run_coroutine_threadsafe(asyncio.sleep(0), loop).result(timeout=2.0)
+
+
+def test_capture_callback_has_no_net_allocations_per_block(page_loop):
+    manager = AudioManager()
+    sent_blocks = []
+
+    async def send_audio_data(block, rms, slot):
+        sent_blocks.append(1)
+        manager.release_send_block(block, slot)
+
+    manager.set_callback('send_audio_data', send_audio_data)
+    manager.page_loop = page_loop
+    manager.is_voice_routing_active = True
+
+    frames = manager.STANDARD_BLOCKSIZE
+    t = np.arange(frames, dtype=np.float32) / manager.STANDARD_SAMPLERATE
+    indata = (0.3 * np.sin(2 * np.pi * 440 * t)).astype(np.float32).reshape(-1, 1)  # 高于VAD阈值，每块都发送
+
+    def run_blocks(count):
+        for _ in range(count):
+            manager.audio_stream_callback(indata, frames, None, None)
+            _drain(page_loop)
+
+    run_blocks(WARMUP_BLOCKS)
+    tracemalloc.start()
+    try:
+        # 开始跟踪后再跑一段：被替换的计数器等对象在两次快照中都被跟踪到，只留下随块数增长的分配
+        run_blocks(TRACED_WARMUP_BLOCKS)
+        before = tracemalloc.take_snapshot()
+        run_blocks(MEASURED_BLOCKS)
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    manager.voice_decode_pool.shutdown()
+
+    assert len(sent_blocks) == WARMUP_BLOCKS + TRACED_WARMUP_BLOCKS + MEASURED_BLOCKS
+    assert manager.send_blocks_dropped == 0
+    assert _net_hot_path_bytes(before, after) <= 0
+
+
+def test_playback_callback_has_no_net_allocations_per_block():
+    manager = AudioManager()
+    frames = manager.STANDARD_BLOCKSIZE
+    outdata = np.zeros((frames, 1), dtype=np.float32)
+    voice = np.full(frames, 0.1, dtype=np.float32)
+    senders = [manager._get_sender_buffer(str(sender_id)) for sender_id in range(3)]
+
+    def run_blocks(count):
+        for _ in range(count):
+            for sender_buffer in senders:
+                sender_buffer.write(voice)
+            manager.audio_playback_callback(outdata, frames, None, None)
+
+    run_blocks(WARMUP_BLOCKS)
+    tracemalloc.start()
+    try:
+        # 开始跟踪后再跑一段：被替换的计数器等对象在两次快照中都被跟踪到，只留下随块数增长的分配
+        run_blocks(TRACED_WARMUP_BLOCKS)
+        before = tracemalloc.take_snapshot()
+        run_blocks(MEASURED_BLOCKS)
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    manager.voice_decode_pool.shutdown()
+
+    assert np.allclose(outdata[:, 0], 0.3)
+    assert _net_hot_path_bytes(before, after) <= 0
+
+
+def test_send_blocks_are_not_overwritten_before_release():
+    """网络层长时间未取走数据时丢弃新块，而不是覆盖尚未发送的块"""
+    manager = AudioManager()
+    frames = manager.STANDARD_BLOCKSIZE
+    held = []
+
+    # 占用块后从不归还，相当于事件循环或网络层停顿
+    for value in range(manager.SEND_BLOCK_POOL_SIZE + 5):
+        slot = manager._next_send_block(frames)
+        if slot < 0:
+            continue
+        block = manager._send_block_pool[slot]
+        block.fill(value)
+        held.append((block, slot, value))
+    manager.voice_decode_pool.shutdown()
+
+    assert len(held) == manager.SEND_BLOCK_POOL_SIZE
+    assert manager.send_blocks_dropped == 5
+    assert all(np.all(block == value) for block, _, value in held)
+
+    block, slot, _ = held[0]
+    manager.release_send_block(block, slot)
+    assert manager._next_send_block(frames) == slot
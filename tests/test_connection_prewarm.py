@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("socketio")
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web
+from network_manager import NetworkManager
+
+
+class CountingServer:
+    """记录每个请求来自哪条TCP连接的HTTP服务器"""
+
+    def __init__(self):
+        self.requests = []  # (方法, 路径, 客户端端口)
+        self.app = web.Application()
+        self.app.router.add_route('HEAD', '/api', self._handle)
+        self.app.router.add_route('GET', '/api/ping', self._handle)
+        self._runner = None
+
+    async def _handle(self, request):
+        self.requests.append((request.method, request.path, request.transport.get_extra_info('peername')[1]))
+        return web.json_response({'ok': True})
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, shutdown_timeout=1.0)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        return self._runner.addresses[0][:2]
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+def _network_manager(tmp_path, host, port):
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({}))
+    network_manager = NetworkManager(str(config_path))
+    network_manager.get_sio_url = lambda: f"http://{host}:{port}"
+    network_manager.get_api_base_url = lambda: f"http://{host}:{port}/api"
+    return network_manager
+
+
+def test_shared_connector_keeps_connections_alive_and_caches_dns(tmp_path):
+    async def main():
+        network_manager = _network_manager(tmp_path, '127.0.0.1', 1)
+        await network_manager.create_http_session()
+        connector = network_manager.shared_aiohttp_session.connector
+        try:
+            return (connector._keepalive_timeout, connector.use_dns_cache, connector._cached_hosts._ttl,
+                    connector._ssl is network_manager.ssl_context)
+        finally:
+            await network_manager.close_http_session()
+
+    keepalive, use_dns_cache, dns_ttl, shared_ssl_context = asyncio.run(main())
+
+    assert keepalive == NetworkManager.HTTP_KEEPALIVE_SECONDS == 75
+    assert use_dns_cache and dns_ttl == NetworkManager.DNS_CACHE_SECONDS == 300
+    assert shared_ssl_context
+
+
+def test_prewarmed_connections_are_reused_by_later_requests(tmp_path):
+    async def main():
+        server = CountingServer()
+        host, port = await server.start()
+        network_manager = _network_manager(tmp_path, host, port)
+        try:
+            await network_manager.prewarm_connections()
+            prewarmed = list(server.requests)
+            # 同一服务器只预热一次
+            await network_manager.prewarm_connections()
+            async with network_manager.shared_aiohttp_session.get(f"http://{host}:{port}/api/ping") as response:
+                await response.read()
+            return prewarmed, list(server.requests), network_manager.prewarmed_host, \
+                network_manager.metrics.get_gauge('prewarm_ms'), network_manager
+        finally:
+            await network_manager.close_http_session()
+            await server.stop()
+
+    prewarmed, requests, prewarmed_host, prewarm_ms, network_manager = asyncio.run(main())
+
+    assert [(method, path) for method, path, _ in prewarmed] == [('HEAD', '/api')] * NetworkManager.PREWARM_CONNECTIONS
+    warm_ports = {client_port for _, _, client_port in prewarmed}
+    assert len(warm_ports) == NetworkManager.PREWARM_CONNECTIONS  # 每个请求一条新连接
+    assert requests[len(prewarmed):] == [('GET', '/api/ping', requests[-1][2])]
+    assert requests[-1][2] in warm_ports                       # 之后的请求复用了预热的连接
+    assert prewarmed_host is not None and prewarm_ms is not None
+
+    network_manager.update_server_config('example.invalid', 443)
+    assert network_manager.prewarmed_host is None             # 换服务器后重新预热
+
+
+def test_prewarm_failure_is_ignored(tmp_path):
+    async def main():
+        server = CountingServer()
+        host, port = await server.start()
+        await server.stop()  # 服务器不可达
+        network_manager = _network_manager(tmp_path, host, port)
+        try:
+            await network_manager.prewarm_connections()
+            return network_manager.prewarmed_host
+        finally:
+            await network_manager.close_http_session()
+
+    assert asyncio.run(main()) is None
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+audio_manager_module = pytest.importorskip("audio_manager")
+AudioManager = audio_manager_module.AudioManager
+
+# 各候选参数的模拟探测结果：(20,'high')、(20,'low')、(10,'low') 稳定，5ms开始不稳定
+PROBE_RESULTS = {
+    (20, 'high'): {'stable': True, 'total_latency_ms': 62.0},
+    (20, 'low'): {'stable': True, 'total_latency_ms': 38.0},
+    (10, 'low'): {'stable': True, 'total_latency_ms': 24.0},
+    (5, 'low'): {'stable': False, 'xruns': 3},
+    (2.5, 'low'): {'stable': True, 'total_latency_ms': 9.0},  # 不应被探测
+}
+
+
+@pytest.fixture
+def manager(fake_sd, monkeypatch):
+    monkeypatch.setattr(AudioManager, "HEALTH_CHECK_INTERVAL_SECONDS", 3600)
+    manager = AudioManager()
+    manager.selected_input_device_id = 0
+    manager.selected_output_device_id = 1
+    yield manager
+    manager.voice_decode_pool.shutdown()
+
+
+def _calibrate(manager, results):
+    probed = []
+    errors = []
+
+    def probe(input_dev_id, output_dev_id, samplerate, block_ms, latency):
+        probed.append((block_ms, latency))
+        return dict(results[(block_ms, latency)])
+
+    async def show_error(page_ref, message):
+        errors.append(message)
+
+    manager._probe_stream_config_sync = probe
+    manager.set_callback('show_error', show_error)
+
+    async def main():
+        try:
+            return await manager.calibrate_latency(object())
+        finally:
+            await manager.shutdown()
+
+    return asyncio.run(main()), probed, errors
+
+
+def test_picks_the_lowest_latency_stable_profile_and_stops_after_instability(manager):
+    profile, probed, errors = _calibrate(manager, PROBE_RESULTS)
+
+    assert errors == []
+    assert (profile['block_ms'], profile['latency'], profile['total_latency_ms']) == (10, 'low', 24.0)
+    # 5ms不稳定后不再尝试更小的块
+    assert probed == [(20, 'high'), (20, 'low'), (10, 'low'), (5, 'low')]
+    assert manager.latency_profiles == {'Test Mic|Test Speaker': profile}
+    assert not manager.is_calibrating
+
+
+def test_profile_is_applied_when_streams_reopen(manager):
+    profile, _, _ = _calibrate(manager, PROBE_RESULTS)
+
+    manager._open_playback_stream_sync(1)
+    manager._open_capture_stream_sync(0)
+
+    assert manager.audio_output_stream.kwargs['blocksize'] == 480   # 10ms @ 48kHz
+    assert manager.audio_output_stream.kwargs['latency'] == profile['latency']
+    # 采集块仍与20ms网络帧对齐，只使用校准的latency
+    assert manager.audio_input_stream.kwargs['blocksize'] == 960
+    assert manager.audio_input_stream.kwargs['latency'] == profile['latency']
+
+
+def test_no_stable_profile_reports_an_error(manager):
+    unstable = {key: {'stable': False} for key in PROBE_RESULTS}
+
+    profile, probed, errors = _calibrate(manager, unstable)
+
+    assert profile is None
+    assert probed == [(20, 'high'), (20, 'low')]  # 20ms都不稳定时，更小的块不必再试
+    assert len(errors) == 1 and "没有找到稳定的配置" in errors[0]
+    assert manager.latency_profiles == {}
@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("socketio")
+pytest.importorskip("aiohttp")
+from network_manager import NetworkManager
+from voice_echo_server import VoiceEchoServer
+
+
+def _fast_network_manager(config_path, host, port):
+    network_manager = NetworkManager(str(config_path))
+    network_manager.LIVENESS_INTERVAL_SECONDS = 0.1
+    network_manager.LIVENESS_TIMEOUT_SECONDS = 0.2
+    network_manager.get_sio_url = lambda: f"http://{host}:{port}"
+    network_manager.current_user_info = {'id': 5}
+    return network_manager
+
+
+async def _close(network_manager):
+    await network_manager.end_session()
+    await network_manager.close_http_session()
+
+
+def test_unanswered_first_ping_recycles_the_connection_once_per_server(tmp_path):
+    """首个client_ping就超时（半开连接）时重连而不是停用心跳；重连后仍不响应才视为服务器不支持，
+    这个结论记入配置，以后的会话不再为此断开连接"""
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({}))
+
+    async def main():
+        server = VoiceEchoServer()
+        release_pings = asyncio.Event()
+
+        async def unanswered_client_ping(sid, data):
+            await release_pings.wait()
+
+        server.sio.on('client_ping', unanswered_client_ping)
+        host, port = await server.start('127.0.0.1', 0)
+        try:
+            first = _fast_network_manager(config_path, host, port)
+            try:
+                assert await first.connect_socketio()
+                deadline = asyncio.get_running_loop().time() + 10
+                while first._liveness_supported is None:
+                    assert asyncio.get_running_loop().time() < deadline
+                    await asyncio.sleep(0.05)
+                await asyncio.sleep(0.5)
+                first_session = (first.metrics.get_counter('liveness_recycles'),
+                                 first.reconnection.last_report, first.sio_client.connected)
+            finally:
+                await _close(first)
+
+            # 新的会话（重新启动客户端）：已经知道服务器不支持，不再断开重连
+            second = _fast_network_manager(config_path, host, port)
+            try:
+                assert await second.connect_socketio()
+                await asyncio.sleep(1.0)
+                second_session = (second.metrics.get_counter('liveness_recycles'), second.sio_client.connected)
+            finally:
+                await _close(second)
+            return first_session, second_session
+        finally:
+            release_pings.set()
+            await asyncio.wait_for(server.stop(), 5)
+
+    (recycles, reconnect_report, still_connected), second_session = asyncio.run(main())
+
+    assert recycles == 1
+    assert reconnect_report is not None
+    assert still_connected
+    assert second_session == (0, True)
+    assert list(json.loads(config_path.read_text())["liveness_supported_by_server"].values()) == [False]
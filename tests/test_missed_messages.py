@@ -0,0 +1,113 @@
+import asyncio
+
+from message_manager import fetch_missed_messages
+
+CHANNEL_ID = 4
+
+
+class FakeMessageServer:
+    """按after_message_id分页返回消息的 request_newer_messages 替身"""
+
+    def __init__(self, message_ids, pages=None, fail=False):
+        self.message_ids = message_ids
+        self.pages = pages  # 指定每次请求的返回值，覆盖按ID分页
+        self.fail = fail
+        self.requests = []
+
+    async def request_newer_messages(self, channel_id, after_message_id, count):
+        self.requests.append(after_message_id)
+        if self.fail:
+            return {"success": False, "message": "网络错误"}
+        if self.pages is not None:
+            return self.pages[len(self.requests) - 1]
+        newer = [message_id for message_id in self.message_ids if message_id > after_message_id]
+        return {"success": True, "messages": [{'message_id': message_id} for message_id in newer[:count]],
+                "has_more": len(newer) > count}
+
+
+def _sync(server, sync_from, page_size=2, max_pages=10, stop_after_pages=None):
+    merged, reloads = [], []
+
+    def on_page(messages):
+        if stop_after_pages is not None and len(server.requests) > stop_after_pages:
+            return None
+        merged.extend(msg['message_id'] for msg in messages)
+        return len(messages)
+
+    async def reload_channel(channel_id):
+        reloads.append(channel_id)
+
+    fetched = asyncio.run(fetch_missed_messages(CHANNEL_ID, sync_from, server.request_newer_messages,
+                                                on_page, reload_channel, page_size, max_pages))
+    return fetched, merged, reloads
+
+
+def test_pages_from_the_disconnect_mark_by_each_page_max_id():
+    server = FakeMessageServer(list(range(1, 16)))
+    sync_from = {CHANNEL_ID: 10, 9: 3}
+
+    fetched, merged, reloads = _sync(server, sync_from)
+
+    assert server.requests == [10, 12, 14]
+    assert merged == [11, 12, 13, 14, 15]
+    assert fetched == 5 and reloads == []
+    assert sync_from == {}
+
+
+def test_empty_page_with_has_more_ends_the_sync():
+    server = FakeMessageServer([], pages=[
+        {"success": True, "messages": [{'message_id': 11}, {'message_id': 12}], "has_more": True},
+        {"success": True, "messages": [], "has_more": True},
+    ])
+    sync_from = {CHANNEL_ID: 10}
+
+    fetched, merged, reloads = _sync(server, sync_from)
+
+    assert server.requests == [10, 12]
+    assert merged == [11, 12] and fetched == 2
+    assert reloads == [] and sync_from == {}
+
+
+def test_failed_request_keeps_the_mark_for_the_next_reconnect():
+    server = FakeMessageServer(list(range(1, 16)), fail=True)
+    sync_from = {CHANNEL_ID: 10}
+
+    fetched, merged, reloads = _sync(server, sync_from)
+
+    assert fetched == 0 and merged == [] and reloads == []
+    assert sync_from == {CHANNEL_ID: 10}
+
+    server.fail = False
+    server.requests.clear()
+    assert _sync(server, sync_from)[1] == [11, 12, 13, 14, 15]
+    assert sync_from == {}
+
+
+def test_too_many_missed_messages_reloads_the_channel():
+    server = FakeMessageServer(list(range(1, 101)))
+    sync_from = {CHANNEL_ID: 10}
+
+    fetched, merged, reloads = _sync(server, sync_from, page_size=5, max_pages=3)
+
+    assert server.requests == [10, 15, 20]
+    assert fetched == 15
+    assert reloads == [CHANNEL_ID]
+    assert sync_from == {}
+
+
+def test_switching_channels_stops_the_sync():
+    server = FakeMessageServer(list(range(1, 16)))
+    sync_from = {CHANNEL_ID: 10}
+
+    fetched, merged, reloads = _sync(server, sync_from, stop_after_pages=1)
+
+    assert server.requests == [10, 12]
+    assert merged == [11, 12] and reloads == []
+    assert sync_from == {}
+
+
+def test_without_a_disconnect_mark_nothing_is_requested():
+    server = FakeMessageServer(list(range(1, 16)))
+
+    assert _sync(server, {})[0] == 0
+    assert server.requests == []
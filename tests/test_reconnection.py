@@ -0,0 +1,112 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("socketio")
+pytest.importorskip("aiohttp")
+from network_manager import NetworkManager
+from voice_echo_server import VOICE_NAMESPACE, VoiceEchoServer
+
+
+def _recording_server(received):
+    server = VoiceEchoServer()
+
+    def record(event, namespace='/'):
+        async def handler(sid, data):
+            received.append((event, data))
+            return {'ok': True}
+        server.sio.on(event, handler, namespace=namespace)
+
+    for event in ('join_text_channel', 'join_voice_channel', 'leave_voice_channel', 'user_microphone_status'):
+        record(event)
+    record('join_voice_transport', VOICE_NAMESPACE)
+    return server
+
+
+async def _wait_for(condition, timeout=10.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.05)
+
+
+def test_leaving_during_an_outage_is_not_undone_by_the_reconnect(tmp_path):
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({}))
+
+    async def main():
+        received = []
+        server = _recording_server(received)
+        host, port = await server.start('127.0.0.1', 0)
+        network_manager = NetworkManager(str(config_path))
+        network_manager.get_sio_url = lambda: f"http://{host}:{port}"
+        network_manager.current_user_info = {'id': 5}
+        try:
+            assert await network_manager.connect_socketio()
+            await network_manager.emit_socketio('join_text_channel', {'channel_id': 1})
+            await network_manager.emit_socketio('join_voice_channel', {'channel_id': 3})
+            await network_manager.emit_socketio('user_microphone_status', {'channel_id': 3, 'is_unmuted': True})
+            assert await network_manager.connect_voice_transport(3)
+
+            await server.stop()
+            await _wait_for(lambda: network_manager.reconnection.is_reconnecting)
+            # 断线期间离开语音频道并切换文字频道
+            await network_manager.emit_socketio('leave_voice_channel', {'channel_id': 3})
+            await network_manager.disconnect_voice_transport()
+            await network_manager.emit_socketio('join_text_channel', {'channel_id': 7})
+            received.clear()
+
+            server = _recording_server(received)
+            await server.start('127.0.0.1', port)
+            await _wait_for(lambda: network_manager.reconnection.last_report is not None)
+            replayed = network_manager.reconnection.last_report['replayed_events']
+            voice_connected = network_manager.is_voice_transport_connected
+
+            # 再次断线后退出登录：不再重连，也没有要恢复的会话
+            await server.stop()
+            await _wait_for(lambda: network_manager.reconnection.is_reconnecting)
+            await network_manager.end_session()
+            return replayed, list(received), voice_connected, network_manager.reconnection
+        finally:
+            await network_manager.end_session()
+            await network_manager.close_http_session()
+            await asyncio.wait_for(server.stop(), 5)
+
+    replayed, received, voice_connected, reconnection = asyncio.run(main())
+
+    assert replayed == ['join_text_channel']
+    assert received == [('join_text_channel', {'channel_id': 7})]
+    assert not voice_connected
+    assert not reconnection.is_reconnecting
+    assert reconnection.replay_events() == []
+
+
+def test_logout_stops_the_voice_send_worker(tmp_path):
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({}))
+
+    async def main():
+        server = _recording_server([])
+        host, port = await server.start('127.0.0.1', 0)
+        network_manager = NetworkManager(str(config_path))
+        network_manager.get_sio_url = lambda: f"http://{host}:{port}"
+        network_manager.current_user_info = {'id': 5}
+        try:
+            assert await network_manager.connect_socketio()
+            assert await network_manager.connect_voice_transport(3)
+            worker = network_manager._voice_send_task
+            await network_manager.end_session()
+            await asyncio.sleep(0)
+            released = []
+            network_manager.queue_voice_event('voice_data_stream', {}, on_sent=lambda: released.append(1))
+            return worker, network_manager._voice_send_task, released
+        finally:
+            await network_manager.close_http_session()
+            await asyncio.wait_for(server.stop(), 5)
+
+    worker, worker_after_logout, released = asyncio.run(main())
+
+    assert worker.cancelled()
+    assert worker_after_logout is None
+    assert released == [1]  # 没有发送任务时帧的缓冲区立即归还
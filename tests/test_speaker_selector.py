@@ -0,0 +1,65 @@
+from speaker_selector import ActiveSpeakerSelector
+
+
+def test_admits_the_first_n_speakers_and_drops_the_rest():
+    selector = ActiveSpeakerSelector(max_speakers=2)
+
+    assert selector.should_accept('a', 0.1, now=0.0)
+    assert selector.should_accept('b', 0.1, now=0.0)
+    assert not selector.should_accept('c', 0.1, now=0.01)
+    # 入选者的后续帧照常接收
+    assert selector.should_accept('a', 0.1, now=0.02)
+
+    assert selector.selected_speakers == {'a', 'b'}
+    assert (selector.accepted_frames, selector.dropped_frames) == (3, 1)
+
+
+def test_new_speaker_must_be_switch_ratio_louder_than_the_weakest():
+    selector = ActiveSpeakerSelector(max_speakers=1)
+    assert selector.should_accept('a', 0.1, now=0.0)
+    selector.should_accept('a', 0.1, now=0.3)
+
+    # 过了保留期，但只响1.4倍：不替换
+    assert not selector.should_accept('b', 0.14, now=0.6)
+    assert selector.selected_speakers == {'a'}
+    # 响1.6倍：替换最弱的入选者
+    assert selector.should_accept('c', 0.16, now=0.6)
+    assert selector.selected_speakers == {'c'}
+    assert not selector.should_accept('a', 0.1, now=0.65)
+
+
+def test_selected_speaker_is_held_for_min_hold_seconds():
+    selector = ActiveSpeakerSelector(max_speakers=1)
+    assert selector.should_accept('a', 0.1, now=0.0)
+    selector.should_accept('a', 0.1, now=0.3)
+
+    assert not selector.should_accept('loud', 1.0, now=0.35)
+    selector.should_accept('a', 0.1, now=0.45)
+    assert not selector.should_accept('loud', 1.0, now=0.49)
+    assert selector.should_accept('loud', 1.0, now=ActiveSpeakerSelector.MIN_HOLD_SECONDS)
+    assert selector.selected_speakers == {'loud'}
+
+
+def test_silent_speaker_releases_its_slot_after_the_timeout():
+    selector = ActiveSpeakerSelector(max_speakers=1)
+    assert selector.should_accept('a', 0.5, now=0.0)
+
+    # a最后一帧在0秒：0.39秒时仍占着位置，更安静的b进不来
+    assert not selector.should_accept('b', 0.1, now=0.39)
+    # 超过0.4秒没有帧，a让出位置
+    assert selector.should_accept('b', 0.1, now=0.41)
+    assert selector.selected_speakers == {'b'}
+
+
+def test_energy_is_smoothed_across_frames():
+    selector = ActiveSpeakerSelector(max_speakers=1)
+    assert selector.should_accept('a', 0.1, now=0.0)
+    selector.should_accept('a', 0.1, now=0.3)
+
+    # b的第一帧平滑能量为0.1，之后每帧向0.2靠近0.3：0.13，0.151，超过0.15后才替换a
+    assert not selector.should_accept('b', 0.1, now=0.6)
+    selector.should_accept('a', 0.1, now=0.62)
+    assert not selector.should_accept('b', 0.2, now=0.64)
+    selector.should_accept('a', 0.1, now=0.66)
+    assert selector.should_accept('b', 0.2, now=0.68)
+    assert selector.selected_speakers == {'b'}
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("socketio")
+pytest.importorskip("aiohttp")
+from network_manager import NetworkManager
+from udp_voice_relay import start_relay
+from udp_voice_transport import UdpVoiceTransport
+from voice_echo_server import VOICE_NAMESPACE, VoiceEchoServer
+
+CHANNEL_ID = 3
+
+
+def test_udp_failure_falls_back_within_seconds_and_tells_the_server(tmp_path):
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"voice_udp_enabled": True}))
+
+    async def main():
+        relay_transport, _ = await start_relay('127.0.0.1', 0, echo=True)
+        relay_port = relay_transport.get_extra_info('sockname')[1]
+        server = VoiceEchoServer()
+        switches = []
+
+        async def voice_transport_switch(sid, data):
+            switches.append((time.monotonic(), data))
+
+        server.sio.on('voice_transport_switch', voice_transport_switch, namespace=VOICE_NAMESPACE)
+        host, port = await server.start('127.0.0.1', 0)
+
+        network_manager = NetworkManager(str(config_path))
+        network_manager.voice_udp_relay = f"127.0.0.1:{relay_port}"
+        network_manager.get_sio_url = lambda: f"http://{host}:{port}"
+        network_manager.current_user_info = {'id': 5}
+        received = []
+        network_manager.set_callback('on_voice_data_stream_chunk', received.append)
+        try:
+            assert await network_manager.connect_socketio()
+            assert await network_manager.connect_voice_transport(CHANNEL_ID)
+            assert network_manager.udp_voice is not None
+
+            # 中继开启了回送：经UDP收到的帧通过保留引用的任务投递
+            for _ in range(5):
+                network_manager.queue_voice_event('voice_data_stream', {
+                    'channel_id': CHANNEL_ID, 'audio_data': np.zeros((960, 1), dtype=np.float32),
+                    'samplerate': 48000, 'rms': 0.0
+                })
+            await asyncio.sleep(0.2)
+            assert len(received) == 5
+            assert not network_manager._background_tasks
+
+            # 中继消失（UDP被阻断）
+            relay_transport.close()
+            blocked_at = time.monotonic()
+            while not switches and time.monotonic() - blocked_at < 10:
+                await asyncio.sleep(0.05)
+            return blocked_at, switches, network_manager.udp_voice
+        finally:
+            await network_manager.disconnect_voice_transport()
+            await network_manager.disconnect_socketio()
+            await network_manager.close_http_session()
+            await asyncio.wait_for(server.stop(), 5)
+
+    blocked_at, switches, udp_voice = asyncio.run(main())
+
+    assert udp_voice is None
+    assert len(switches) == 1
+    switched_at, data = switches[0]
+    assert data['channel_id'] == CHANNEL_ID and data['transport'] == 'websocket'
+    assert switched_at - blocked_at <= UdpVoiceTransport.FAILURE_TIMEOUT_SECONDS + UdpVoiceTransport.PROBE_INTERVAL_SECONDS + 0.5
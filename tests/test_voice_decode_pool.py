@@ -0,0 +1,141 @@
+import random
+import threading
+import time
+
+import numpy as np
+
+from audio_ring_buffer import AudioRingBuffer
+from voice_decode_pool import VoiceDecodePool
+
+FRAME_SAMPLES = 32
+SAMPLERATE = 48000
+
+
+def _frame(sequence):
+    return [float(sequence)] * FRAME_SAMPLES
+
+
+def _decode(audio_chunk_list, samplerate, volume, scratch):
+    time.sleep(random.uniform(0, 0.002))  # 让不同发送者的解码在工作线程中交错
+    return np.asarray(audio_chunk_list, dtype=np.float32) * volume
+
+
+def _decode_batch(chunk_lists, samplerate, volume):
+    return np.concatenate([np.asarray(chunk, dtype=np.float32) for chunk in chunk_lists]) * volume
+
+
+def _ring_frames(sink):
+    """按写入顺序读出环形缓冲区中每帧的序号"""
+    out = np.zeros(sink.available(), dtype=np.float32)
+    sink.read_into(out)
+    return [int(value) for value in out[::FRAME_SAMPLES]]
+
+
+def _wait_idle(pool, submitted, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        stats = pool.get_stats()
+        done = stats['decoded_frames'] + stats['dropped_frames'] + stats['late_dropped_frames']
+        if stats['pending_frames'] == 0 and done == submitted:
+            return stats
+        assert time.monotonic() < deadline, stats
+        time.sleep(0.005)
+
+
+def test_frames_of_each_sender_stay_in_order_across_workers():
+    random.seed(7)
+    pool = VoiceDecodePool(_decode, _decode_batch, SAMPLERATE, max_workers=4)
+    senders = ['a', 'b', 'c']
+    sinks = {sender: AudioRingBuffer(FRAME_SAMPLES * 200) for sender in senders}
+    frames_per_sender = 60
+    try:
+        for sequence in range(1, frames_per_sender + 1):
+            for sender in senders:
+                pool.submit(sender, sinks[sender], _frame(sequence), SAMPLERATE)
+            if sequence % 10 == 0:
+                time.sleep(0.002)
+        stats = _wait_idle(pool, frames_per_sender * len(senders))
+    finally:
+        pool.shutdown()
+
+    written_frames = 0
+    for sender in senders:
+        written = _ring_frames(sinks[sender])
+        assert written == sorted(set(written))          # 严格递增：没有乱序，也没有重复
+        assert written[-1] == frames_per_sender         # 最新的帧总会被解码
+        written_frames += len(written)
+    # 每一帧要么写入了缓冲区，要么计入了丢弃数
+    assert written_frames == stats['decoded_frames']
+    assert written_frames + stats['dropped_frames'] + stats['late_dropped_frames'] == frames_per_sender * len(senders)
+    assert stats['decode_errors'] == 0
+
+
+def _blocked_pool(sink_capacity_frames):
+    """第一帧解码时阻塞工作线程，让后面的帧积压"""
+    release = threading.Event()
+    started = threading.Event()
+    batches = []
+
+    def decode(audio_chunk_list, samplerate, volume, scratch):
+        started.set()
+        release.wait(5)
+        return np.asarray(audio_chunk_list, dtype=np.float32)
+
+    def decode_batch(chunk_lists, samplerate, volume):
+        batches.append([int(chunk[0]) for chunk in chunk_lists])
+        return _decode_batch(chunk_lists, samplerate, volume)
+
+    pool = VoiceDecodePool(decode, decode_batch, SAMPLERATE, max_workers=2)
+    sink = AudioRingBuffer(FRAME_SAMPLES * sink_capacity_frames)
+    pool.submit('a', sink, _frame(0), SAMPLERATE)
+    assert started.wait(5)
+    return pool, sink, release, batches
+
+
+def test_backlog_is_decoded_as_one_batch():
+    pool, sink, release, batches = _blocked_pool(sink_capacity_frames=50)
+    try:
+        for sequence in range(1, 6):
+            pool.submit('a', sink, _frame(sequence), SAMPLERATE)
+        release.set()
+        stats = _wait_idle(pool, 6)
+    finally:
+        pool.shutdown()
+
+    assert batches == [[1, 2, 3, 4, 5]]
+    assert (stats['batches'], stats['max_batch_frames'], stats['late_dropped_frames']) == (1, 5, 0)
+    assert _ring_frames(sink) == [0, 1, 2, 3, 4, 5]
+
+
+def test_late_frames_that_do_not_fit_the_ring_are_dropped_before_decoding():
+    # 环形缓冲区放得下3帧：第一帧写入后只剩2帧空间，积压的5帧中最旧的3帧迟到被丢弃
+    pool, sink, release, batches = _blocked_pool(sink_capacity_frames=3)
+    try:
+        for sequence in range(1, 6):
+            pool.submit('a', sink, _frame(sequence), SAMPLERATE)
+        release.set()
+        stats = _wait_idle(pool, 6)
+    finally:
+        pool.shutdown()
+
+    assert batches == [[4, 5]]
+    assert stats['late_dropped_frames'] == 3
+    assert stats['max_batch_frames'] == 5
+    assert _ring_frames(sink) == [0, 4, 5]
+    assert sink.dropped_samples == 0
+
+
+def test_backlog_beyond_max_pending_drops_the_oldest_frames():
+    pool, sink, release, batches = _blocked_pool(sink_capacity_frames=50)
+    extra = VoiceDecodePool.MAX_PENDING_FRAMES + 3
+    try:
+        for sequence in range(1, extra + 1):
+            pool.submit('a', sink, _frame(sequence), SAMPLERATE)
+        release.set()
+        stats = _wait_idle(pool, extra + 1)
+    finally:
+        pool.shutdown()
+
+    assert stats['dropped_frames'] == 3
+    assert batches == [list(range(4, extra + 1))]
+    assert _ring_frames(sink) == [0] + list(range(4, extra + 1))
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip("socketio")
+pytest.importorskip("aiohttp")
+audio_manager_module = pytest.importorskip("audio_manager")
+AudioManager = audio_manager_module.AudioManager
+from network_manager import NetworkManager
+from voice_echo_server import VoiceEchoServer
+
+ECHO_TEST_SECONDS = 0.6
+CALIBRATED_BLOCK_MS = 10
+
+
+async def _run_echo_test_against(server: VoiceEchoServer, tmp_path, manager: AudioManager):
+    """经真实的Socket.IO语音发送路径对本地回声服务器做回声测试，返回报告"""
+    host, port = await server.start('127.0.0.1', 0)
+    network_manager = NetworkManager(str(tmp_path / "config.json"))
+    network_manager.get_sio_url = lambda: f"http://{host}:{port}"
+    manager.set_page_loop(asyncio.get_running_loop())
+
+    async def send_echo_audio_data(audio_data, slot, sequence, client_time):
+        # 与main.py中的发送回调相同
+        try:
+            network_manager.queue_voice_event('voice_echo', {
+                'sequence': sequence,
+                'client_time': client_time,
+                'audio_data': audio_data.tolist(),
+                'samplerate': manager.STANDARD_SAMPLERATE,
+                'channels': manager.STANDARD_CHANNELS,
+                'dtype': 'float32'
+            })
+        finally:
+            manager.release_send_block(audio_data, slot)
+
+    manager.set_callback('send_echo_audio_data', send_echo_audio_data)
+    network_manager.set_callback('on_voice_echo_reply', manager.handle_echo_reply)
+
+    # 模拟设备回调线程：每20ms交给采集回调一块音频
+    frames = manager.STANDARD_BLOCKSIZE
+    indata = np.full((frames, 1), 0.1, dtype=np.float32)
+    stop_capture = threading.Event()
+
+    def capture_thread():
+        while not stop_capture.wait(frames / manager.STANDARD_SAMPLERATE):
+            if manager.echo_test is not None:
+                manager.audio_stream_callback(indata, frames, None, None)
+
+    try:
+        assert await network_manager.connect_socketio()
+        thread = threading.Thread(target=capture_thread, daemon=True)
+        thread.start()
+        try:
+            return await manager.run_echo_test(object(), duration=ECHO_TEST_SECONDS)
+        finally:
+            stop_capture.set()
+            thread.join(timeout=1.0)
+    finally:
+        await network_manager.disconnect_socketio()
+        await network_manager.close_http_session()
+        await manager.shutdown()
+        await server.stop()
+
+
+@pytest.fixture
+def echo_manager(fake_sd, monkeypatch):
+    # 模拟流不会触发回调，关掉健康检查以免被当成停滞的流自动恢复
+    monkeypatch.setattr(AudioManager, "HEALTH_CHECK_INTERVAL_SECONDS", 3600)
+    monkeypatch.setattr(AudioManager, "ECHO_TEST_REPLY_GRACE_SECONDS", 0.3)
+    manager = AudioManager()
+    manager.selected_input_device_id = 0
+    manager.selected_output_device_id = 1
+    return manager
+
+
+def test_echo_test_round_trips_through_local_echo_server(echo_manager, tmp_path):
+    manager = echo_manager
+    # 延迟校准把播放块改成了10ms，报告应按当前播放流的块大小计算
+    manager.latency_profiles[manager._latency_profile_key(0, 1)] = {'block_ms': CALIBRATED_BLOCK_MS, 'latency': 'low'}
+    server = VoiceEchoServer()
+
+    report = asyncio.run(_run_echo_test_against(server, tmp_path, manager))
+
+    assert report is not None
+    assert report['sent'] > 10
+    assert report['received'] == report['sent'] == server.echoed_frames
+    assert report['loss'] == 0
+    assert report['rtt_p50_ms'] is not None
+    assert report['verdict'] == 'ok'
+    # 两个模拟流各报告10ms设备延迟，播放缓冲按校准后的10ms块计算
+    assert report['mouth_to_ear_ms'] == pytest.approx(20 + CALIBRATED_BLOCK_MS + report['rtt_p50_ms'] / 2, abs=0.2)
+
+
+def test_echo_test_reports_network_loss(echo_manager, tmp_path):
+    server = VoiceEchoServer(loss=0.5)
+
+    report = asyncio.run(_run_echo_test_against(server, tmp_path, echo_manager))
+
+    assert report['received'] < report['sent']
+    assert report['loss'] > 0.05
+    assert report['verdict'] == 'network'
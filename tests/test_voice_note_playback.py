@@ -0,0 +1,71 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+audio_manager_module = pytest.importorskip("audio_manager")
+AudioManager = audio_manager_module.AudioManager
+from message_manager import MessageManager
+from voice_notes import VoiceNoteCodec
+
+CHUNKS = 10
+CHUNK_SECONDS = 0.5  # 10个分块共5秒，远超播放缓冲区容量
+
+
+class FakeNetworkManager:
+    def __init__(self):
+        self.streamed_chunks = 0
+
+    async def stream_voice_note(self, note_id):
+        chunk = VoiceNoteCodec.encode(np.full(int(VoiceNoteCodec.SAMPLERATE * CHUNK_SECONDS), 0.1, dtype=np.float32))
+        for _ in range(CHUNKS):
+            self.streamed_chunks += 1
+            yield chunk
+
+
+@pytest.fixture
+def playback_env(fake_sd, monkeypatch):
+    monkeypatch.setattr(AudioManager, "HEALTH_CHECK_INTERVAL_SECONDS", 3600)
+    manager = AudioManager()
+    messages = MessageManager()
+    errors = []
+    messages.set_callback('on_voice_note_playback_error', lambda note_id, message: errors.append((note_id, message)))
+    return manager, messages, FakeNetworkManager(), errors
+
+
+def test_voice_note_reports_when_playback_device_cannot_open(playback_env, fake_sd):
+    manager, messages, network, errors = playback_env
+
+    def broken_output_stream(**kwargs):
+        raise RuntimeError("device unavailable")
+
+    fake_sd.OutputStream = broken_output_stream
+
+    async def main():
+        await messages.play_voice_note(network, manager, object(), "note-1")
+        await manager.shutdown()
+
+    asyncio.run(main())
+
+    assert [note_id for note_id, _ in errors] == ["note-1"]
+    assert network.streamed_chunks == 0
+    assert manager.audio_output_buffer.available() == 0
+    assert messages.playing_voice_note_id is None
+
+
+def test_voice_note_stops_when_playback_stops_midway(playback_env):
+    """播放流中途停止时不再继续下载并填满缓冲区，而是报告中断"""
+    manager, messages, network, errors = playback_env
+
+    async def main():
+        playback = asyncio.create_task(messages.play_voice_note(network, manager, object(), "note-2"))
+        while manager.audio_output_buffer.free_space() > 0:
+            await asyncio.sleep(0.01)
+        await manager.stop_audio_playback_stream_if_running()
+        await asyncio.wait_for(playback, timeout=2.0)
+        await manager.shutdown()
+
+    asyncio.run(main())
+
+    assert [note_id for note_id, _ in errors] == ["note-2"]
+    assert network.streamed_chunks < CHUNKS
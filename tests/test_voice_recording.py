@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+audio_manager_module = pytest.importorskip("audio_manager")
+AudioManager = audio_manager_module.AudioManager
+from voice_recorder import VoiceRecorder
+
+
+def test_recording_taps_only_the_mic_blocks_that_are_sent():
+    """按键未按下、VAD判定未说话或静音时不录麦克风，用静音占位保持与远端混音对齐"""
+    manager = AudioManager()
+    manager.is_voice_routing_active = True
+    manager.voice_recorder = recorder = VoiceRecorder("unused.wav", manager.STANDARD_SAMPLERATE, include_mic=True)
+    frames = manager.STANDARD_BLOCKSIZE
+    quiet = np.full((frames, 1), 0.001, dtype=np.float32)  # 低于VAD阈值，不发送
+    loud = np.full((frames, 1), 0.3, dtype=np.float32)
+
+    manager.audio_stream_callback(quiet, frames, None, None)
+    manager.audio_stream_callback(loud, frames, None, None)
+    manager.is_logically_muted = True
+    manager.audio_stream_callback(loud, frames, None, None)
+    manager.is_logically_muted = False
+    manager.voice_input_mode = manager.VOICE_MODE_PUSH_TO_TALK
+    manager.audio_stream_callback(loud, frames, None, None)  # 按键未按下
+    manager.voice_decode_pool.shutdown()
+
+    recorded = np.zeros(recorder.capture_ring.available(), dtype=np.float32)
+    recorder.capture_ring.read_into(recorded)
+    assert len(recorded) == 4 * frames
+    assert np.all(recorded[:frames] == 0)
+    assert np.allclose(recorded[frames:2 * frames], 0.3)
+    assert np.all(recorded[2 * frames:] == 0)